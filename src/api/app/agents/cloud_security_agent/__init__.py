@@ -1,3 +1,13 @@
-from .main import create_cloud_security_agent
+from .main import (create_cloud_security_agent, files_directory,
+                   get_cloud_security_agent_definition,
+                   get_knowledge_base_hash, get_knowledge_base_vector_store_id,
+                   sync_knowledge_base)
 
-__all__ = ["create_cloud_security_agent"]
+__all__ = [
+    "create_cloud_security_agent",
+    "files_directory",
+    "get_cloud_security_agent_definition",
+    "get_knowledge_base_hash",
+    "get_knowledge_base_vector_store_id",
+    "sync_knowledge_base",
+]
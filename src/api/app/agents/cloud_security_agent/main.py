@@ -1,8 +1,13 @@
+import asyncio
+import hashlib
 import logging
 import os
+from functools import lru_cache
 
-from azure.ai.agents.models import (BingCustomSearchTool, CodeInterpreterTool,
-                                    FilePurpose, FileSearchTool, ToolSet)
+from azure.ai.agents.models import (Agent, BingCustomSearchTool,
+                                    CodeInterpreterTool, FileSearchTool,
+                                    ToolSet)
+from azure.core.exceptions import ResourceNotFoundError
 from semantic_kernel import Kernel
 from semantic_kernel.agents.azure_ai.azure_ai_agent import AzureAIAgent
 from semantic_kernel.connectors.ai.prompt_execution_settings import \
@@ -10,96 +15,217 @@ from semantic_kernel.connectors.ai.prompt_execution_settings import \
 from semantic_kernel.functions import KernelArguments
 
 from app.config import get_settings
-from app.services.dependencies import AIProjectClient
+from app.services.dependencies import AIProjectClient, get_client_endpoint
+from app.services.knowledge_base import (KnowledgeBaseSyncResult,
+                                         get_create_knowledge_base_sync)
+from app.services.startup_state import get_create_startup_state
 
 logger = logging.getLogger("uvicorn.error")
 
+files_directory = f"{os.path.dirname(os.path.abspath(__file__))}/files"
+vector_store_name = "cloud-security-documentation"
+
+_vector_store_locks: dict[str, asyncio.Lock] = {}
+
+
+@lru_cache
+def get_knowledge_base_hash() -> str:
+    # Identifies the documentation the agent's vector store is built from
+    digest = hashlib.sha256()
+    for file in sorted(os.listdir(files_directory)):
+        digest.update(file.encode("utf-8"))
+        with open(os.path.join(files_directory, file), "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
 
-async def setup_file_search_tool(client: AIProjectClient) -> FileSearchTool:
-    file_search_tool = None
 
+async def get_knowledge_base_vector_store_id(client: AIProjectClient, agent: Agent | None = None) -> str:
+    """Returns the vector store of ``agent``, or the project's documentation vector store if it has none."""
+    if agent is not None and agent.tool_resources is not None and agent.tool_resources.file_search is not None \
+            and agent.tool_resources.file_search.vector_store_ids:
+        return agent.tool_resources.file_search.vector_store_ids[0]
+
+    endpoint = get_client_endpoint(client)
+    startup_state = get_create_startup_state()
+
+    # Agents set up concurrently in the same project would each create a vector store
+    async with _vector_store_locks.setdefault(endpoint, asyncio.Lock()):
+        vector_store_id = await startup_state.get(endpoint, "vector_store", vector_store_name)
+        if vector_store_id is not None:
+            try:
+                return (await client.agents.vector_stores.get(vector_store_id)).id
+            except ResourceNotFoundError:
+                await startup_state.invalidate(endpoint, "vector_store", vector_store_name)
+
+        async for vector_store in client.agents.vector_stores.list():
+            if vector_store.name == vector_store_name:
+                logger.info(f"Found existing vector store: {vector_store.id}")
+                break
+        else:
+            vector_store = await client.agents.vector_stores.create(name=vector_store_name)
+            logger.info(f"Created vector store: {vector_store.id}")
+
+        await startup_state.put(endpoint, "vector_store", vector_store_name, vector_store.id)
+        return vector_store.id
+
+
+async def sync_knowledge_base(client: AIProjectClient,
+                              vector_store_id: str,
+                              dry_run: bool = False) -> KnowledgeBaseSyncResult:
+    result = await get_create_knowledge_base_sync().sync(client=client,
+                                                         vector_store_id=vector_store_id,
+                                                         directory=files_directory,
+                                                         dry_run=dry_run)
+    if not dry_run and (result.uploaded or result.deleted):
+        get_knowledge_base_hash.cache_clear()
+    return result
+
+
+async def setup_file_search_tool(client: AIProjectClient) -> FileSearchTool:
     try:
-        files = []
-        # upload documentation files to Agent storage
-        for file in os.listdir(f"{os.path.dirname(os.path.abspath(__file__))}/files"):
-            file_path = os.path.join(f"{os.path.dirname(os.path.abspath(__file__))}/files", file)
-            with open(file_path, "rb"):
-                file = await client.agents.files.upload(
-                    file_path=file_path,
-                    purpose=FilePurpose.AGENTS
-                )
-                logger.info(f"Uploaded {file} to Agent storage.")
-                files.append(file.id)
-
-        # create vector store
-        vector_store = await client.agents.vector_stores.create(
-            file_ids=files,
-            name="cloud-security-documentation"
-        )
+        # Reuses the documentation already in the project, only uploading what changed
+        vector_store_id = await get_knowledge_base_vector_store_id(client)
+        await sync_knowledge_base(client, vector_store_id)
     except Exception as e:
         logger.error(f"Error uploading files: {e}")
         raise
 
     # create file search tool
     file_search_tool = FileSearchTool(
-        vector_store_ids=[vector_store.id],
+        vector_store_ids=[vector_store_id],
     )
 
     return file_search_tool
 
 
-async def create_cloud_security_agent(client: AIProjectClient, kernel: Kernel) -> AzureAIAgent:
-    azure_ai_agent = None
+def get_cloud_security_agent_name(deployment_name: str) -> str:
+    # Agents on other deployments of the same project need names of their own
+    if deployment_name == get_settings().azure_openai_model_deployment_name:
+        return "cloud-security-agent"
+    return f"cloud-security-agent-{deployment_name}"
+
+
+async def find_cloud_security_agent(client: AIProjectClient, agent_name: str) -> Agent | None:
+    endpoint = get_client_endpoint(client)
+    startup_state = get_create_startup_state()
+
+    # Fetching the agent by the id resolved on a previous start saves scanning every agent of the project
+    agent_id = await startup_state.get(endpoint, "agent", agent_name)
+    if agent_id is not None:
+        try:
+            agent = await client.agents.get_agent(agent_id)
+            if agent.name == agent_name:
+                logger.info(f"Found existing {agent_name} from the startup state: {agent.id}")
+                return agent
+        except ResourceNotFoundError:
+            pass
+        await startup_state.invalidate(endpoint, "agent", agent_name)
 
     async for agent in client.agents.list_agents():
-        if agent.name == "cloud-security-agent":
-            logger.info(f"Found existing cloud-security-agent: {agent.id}")
-            agent = await client.agents.get_agent(agent.id)
-            azure_ai_agent = AzureAIAgent(
-                client=client,
-                definition=agent,
-                kernel=kernel
-            )
-            break
-
-    if not azure_ai_agent:
-        code_interpreter = CodeInterpreterTool()
-
-        file_search_tool = await setup_file_search_tool(client)
-
-        toolset = ToolSet()
-        async for connection in client.connections.list():
-            if connection.name == get_settings().bing_connection_name:
-                logger.info(f"Found existing Bing connection: {connection.id}")
-                # bing_grounding_tool = BingGroundingTool(connection_id=connection.id)
-                bing_custom_tool = BingCustomSearchTool(
-                    connection_id=connection.id,
-                    instance_name=get_settings().bing_instance_name,
-                    count=50,
-                    market="en-US",
-                    set_lang="en"
-                )
-                toolset.add(bing_custom_tool)
-                break
+        if agent.name == agent_name:
+            logger.info(f"Found existing {agent_name}: {agent.id}")
+            await startup_state.put(endpoint, "agent", agent_name, agent.id)
+            return await client.agents.get_agent(agent.id)
 
-        toolset.add(code_interpreter)
-        toolset.add(file_search_tool)
+    return None
 
-        agent_definition = await client.agents.create_agent(
-            model=get_settings().azure_openai_model_deployment_name,
-            name="cloud-security-agent",
-            instructions="""
-            You are a helpful assistant that can help onboard new cloud services. You will make security recommendations on how to secure cloud resources. You also help write Terraform code to deploy cloud resources securely. You can also search for relevant documentation and provide it to the user. You also write Azure Policy to enforce security best practices.
-            """,
-            toolset=toolset,
-        )
 
-        azure_ai_agent = AzureAIAgent(
-            client=client,
-            definition=agent_definition,
-            kernel=kernel
+async def get_bing_connection_id(client: AIProjectClient) -> str | None:
+    endpoint = get_client_endpoint(client)
+    connection_name = get_settings().bing_connection_name
+
+    # Connection ids are derived from the project and the connection name, so they can't go stale
+    connection_id = await get_create_startup_state().get(endpoint, "connection", connection_name)
+    if connection_id is not None:
+        return connection_id
+
+    try:
+        connection = await client.connections.get(connection_name)
+    except ResourceNotFoundError:
+        logger.warning(f"Bing connection {connection_name} not found")
+        return None
+
+    logger.info(f"Found existing Bing connection: {connection.id}")
+    await get_create_startup_state().put(endpoint, "connection", connection_name, connection.id)
+    return connection.id
+
+
+async def get_cloud_security_agent_definition(client: AIProjectClient, deployment_name: str | None = None) -> Agent:
+    deployment_name = deployment_name or get_settings().azure_openai_model_deployment_name
+    agent_name = get_cloud_security_agent_name(deployment_name)
+    endpoint = get_client_endpoint(client)
+    startup_state = get_create_startup_state()
+
+    # Resolved moments ago, usually by the preloading master for its workers, which then neither
+    # look the agent up nor sync its knowledge base again
+    definition = await startup_state.get_agent_definition(
+        endpoint, agent_name, max_age_seconds=get_settings().startup_state_definition_max_age_seconds)
+    if definition is not None:
+        logger.info(f"Using {agent_name} resolved at startup: {definition['id']}")
+        return Agent(definition)
+
+    agent = await find_cloud_security_agent(client, agent_name)
+    if agent is not None:
+        if get_settings().knowledge_base_sync_on_startup:
+            try:
+                await sync_knowledge_base(client, await get_knowledge_base_vector_store_id(client, agent))
+            except Exception as e:
+                # The agent can still answer from the documentation it already has
+                logger.error(f"Error syncing the knowledge base of {agent_name}: {e}")
+        await startup_state.put_agent_definition(endpoint, agent_name, agent.as_dict())
+        return agent
+
+    code_interpreter = CodeInterpreterTool()
+
+    file_search_tool, bing_connection_id = await asyncio.gather(
+        setup_file_search_tool(client),
+        get_bing_connection_id(client),
+    )
+
+    toolset = ToolSet()
+    if bing_connection_id is not None:
+        # bing_grounding_tool = BingGroundingTool(connection_id=connection.id)
+        bing_custom_tool = BingCustomSearchTool(
+            connection_id=bing_connection_id,
+            instance_name=get_settings().bing_instance_name,
+            count=50,
+            market="en-US",
+            set_lang="en"
         )
+        toolset.add(bing_custom_tool)
+
+    toolset.add(code_interpreter)
+    toolset.add(file_search_tool)
+
+    agent = await client.agents.create_agent(
+        model=deployment_name,
+        name=agent_name,
+        instructions="""
+        You are a helpful assistant that can help onboard new cloud services. You will make security recommendations on how to secure cloud resources. You also help write Terraform code to deploy cloud resources securely. You can also search for relevant documentation and provide it to the user. You also write Azure Policy to enforce security best practices.
+        """,
+        toolset=toolset,
+    )
+    await startup_state.put(endpoint, "agent", agent_name, agent.id)
+    await startup_state.put_agent_definition(endpoint, agent_name, agent.as_dict())
+
+    return agent
+
+
+async def create_cloud_security_agent(client: AIProjectClient,
+                                      kernel: Kernel,
+                                      deployment_name: str | None = None) -> AzureAIAgent:
+    return AzureAIAgent(
+        client=client,
+        definition=await get_cloud_security_agent_definition(client, deployment_name),
+        kernel=kernel
+    )
 
-    return azure_ai_agent
 
-__all__ = ["create_cloud_security_agent"]
+__all__ = [
+    "create_cloud_security_agent",
+    "files_directory",
+    "get_cloud_security_agent_definition",
+    "get_knowledge_base_hash",
+    "get_knowledge_base_vector_store_id",
+    "sync_knowledge_base",
+]
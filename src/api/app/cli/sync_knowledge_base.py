@@ -0,0 +1,44 @@
+"""Syncs the agent documentation in ``app/agents/cloud_security_agent/files``
+to the vector store of the cloud security agent.
+
+Only new or changed files are uploaded, and removed files are deleted from
+the store. Run from ``src/api`` with the usual ``.env``::
+
+    python -m app.cli.sync_knowledge_base --dry-run
+"""
+import argparse
+import asyncio
+import json
+
+from app.agents.cloud_security_agent import (get_knowledge_base_vector_store_id,
+                                             sync_knowledge_base)
+from app.agents.cloud_security_agent.main import get_cloud_security_agent_name
+from app.config import get_settings
+from app.services.dependencies import create_azure_ai_client
+
+
+async def main(args: argparse.Namespace):
+    deployment_name = args.deployment_name or get_settings().azure_openai_model_deployment_name
+    agent_name = get_cloud_security_agent_name(deployment_name)
+
+    async with create_azure_ai_client(args.endpoint) as client:
+        agent = None
+        async for candidate in client.agents.list_agents():
+            if candidate.name == agent_name:
+                agent = await client.agents.get_agent(candidate.id)
+                break
+
+        vector_store_id = args.vector_store_id or await get_knowledge_base_vector_store_id(client, agent)
+        result = await sync_knowledge_base(client, vector_store_id, dry_run=args.dry_run)
+
+    print(json.dumps(result.model_dump(), indent=2))
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Syncs the agent documentation to its vector store")
+    parser.add_argument("--endpoint", help="AI project endpoint, AZURE_AI_AGENT_ENDPOINT if not set")
+    parser.add_argument("--deployment-name", help="Deployment of the agent whose vector store to sync")
+    parser.add_argument("--vector-store-id", help="Vector store to sync instead of the agent's")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be uploaded and deleted")
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,52 @@
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import (GZipMiddleware, GZipResponder,
+                                       IdentityResponder)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Event streams carry frames of a few bytes that must go out at once, and images are compressed already
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "image/")
+
+
+class _FlushingGZipResponder(GZipResponder):
+    async def send_with_compression(self, message: Message) -> None:
+        await super().send_with_compression(message)
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            self.content_type_is_excluded = content_type.startswith(EXCLUDED_CONTENT_TYPES)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        self.gzip_file.write(body)
+        if more_body:
+            self.gzip_file.flush()
+        else:
+            self.gzip_file.close()
+
+        body = self.gzip_buffer.getvalue()
+        self.gzip_buffer.seek(0)
+        self.gzip_buffer.truncate()
+        return body
+
+
+class FlushingGZipMiddleware(GZipMiddleware):
+    """Compresses responses for clients that accept gzip, sending each chunk of a stream as it comes.
+
+    Starlette's responder only sends what the compressor has handed back,
+    which for a stream of short NDJSON lines is nothing until it has filled
+    a block. This one flushes the compressor after every chunk instead.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        responder: ASGIApp
+        if "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            responder = _FlushingGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+
+        await responder(scope, receive, send)
+
+
+__all__ = ["FlushingGZipMiddleware"]
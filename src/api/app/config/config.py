@@ -1,8 +1,15 @@
 from functools import lru_cache
 
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class AgentPoolMemberSettings(BaseModel):
+    deployment_name: str
+    endpoint: str | None = None  # AI project endpoint, azure_ai_agent_endpoint if not set
+    weight: int = Field(default=1, ge=1)
+
+
 class Settings(BaseSettings):
     azure_openai_model_deployment_name: str
     azure_ai_agent_endpoint: str
@@ -10,6 +17,69 @@ class Settings(BaseSettings):
     application_insights_connection_string: str
     bing_connection_name: str
     bing_instance_name: str
+    stream_coalesce_max_delay_ms: int = 50
+    stream_coalesce_max_bytes: int = 4096
+    stream_channel_high_water_mark: int = 256
+    stream_channel_text_policy: str = "merge"
+    stream_channel_merge_max_bytes: int = 65536  # Text merged into one buffered frame before the run blocks
+    stream_replay_max_bytes: int = 4194304  # Frames of a run kept to replay to joining clients
+    run_disconnect_grace_seconds: float = 30
+    scheduler_max_concurrent_runs: int = 4
+    scheduler_max_queued_runs: int = 16
+    scheduler_retry_after_seconds: int = 60
+    single_flight_enabled: bool = True
+    result_cache_enabled: bool = True
+    result_cache_path: str = ".cache/result_cache.sqlite3"
+    result_cache_ttl_seconds: int = 604800
+    result_cache_max_bytes: int = 268435456
+    result_cache_replay_delay_ms: int = 0
+    step_cache_enabled: bool = True
+    step_cache_path: str = ".cache/step_cache.sqlite3"
+    step_cache_ttl_seconds: int = 604800
+    pipelined_steps_enabled: bool = False
+    batch_max_parallelism: int = 4
+    batch_max_services: int = 50
+    message_store_path: str = ".cache/message_store.sqlite3"
+    message_store_max_threads: int = 1024
+    get_thread_default_limit: int = 20
+    get_thread_max_limit: int = 100
+    image_cache_enabled: bool = True
+    image_cache_path: str = ".cache/images"
+    image_cache_max_bytes: int = 268435456
+    image_cache_max_age_seconds: int = 86400
+    health_check_interval_seconds: float = 30
+    health_check_timeout_seconds: float = 10
+    agent_step_deadline_seconds: float = 600
+    agent_ttft_timeout_seconds: float = 90
+    agent_max_attempts: int = 3
+    agent_retry_base_delay_seconds: float = 1
+    agent_retry_max_delay_seconds: float = 20
+    agent_retry_budget_ratio: float = 0.2
+    agent_retry_budget_max_tokens: float = 10
+    agent_circuit_failure_threshold: int = 5
+    agent_circuit_reset_timeout_seconds: float = 30
+    agent_max_resumes: int = 1
+    # JSON list of deployments to register the agents on, only the default deployment if empty
+    agent_pool_members: list[AgentPoolMemberSettings] = []
+    agent_pool_strategy: str = "least_outstanding_tokens"  # Or weighted_round_robin
+    agent_pool_default_cooldown_seconds: float = 30
+    agent_pool_estimated_completion_tokens: int = 2000
+    agent_hedging_enabled: bool = False
+    agent_hedge_percentile: float = 0.95
+    agent_hedge_window_size: int = 200
+    agent_hedge_min_samples: int = 20
+    agent_hedge_default_delay_seconds: float = 30
+    agent_hedge_min_delay_seconds: float = 5
+    agent_hedge_seed_max_messages: int = 32
+    knowledge_base_manifest_path: str = ".cache/knowledge_base.sqlite3"
+    knowledge_base_sync_max_concurrency: int = 4
+    knowledge_base_sync_on_startup: bool = True
+    startup_state_path: str = ".cache/startup_state.sqlite3"
+    startup_state_definition_max_age_seconds: float = 300
+    warm_up_retry_delay_seconds: float = 10
+    api_workers: int = 1  # Worker processes of python -m app.server
+    gzip_minimum_size: int = 1024  # Responses smaller than this are sent uncompressed
+    gzip_compress_level: int = 6
 
     model_config = SettingsConfigDict(env_file=".env",
                                       env_file_encoding="utf-8")
@@ -20,4 +90,4 @@ def get_settings():
     return Settings()  # type: ignore
 
 
-__all__ = ["get_settings"]
+__all__ = ["AgentPoolMemberSettings", "get_settings"]
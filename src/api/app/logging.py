@@ -1,9 +1,5 @@
 import logging
 
-from azure.monitor.opentelemetry.exporter import (AzureMonitorLogExporter,
-                                                  AzureMonitorMetricExporter,
-                                                  AzureMonitorTraceExporter)
-from azure.monitor.opentelemetry import configure_azure_monitor
 from opentelemetry._logs import set_logger_provider
 from opentelemetry.metrics import set_meter_provider
 from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
@@ -26,7 +22,14 @@ connection_string = get_settings().application_insights_connection_string
 resource = Resource.create({ResourceAttributes.SERVICE_NAME: "cloud-service-onboarding-agent"})
 
 
+# The Azure Monitor exporters are imported by the set-up functions, which run in the
+# lifespan of each worker rather than when the app is loaded
+
+
 def set_up_logging():
+    from azure.monitor.opentelemetry import configure_azure_monitor
+    from azure.monitor.opentelemetry.exporter import AzureMonitorLogExporter
+
     configure_azure_monitor(
         connection_string=connection_string,
     )
@@ -53,6 +56,8 @@ def set_up_logging():
 
 
 def set_up_tracing():
+    from azure.monitor.opentelemetry.exporter import AzureMonitorTraceExporter
+
     exporter = AzureMonitorTraceExporter(connection_string=connection_string)
 
     # Initialize a trace provider for the application. This is a factory for creating tracers.
@@ -65,6 +70,8 @@ def set_up_tracing():
 
 
 def set_up_metrics():
+    from azure.monitor.opentelemetry.exporter import AzureMonitorMetricExporter
+
     exporter = AzureMonitorMetricExporter(connection_string=connection_string)
 
     # Initialize a metric provider for the application. This is a factory for creating meters.
@@ -73,14 +80,14 @@ def set_up_metrics():
         resource=resource,
         views=[
             # Dropping all instrument names except for those starting with "semantic_kernel"
+            # or "cloud_service_onboarding"
             View(instrument_name="*", aggregation=DropAggregation()),
             View(instrument_name="semantic_kernel*"),
+            View(instrument_name="cloud_service_onboarding*"),
         ],
     )
     # Sets the global default meter provider
     set_meter_provider(meter_provider)
 
 
-# This must be done before any other telemetry calls
-
 __all__ = ["set_up_logging", "set_up_tracing", "set_up_metrics"]
@@ -2,24 +2,39 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
-from app.routers import chat, liveness, readiness, startup
-from app.services.agents import setup_agents
+from app.compression import FlushingGZipMiddleware
+from app.config import get_settings
+from app.routers import admin, chat, liveness, onboard, readiness, startup
+from app.services.health import get_create_health_monitor
+from app.services.warm_up import get_create_warm_up
 
 from .logging import set_up_logging, set_up_metrics, set_up_tracing
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    await setup_agents()
+    # Set up in each worker, as the exporters' threads don't survive the fork of a preloading master.
+    # This must be done before any other telemetry calls.
+    set_up_logging()
+    set_up_tracing()
+    set_up_metrics()
+
+    # Serve probes while warming up, readiness reports 503 until it's done
+    warm_up = get_create_warm_up()
+    warm_up.start()
     yield
-
-set_up_logging()
-set_up_tracing()
-set_up_metrics()
+    await warm_up.stop()
+    await get_create_health_monitor().stop()
 
 app = FastAPI(lifespan=lifespan, debug=True)
 
+app.add_middleware(FlushingGZipMiddleware,
+                   minimum_size=get_settings().gzip_minimum_size,
+                   compresslevel=get_settings().gzip_compress_level)
+
+app.include_router(admin.router, prefix="/v1")
 app.include_router(chat.router, prefix="/v1")
 app.include_router(liveness.router, prefix="/v1")
+app.include_router(onboard.router, prefix="/v1")
 app.include_router(readiness.router, prefix="/v1")
 app.include_router(startup.router, prefix="/v1")
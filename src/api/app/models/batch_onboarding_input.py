@@ -0,0 +1,9 @@
+from pydantic import BaseModel, Field
+
+
+class BatchOnboardingInput(BaseModel):
+    service_names: list[str] = Field(min_length=1)
+    max_parallelism: int | None = Field(default=None, ge=1)  # Capped by the batch_max_parallelism setting
+
+
+__all__ = ["BatchOnboardingInput"]
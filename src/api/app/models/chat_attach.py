@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+
+class ChatAttachInput(BaseModel):
+    thread_id: str
+
+
+__all__ = ["ChatAttachInput"]
@@ -1,4 +1,4 @@
-from semantic_kernel.kernel_pydantic import KernelBaseModel
+from app.models.kernel_base_model import KernelBaseModel
 
 
 class ChatCreateThreadOutput(KernelBaseModel):
@@ -1,8 +1,17 @@
-from pydantic import BaseModel
+from typing import Literal
+
+from pydantic import BaseModel, Field
 
 
 class ChatGetThreadInput(BaseModel):
     thread_id: str
+    # At most 100 per page. Without a limit or cursor, the whole thread is returned as a list.
+    limit: int | None = Field(default=None, ge=1)
+    after: str | None = None  # Id of the message the page starts after
+    before: str | None = None  # Id of the message the page ends before
+    order: Literal["asc", "desc"] = "desc"
+    stream: bool = False  # Streams the messages as NDJSON instead of returning a page
+    refresh: bool = False  # Syncs with the agents service even if the stored messages are current
 
 
 __all__ = ["ChatGetThreadInput"]
@@ -0,0 +1,20 @@
+from typing import Any
+
+from pydantic import BaseModel
+
+
+class ThreadMessageOutput(BaseModel):
+    id: str
+    created_at: float
+    role: str
+    content: list[dict[str, Any]]
+
+
+class ChatGetThreadOutput(BaseModel):
+    data: list[ThreadMessageOutput]
+    first_id: str | None = None
+    last_id: str | None = None
+    has_more: bool = False
+
+
+__all__ = ["ChatGetThreadOutput", "ThreadMessageOutput"]
@@ -1,10 +1,11 @@
 from typing import Any
-from semantic_kernel.kernel_pydantic import KernelBaseModel
 
 from app.models.content_type_enum import ContentTypeEnum
+from app.models.kernel_base_model import KernelBaseModel
 
 class ChatOutput(KernelBaseModel):
     content_type: ContentTypeEnum
     thread_id: str
+    branch: str = ""  # Process branch the frame belongs to, empty outside of parallel steps
 
 __all__ = ["ChatOutput"]
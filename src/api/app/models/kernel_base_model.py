@@ -0,0 +1,10 @@
+from pydantic import BaseModel, ConfigDict
+
+
+class KernelBaseModel(BaseModel):
+    # Configured like Semantic Kernel's KernelBaseModel, which can't be imported without
+    # importing the whole of Semantic Kernel
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True, validate_assignment=True)
+
+
+__all__ = ["KernelBaseModel"]
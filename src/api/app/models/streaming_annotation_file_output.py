@@ -1,8 +1,8 @@
 from typing import Any, Optional
-from semantic_kernel.kernel_pydantic import KernelBaseModel
 
 from app.models.chat_output import ChatOutput
 from app.models.content_type_enum import ContentTypeEnum
+from app.models.wire import FRAME_PREFIXES, encode_string
 
 class StreamingAnnotationFileOutput(ChatOutput):
     start_index: int
@@ -17,6 +17,7 @@ def serialize_streaming_annotation_file_output(streaming_annotation_file_output:
         return {
             "content_type": streaming_annotation_file_output.content_type.value,
             "thread_id": streaming_annotation_file_output.thread_id,
+            "branch": streaming_annotation_file_output.branch,
             "start_index": streaming_annotation_file_output.start_index,
             "end_index": streaming_annotation_file_output.end_index,
             "file_id": streaming_annotation_file_output.file_id,
@@ -25,4 +26,12 @@ def serialize_streaming_annotation_file_output(streaming_annotation_file_output:
     raise TypeError
 
 
-__all__ = ["StreamingAnnotationFileOutput", "serialize_streaming_annotation_file_output"]
+def encode_streaming_annotation_file_output(streaming_annotation_file_output: StreamingAnnotationFileOutput) -> bytes:
+    output = streaming_annotation_file_output
+    return (f"{FRAME_PREFIXES[output.content_type]}{encode_string(output.thread_id)}"
+            f", \"branch\": {encode_string(output.branch)}"
+            f", \"start_index\": {output.start_index:d}, \"end_index\": {output.end_index:d}"
+            f", \"file_id\": {encode_string(output.file_id)}, \"quote\": {encode_string(output.quote)}}}\n").encode("ascii")
+
+__all__ = ["StreamingAnnotationFileOutput", "encode_streaming_annotation_file_output",
+           "serialize_streaming_annotation_file_output"]
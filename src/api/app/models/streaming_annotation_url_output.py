@@ -1,8 +1,8 @@
 from typing import Any
-from semantic_kernel.kernel_pydantic import KernelBaseModel
 
 from app.models.chat_output import ChatOutput
 from app.models.content_type_enum import ContentTypeEnum
+from app.models.wire import FRAME_PREFIXES, encode_string
 
 class StreamingAnnotationUrlOutput(ChatOutput):
     start_index: int
@@ -16,6 +16,7 @@ def serialize_streaming_annotation_url_output(streaming_annotation_url_output: S
         return {
             "content_type": streaming_annotation_url_output.content_type.value,
             "thread_id": streaming_annotation_url_output.thread_id,
+            "branch": streaming_annotation_url_output.branch,
             "start_index": streaming_annotation_url_output.start_index,
             "end_index": streaming_annotation_url_output.end_index,
             "url": streaming_annotation_url_output.url,
@@ -24,4 +25,12 @@ def serialize_streaming_annotation_url_output(streaming_annotation_url_output: S
     raise TypeError
 
 
-__all__ = ["StreamingAnnotationUrlOutput", "serialize_streaming_annotation_url_output"]
+def encode_streaming_annotation_url_output(streaming_annotation_url_output: StreamingAnnotationUrlOutput) -> bytes:
+    output = streaming_annotation_url_output
+    return (f"{FRAME_PREFIXES[output.content_type]}{encode_string(output.thread_id)}"
+            f", \"branch\": {encode_string(output.branch)}"
+            f", \"start_index\": {output.start_index:d}, \"end_index\": {output.end_index:d}"
+            f", \"url\": {encode_string(output.url)}, \"title\": {encode_string(output.title)}}}\n").encode("ascii")
+
+__all__ = ["StreamingAnnotationUrlOutput", "encode_streaming_annotation_url_output",
+           "serialize_streaming_annotation_url_output"]
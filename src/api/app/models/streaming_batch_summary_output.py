@@ -0,0 +1,42 @@
+import json
+from typing import Any
+
+from pydantic import BaseModel
+
+from app.models.chat_output import ChatOutput
+from app.models.content_type_enum import ContentTypeEnum
+from app.models.token_usage import TokenUsage
+
+
+class BatchServiceSummary(BaseModel):
+    service_name: str
+    thread_id: str
+    succeeded: bool
+    duration_seconds: float
+    error: str | None = None
+    token_usage: TokenUsage
+
+
+class StreamingBatchSummaryOutput(ChatOutput):
+    services: list[BatchServiceSummary]
+    duration_seconds: float
+    content_type: ContentTypeEnum = ContentTypeEnum.BATCH_SUMMARY
+
+
+def serialize_streaming_batch_summary_output(streaming_batch_summary_output: StreamingBatchSummaryOutput) -> dict[str, Any]:
+    if isinstance(streaming_batch_summary_output, StreamingBatchSummaryOutput):
+        return {
+            "content_type": streaming_batch_summary_output.content_type.value,
+            "thread_id": streaming_batch_summary_output.thread_id,
+            "duration_seconds": streaming_batch_summary_output.duration_seconds,
+            "services": [service.model_dump() for service in streaming_batch_summary_output.services],
+        }
+    raise TypeError
+
+
+def encode_streaming_batch_summary_output(streaming_batch_summary_output: StreamingBatchSummaryOutput) -> bytes:
+    # Sent once per batch, so not worth encoding by hand
+    return (json.dumps(serialize_streaming_batch_summary_output(streaming_batch_summary_output)) + "\n").encode("ascii")
+
+__all__ = ["BatchServiceSummary", "StreamingBatchSummaryOutput", "encode_streaming_batch_summary_output",
+           "serialize_streaming_batch_summary_output"]
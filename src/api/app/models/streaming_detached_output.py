@@ -0,0 +1,25 @@
+from typing import Any
+
+from app.models.chat_output import ChatOutput
+from app.models.content_type_enum import ContentTypeEnum
+from app.models.wire import FRAME_PREFIXES, encode_string
+
+class StreamingDetachedOutput(ChatOutput):
+    content_type: ContentTypeEnum = ContentTypeEnum.DETACHED
+
+
+def serialize_streaming_detached_output(streaming_detached_output: StreamingDetachedOutput) -> dict[str, Any]:
+    if isinstance(streaming_detached_output, StreamingDetachedOutput):
+        return {
+            "content_type": streaming_detached_output.content_type.value,
+            "thread_id": streaming_detached_output.thread_id,
+        }
+    raise TypeError
+
+
+def encode_streaming_detached_output(streaming_detached_output: StreamingDetachedOutput) -> bytes:
+    return (f"{FRAME_PREFIXES[streaming_detached_output.content_type]}"
+            f"{encode_string(streaming_detached_output.thread_id)}}}\n").encode("ascii")
+
+__all__ = ["StreamingDetachedOutput", "encode_streaming_detached_output",
+           "serialize_streaming_detached_output"]
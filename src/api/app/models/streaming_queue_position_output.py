@@ -0,0 +1,28 @@
+from typing import Any
+
+from app.models.chat_output import ChatOutput
+from app.models.content_type_enum import ContentTypeEnum
+from app.models.wire import FRAME_PREFIXES, encode_string
+
+class StreamingQueuePositionOutput(ChatOutput):
+    position: int
+    content_type: ContentTypeEnum = ContentTypeEnum.QUEUE_POSITION
+
+
+def serialize_streaming_queue_position_output(streaming_queue_position_output: StreamingQueuePositionOutput) -> dict[str, Any]:
+    if isinstance(streaming_queue_position_output, StreamingQueuePositionOutput):
+        return {
+            "content_type": streaming_queue_position_output.content_type.value,
+            "thread_id": streaming_queue_position_output.thread_id,
+            "position": streaming_queue_position_output.position,
+        }
+    raise TypeError
+
+
+def encode_streaming_queue_position_output(streaming_queue_position_output: StreamingQueuePositionOutput) -> bytes:
+    return (f"{FRAME_PREFIXES[streaming_queue_position_output.content_type]}"
+            f"{encode_string(streaming_queue_position_output.thread_id)}"
+            f", \"position\": {streaming_queue_position_output.position:d}}}\n").encode("ascii")
+
+__all__ = ["StreamingQueuePositionOutput", "encode_streaming_queue_position_output",
+           "serialize_streaming_queue_position_output"]
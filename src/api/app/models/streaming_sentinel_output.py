@@ -1,8 +1,8 @@
 from typing import Any, Optional
-from semantic_kernel.kernel_pydantic import KernelBaseModel
 
 from app.models.chat_output import ChatOutput
 from app.models.content_type_enum import ContentTypeEnum
+from app.models.wire import FRAME_PREFIXES, encode_string
 
 class StreamingSentinelOutput(ChatOutput):
     content_type: ContentTypeEnum = ContentTypeEnum.SENTINEL
@@ -13,7 +13,13 @@ def serialize_streaming_sentinel_output(streaming_sentinel_output: StreamingSent
         return {
             "content_type": streaming_sentinel_output.content_type.value,
             "thread_id": streaming_sentinel_output.thread_id,
+            "branch": streaming_sentinel_output.branch,
         }
     raise TypeError
 
-__all__ = ["StreamingSentinelOutput", "serialize_streaming_sentinel_output"]
+
+def encode_streaming_sentinel_output(streaming_sentinel_output: StreamingSentinelOutput) -> bytes:
+    return (f"{FRAME_PREFIXES[streaming_sentinel_output.content_type]}{encode_string(streaming_sentinel_output.thread_id)}"
+            f", \"branch\": {encode_string(streaming_sentinel_output.branch)}}}\n").encode("ascii")
+
+__all__ = ["StreamingSentinelOutput", "encode_streaming_sentinel_output", "serialize_streaming_sentinel_output"]
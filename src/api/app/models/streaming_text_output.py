@@ -1,8 +1,8 @@
 from typing import Any, Optional
-from semantic_kernel.kernel_pydantic import KernelBaseModel
 
 from app.models.chat_output import ChatOutput
 from app.models.content_type_enum import ContentTypeEnum
+from app.models.wire import FRAME_PREFIXES, encode_string
 
 class StreamingTextOutput(ChatOutput):
     text: str
@@ -14,8 +14,15 @@ def serialize_streaming_text_output(streaming_text_output: StreamingTextOutput)
         return {
             "content_type": streaming_text_output.content_type.value,
             "thread_id": streaming_text_output.thread_id,
+            "branch": streaming_text_output.branch,
             "text": streaming_text_output.text,
         }
     raise TypeError
 
-__all__ = ["StreamingTextOutput", "serialize_streaming_text_output"]
+
+def encode_streaming_text_output(streaming_text_output: StreamingTextOutput) -> bytes:
+    return (f"{FRAME_PREFIXES[streaming_text_output.content_type]}{encode_string(streaming_text_output.thread_id)}"
+            f", \"branch\": {encode_string(streaming_text_output.branch)}"
+            f", \"text\": {encode_string(streaming_text_output.text)}}}\n").encode("ascii")
+
+__all__ = ["StreamingTextOutput", "encode_streaming_text_output", "serialize_streaming_text_output"]
@@ -0,0 +1,12 @@
+from json.encoder import encode_basestring_ascii as encode_string
+
+from app.models.content_type_enum import ContentTypeEnum
+
+# The opening of a frame of each content type, up to the thread id. Encoders append
+# the rest of the frame to it, so the output matches json.dumps of the serialized dict.
+FRAME_PREFIXES: dict[ContentTypeEnum, str] = {
+    content_type: f'{{"content_type": {encode_string(content_type.value)}, "thread_id": '
+    for content_type in ContentTypeEnum
+}
+
+__all__ = ["FRAME_PREFIXES", "encode_string"]
@@ -0,0 +1,24 @@
+"""Imports the modules that loading the app leaves out.
+
+Semantic Kernel and the Azure AI SDKs take seconds to import, so the routers
+only import the services built on them on first use. Warm-up imports them in
+a background thread before the API reports ready, and a preloading master
+imports them before forking, so every worker starts with them imported.
+"""
+import importlib
+
+PRELOADED_MODULES = [
+    "app.services.agents",
+    "app.services.batch",
+    "app.services.chat",
+    "app.services.runs",
+    "app.services.threads",
+]
+
+
+def preload():
+    for module in PRELOADED_MODULES:
+        importlib.import_module(module)
+
+
+__all__ = ["PRELOADED_MODULES", "preload"]
@@ -0,0 +1,11 @@
+from semantic_kernel.kernel_pydantic import KernelBaseModel
+
+class RetrievePublicDocumentationStepParameters(KernelBaseModel):
+    cloud_service_name: str = ""
+    error_message: str = ""
+    previous_output_digest: str = ""  # Hash of the previous step's output, part of this step's cache key
+    pending_context: str = ""  # Output of earlier steps the agent thread hasn't seen
+
+__all__ = [
+    "RetrievePublicDocumentationStepParameters",
+]
@@ -1,9 +1,9 @@
+import hashlib
 import logging
-from functools import partial
+from functools import lru_cache, partial
 from typing import Any, Awaitable, Callable
 
 from opentelemetry import trace
-from psutil import Process
 from semantic_kernel.processes import ProcessBuilder
 from semantic_kernel.processes.kernel_process.kernel_process import \
     KernelProcess
@@ -14,12 +14,30 @@ from app.process_framework.steps.make_security_recommendations import \
     MakeSecurityRecommendationsStep
 from app.process_framework.steps.retrieve_internal_security_recommendations import \
     RetrieveInternalSecurityRecommendationsStep
+from app.process_framework.steps.retrieve_public_documentation import \
+    RetrievePublicDocumentationStep
 from app.process_framework.steps.write_terraform import WriteTerraformStep
+from app.process_framework.utilities.utilities import with_branch
 
 logger = logging.getLogger("uvicorn.error")
 tracer = trace.get_tracer(__name__)
 
+step_classes = [
+    RetrieveInternalSecurityRecommendationsStep,
+    RetrievePublicDocumentationStep,
+    MakeSecurityRecommendationsStep,
+    BuildAzurePolicyStep,
+    WriteTerraformStep
+]
+
+# Steps that run in parallel, and the branch of the chat stream their progress is posted to
+step_branches = {
+    RetrieveInternalSecurityRecommendationsStep: "internal_security_recommendations",
+    RetrievePublicDocumentationStep: "public_documentation",
+}
+
 def build_process_cloud_service_onboarding(thread: AzureAIAgentThread,
+                                           public_documentation_thread: AzureAIAgentThread,
                                            post_intermediate_message: Callable[[Any], Awaitable[None]]) -> KernelProcess:
     # Create the process builder
     process_builder = ProcessBuilder(
@@ -28,16 +46,19 @@ def build_process_cloud_service_onboarding(thread: AzureAIAgentThread,
 
     # Add the steps
     retrieve_internal_security_recommendations, \
+    retrieve_public_documentation_step, \
     make_security_recommendation_step, \
     build_azure_policy_step, \
     write_terraform_step = add_steps(
         process_builder,
         thread,
+        public_documentation_thread,
         post_intermediate_message)
 
     # Orchestrate the events
     setup_events(process_builder,
                  retrieve_internal_security_recommendations,
+                 retrieve_public_documentation_step,
                  make_security_recommendation_step,
                  build_azure_policy_step,
                  write_terraform_step)
@@ -49,26 +70,44 @@ def build_process_cloud_service_onboarding(thread: AzureAIAgentThread,
 
 def setup_events(process_builder,
                  retrieve_internal_security_recommendations,
+                 retrieve_public_documentation_step,
                  make_security_recommendation_step,
                  build_azure_policy_step,
                  write_terraform_step):
+    # Fan out: the retrieval steps don't depend on each other, so they run in the same superstep
     process_builder.on_input_event("Start").send_event_to(
         target=retrieve_internal_security_recommendations,
         parameter_name="params",
+    ).send_event_to(
+        target=retrieve_public_documentation_step,
+        parameter_name="params",
     )
 
+    # Fan in: making recommendations waits until both of its parameters have arrived
     retrieve_internal_security_recommendations.on_event(
         RetrieveInternalSecurityRecommendationsStep.OutputEvents.RetrieveInternalSecurityRecommendationsComplete
     ).send_event_to(
         target=make_security_recommendation_step,
         function_name=MakeSecurityRecommendationsStep.Functions.MakeSecurityRecommendations,
-        parameter_name="params"
+        parameter_name="internal_params"
     )
 
     retrieve_internal_security_recommendations.on_event(
         RetrieveInternalSecurityRecommendationsStep.OutputEvents.RetrieveInternalSecurityRecommendationsError
     ).stop_process()
 
+    retrieve_public_documentation_step.on_event(
+        RetrievePublicDocumentationStep.OutputEvents.RetrievePublicDocumentationComplete
+    ).send_event_to(
+        target=make_security_recommendation_step,
+        function_name=MakeSecurityRecommendationsStep.Functions.MakeSecurityRecommendations,
+        parameter_name="public_params"
+    )
+
+    retrieve_public_documentation_step.on_event(
+        RetrievePublicDocumentationStep.OutputEvents.RetrievePublicDocumentationError
+    ).stop_process()
+
     make_security_recommendation_step.on_event(
         MakeSecurityRecommendationsStep.OutputEvents.MakeSecurityRecommendationsComplete
     ).send_event_to(
@@ -110,23 +149,36 @@ async def step_factory(step_class, thread: AzureAIAgentThread,
 
 def add_steps(process_builder: ProcessBuilder,
               thread: AzureAIAgentThread,
+              public_documentation_thread: AzureAIAgentThread,
               intermediate_message: Callable[[Any], Awaitable[None]]):
-    step_classes = [
-        RetrieveInternalSecurityRecommendationsStep,
-        MakeSecurityRecommendationsStep,
-        BuildAzurePolicyStep,
-        WriteTerraformStep
-    ]
     steps = []
     for step_cls in step_classes:
+        # A thread can only have one active run, so the public documentation branch gets its own
+        step_thread = public_documentation_thread if step_cls is RetrievePublicDocumentationStep else thread
+        step_intermediate_message = with_branch(intermediate_message, step_branches[step_cls]) \
+            if step_cls in step_branches else intermediate_message
+
         step = process_builder.add_step(
             step_type=step_cls,
-            factory_function=partial(step_factory, step_cls, thread=thread, post_intermediate_message=intermediate_message)
+            factory_function=partial(step_factory, step_cls, thread=step_thread,
+                                     post_intermediate_message=step_intermediate_message)
         )
         steps.append(step)
     return tuple(steps)
 
 
+@lru_cache
+def get_process_prompt_hash() -> str:
+    # Identifies the prompts the process runs with, so results can be shared between runs
+    digest = hashlib.sha256()
+    for step_cls in step_classes:
+        digest.update(step_cls.__name__.encode("utf-8"))
+        digest.update(step_cls.additional_instructions.encode("utf-8"))
+    return digest.hexdigest()
+
+
 __all__ = [
     "build_process_cloud_service_onboarding",
+    "get_process_prompt_hash",
+    "step_branches",
 ]
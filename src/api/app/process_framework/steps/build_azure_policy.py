@@ -1,26 +1,28 @@
 import logging
 from enum import StrEnum, auto
-from typing import Any, Awaitable, Callable, ClassVar
+from functools import partial
+from typing import ClassVar
 
 from opentelemetry import trace
 from pydantic import Field
-from semantic_kernel.contents import ChatHistory
 from semantic_kernel.functions import kernel_function
-from semantic_kernel.kernel_pydantic import KernelBaseModel
 from semantic_kernel.processes.kernel_process import (
     KernelProcessStep, KernelProcessStepContext, kernel_process_step_metadata)
-from semantic_kernel.contents.streaming_annotation_content import StreamingAnnotationContent
-from semantic_kernel.contents.streaming_file_reference_content import StreamingFileReferenceContent
-from semantic_kernel.contents.streaming_text_content import StreamingTextContent
 
+from app.config import get_settings
 from app.process_framework.models.build_azure_policy_step_parameters import \
     BuildAzurePolicyStepParameters
 from app.process_framework.models.cloud_service_onboarding_state import CloudServiceOnboardingState
 from app.process_framework.models.write_terraform_step_parameters import WriteTerraformStepParameters
-from app.process_framework.utilities.utilities import (invoke_agent_stream,
-                                                       post_beginning_info, post_end_info,
+from app.process_framework.steps.write_terraform import generate_section_terraform
+from app.process_framework.utilities.pipeline import (JsonSectionDetector,
+                                                      SectionPipeline,
+                                                      register_pipeline)
+from app.process_framework.utilities.utilities import (post_beginning_info, post_end_info,
                                                        post_error,
-                                                       post_intermediate_info)
+                                                       run_cached_step)
+from app.services.runs import on_run_finished
+from app.services.step_cache import build_step_output_digest
 
 logger = logging.getLogger("uvicorn.error")
 tracer = trace.get_tracer(__name__)
@@ -46,32 +48,49 @@ You are a helpful assistant that builds Azure Policy security policies. You will
                                   message=f"Building Azure policy...\n",
                                   post_intermediate_message=self.state.post_intermediate_message)
 
+        pipeline = None
         try:
-            final_response = ""
-            async for response in invoke_agent_stream(
-                agent_name="cloud-security-agent",
+            if get_settings().pipelined_steps_enabled:
+                # Terraform generation starts on each policy as soon as its JSON block is closed
+                pipeline = SectionPipeline(partial(generate_section_terraform,
+                                                   params.cloud_service_name,
+                                                   self.state.post_intermediate_message))
+                register_pipeline(pipeline)
+                on_run_finished(pipeline.cancel)
+            section_detector = JsonSectionDetector()
+
+            def start_sections(text: str):
+                for section in section_detector.feed(text):
+                    pipeline.start(section)  # type: ignore
+
+            final_response, pending_context = await run_cached_step(
+                step_name=self.Functions.BuildAzurePolicy,
+                params=params,
                 thread=self.state.thread, # type: ignore
                 message=f"Build Azure Policy. User message: {params.cloud_service_name}.",
-                additional_instructions=self.additional_instructions
-            ):
-                if isinstance(response, StreamingTextContent):
-                    final_response += response.text
-
-                await post_intermediate_info(message=response,
-                                            post_intermediate_message=self.state.post_intermediate_message)
+                additional_instructions=self.additional_instructions,
+                post_intermediate_message=self.state.post_intermediate_message,
+                on_text=start_sections if pipeline is not None else None
+            )
 
             logger.debug(f"Final Azure Policy response: {final_response}")
 
             await context.emit_event(
                 process_event=self.OutputEvents.BuildAzurePolicyComplete,
                 data=WriteTerraformStepParameters(
-                    cloud_service_name=params.cloud_service_name
+                    cloud_service_name=params.cloud_service_name,
+                    previous_output_digest=build_step_output_digest(final_response),
+                    pending_context=pending_context,
+                    pipeline_id=pipeline.id if pipeline is not None else ""
                 )
             )
 
             await post_end_info(post_intermediate_message=self.state.post_intermediate_message)
 
         except Exception as e:
+            if pipeline is not None:
+                pipeline.cancel()
+
             await post_error(title="Error writing Azure Policy",
                              exception=e,
                              post_intermediate_message=self.state.post_intermediate_message)
@@ -1,21 +1,10 @@
 import logging
 from enum import StrEnum, auto
-from typing import Any, Awaitable, Callable, ClassVar
+from typing import ClassVar
 
-from numpy import add
 from opentelemetry import trace
 from pydantic import Field
-from semantic_kernel.contents import (AnnotationContent,
-                                      ChatMessageContent, FileReferenceContent,
-                                      TextContent)
-from semantic_kernel.contents.streaming_annotation_content import \
-    StreamingAnnotationContent
-from semantic_kernel.contents.streaming_file_reference_content import \
-    StreamingFileReferenceContent
-from semantic_kernel.contents.streaming_text_content import \
-    StreamingTextContent
 from semantic_kernel.functions import kernel_function
-from semantic_kernel.kernel_pydantic import KernelBaseModel
 from semantic_kernel.processes.kernel_process import (
     KernelProcessStep, KernelProcessStepContext, kernel_process_step_metadata)
 
@@ -24,10 +13,11 @@ from app.process_framework.models.make_security_recommendations_step_parameters
     MakeSecurityRecommendationsStepParameters
 from app.process_framework.models.cloud_service_onboarding_state import \
     CloudServiceOnboardingState
-from app.process_framework.utilities.utilities import (invoke_agent_stream,
+from app.process_framework.utilities.utilities import (append_pending_context,
                                                        post_beginning_info, post_end_info,
                                                        post_error,
-                                                       post_intermediate_info)
+                                                       run_cached_step)
+from app.services.step_cache import build_step_output_digest
 
 logger = logging.getLogger("uvicorn.error")
 tracer = trace.get_tracer(__name__)
@@ -42,9 +32,7 @@ You are a helpful assistant that makes security recommendations for cloud servic
 
 MAKE SURE AND USE THE FILE SEARCH TOOL TO SEARCH FOR INTERNAL SECURITY RECOMMENDATIONS. The internal security recommendations should be comprehensive and follow best practices for cloud security. ALWAYS include references to the internal documentation.
 
-MAKE SURE AND USE THE BING CUSTOM SEARCH TOOL TO SEARCH FOR PUBLIC DOCUMENTATION. You will be given a list of internal security recommendations that will help you determine what public documentation to retrieve. The public documentation should be comprehensive and follow best practices for cloud security. ALWAYS include references to the public documentation.
-
-You should use internal security recommendations to help you determine what public documentation to retrieve. The public documentation should be comprehensive and follow best practices for cloud security. You will also need to search public documents to find specific security recommendations for that service. Make sure and do lookups for each item in the internal security recommendations to ensure you provide relevant documentation for each item. If you cannot find documentation for a specific item, please indicate that in your response. Be sure to check and see if there are already existing Azure Policies; if so, you should retrieve those examples.
+You will also be given public documentation that was retrieved for the service. Use it to find specific security recommendations for each item in the internal security recommendations. ALWAYS include references to the public documentation. If the public documentation does not cover a specific item, USE THE BING CUSTOM SEARCH TOOL to look it up, and if you still cannot find documentation for it, please indicate that in your response. Be sure to include any existing Azure Policies found in the public documentation.
 
 These recommendations will be used to make an Azure Policy. Do not write the Azure Policy itself, just provide the recommendations that will be used to create the policy.
 """
@@ -58,31 +46,39 @@ These recommendations will be used to make an Azure Policy. Do not write the Azu
 
     @tracer.start_as_current_span(Functions.MakeSecurityRecommendations)
     @kernel_function(name=Functions.MakeSecurityRecommendations)
-    async def make_security_recommendations(self, context: KernelProcessStepContext, params: MakeSecurityRecommendationsStepParameters):
+    async def make_security_recommendations(self, context: KernelProcessStepContext,
+                                            internal_params: MakeSecurityRecommendationsStepParameters,
+                                            public_params: MakeSecurityRecommendationsStepParameters):
+        # Joins the internal recommendation and public documentation branches
+        params = MakeSecurityRecommendationsStepParameters(
+            cloud_service_name=internal_params.cloud_service_name,
+            previous_output_digest=build_step_output_digest(
+                internal_params.previous_output_digest + public_params.previous_output_digest),
+            pending_context=append_pending_context(internal_params.pending_context, public_params.pending_context)
+        )
+
         await post_beginning_info(title="Make Security Recommendations",
                                   message=f"Making security recommendations...\n",
                                   post_intermediate_message=self.state.post_intermediate_message)
 
         try:
-            final_response = ""
-            async for response in invoke_agent_stream(
-                agent_name="cloud-security-agent",
+            final_response, pending_context = await run_cached_step(
+                step_name=self.Functions.MakeSecurityRecommendations,
+                params=params,
                 thread=self.state.thread, # type: ignore
                 message=f"Make security recommendations. User message: {params.cloud_service_name}.",
-                additional_instructions=self.additional_instructions
-            ):
-                if isinstance(response, StreamingTextContent):
-                    final_response += response.text
-
-                await post_intermediate_info(message=response,
-                                             post_intermediate_message=self.state.post_intermediate_message)
+                additional_instructions=self.additional_instructions,
+                post_intermediate_message=self.state.post_intermediate_message
+            )
 
             logger.debug(f"Making security recommendations response: {final_response}")
 
             await context.emit_event(
                 process_event=self.OutputEvents.MakeSecurityRecommendationsComplete,
                 data=BuildAzurePolicyStepParameters(
-                    cloud_service_name=params.cloud_service_name
+                    cloud_service_name=params.cloud_service_name,
+                    previous_output_digest=build_step_output_digest(final_response),
+                    pending_context=pending_context
                 )
             )
 
@@ -1,26 +1,21 @@
 import logging
 from enum import StrEnum, auto
-from typing import Any, Awaitable, Callable, ClassVar
+from typing import ClassVar
 
 from opentelemetry import trace
 from pydantic import Field
-from semantic_kernel.contents import ChatHistory
 from semantic_kernel.functions import kernel_function
-from semantic_kernel.kernel_pydantic import KernelBaseModel
 from semantic_kernel.processes.kernel_process import (
     KernelProcessStep, KernelProcessStepContext, kernel_process_step_metadata)
-from semantic_kernel.contents.streaming_annotation_content import StreamingAnnotationContent
-from semantic_kernel.contents.streaming_file_reference_content import StreamingFileReferenceContent
-from semantic_kernel.contents.streaming_text_content import StreamingTextContent
 
 from app.process_framework.models.make_security_recommendations_step_parameters import MakeSecurityRecommendationsStepParameters
 from app.process_framework.models.retrieve_internal_security_recommendations_step_parameters import \
     RetrieveInternalSecurityRecommendationsStepParameters
 from app.process_framework.models.cloud_service_onboarding_state import CloudServiceOnboardingState
-from app.process_framework.utilities.utilities import (invoke_agent_stream,
-                                                       post_beginning_info, post_end_info,
+from app.process_framework.utilities.utilities import (post_beginning_info, post_end_info,
                                                        post_error,
-                                                       post_intermediate_info)
+                                                       run_cached_step)
+from app.services.step_cache import build_step_output_digest
 
 logger = logging.getLogger("uvicorn.error")
 tracer = trace.get_tracer(__name__)
@@ -49,25 +44,23 @@ You are a helpful assistant that retrieves internal security recommendations for
                                   message=f"Retrieving internal security recommendations...\n",
                                   post_intermediate_message=self.state.post_intermediate_message)
         try:
-            final_response = ""
-            async for response in invoke_agent_stream(
-                agent_name="cloud-security-agent",
+            final_response, pending_context = await run_cached_step(
+                step_name=self.Functions.RetrieveInternalSecurityRecommendations,
+                params=params,
                 thread=self.state.thread, # type: ignore
                 message=f"Retrieve internal security recommendations. User message: {params.cloud_service_name}.",
-                additional_instructions=self.additional_instructions
-            ):
-                if isinstance(response, StreamingTextContent):
-                    final_response += response.text
-
-                await post_intermediate_info(message=response,
-                                            post_intermediate_message=self.state.post_intermediate_message)
+                additional_instructions=self.additional_instructions,
+                post_intermediate_message=self.state.post_intermediate_message
+            )
 
             logger.debug(f"Final internal security recommendations response: {final_response}")
 
             await context.emit_event(
                 process_event=self.OutputEvents.RetrieveInternalSecurityRecommendationsComplete,
                 data=MakeSecurityRecommendationsStepParameters(
-                    cloud_service_name=params.cloud_service_name
+                    cloud_service_name=params.cloud_service_name,
+                    previous_output_digest=build_step_output_digest(final_response),
+                    pending_context=pending_context
                 )
             )
 
@@ -0,0 +1,90 @@
+import logging
+from enum import StrEnum, auto
+from typing import ClassVar
+
+from opentelemetry import trace
+from pydantic import Field
+from semantic_kernel.functions import kernel_function
+from semantic_kernel.processes.kernel_process import (
+    KernelProcessStep, KernelProcessStepContext, kernel_process_step_metadata)
+
+from app.process_framework.models.make_security_recommendations_step_parameters import MakeSecurityRecommendationsStepParameters
+from app.process_framework.models.retrieve_public_documentation_step_parameters import \
+    RetrievePublicDocumentationStepParameters
+from app.process_framework.models.cloud_service_onboarding_state import CloudServiceOnboardingState
+from app.process_framework.utilities.utilities import (post_beginning_info, post_end_info,
+                                                       post_error,
+                                                       run_cached_step)
+from app.services.step_cache import build_step_output_digest
+
+logger = logging.getLogger("uvicorn.error")
+tracer = trace.get_tracer(__name__)
+
+
+@kernel_process_step_metadata("RetrievePublicDocumentationStep")
+class RetrievePublicDocumentationStep(KernelProcessStep[CloudServiceOnboardingState]):
+    state: CloudServiceOnboardingState = Field(  # type: ignore
+        default_factory=CloudServiceOnboardingState)
+
+    additional_instructions: ClassVar[str] = """
+You are a helpful assistant that retrieves public security documentation for cloud services. You will be given a cloud service name. Your job is to retrieve the public documentation that describes how to secure the service.
+
+MAKE SURE AND USE THE BING CUSTOM SEARCH TOOL TO SEARCH FOR PUBLIC DOCUMENTATION. The public documentation should be comprehensive and follow best practices for cloud security. ALWAYS include references to the public documentation. Be sure to check and see if there are already existing Azure Policies for the service; if so, you should retrieve those examples.
+
+These findings will be combined with internal security recommendations to make an Azure Policy. Do not write the Azure Policy itself, just provide the public documentation findings. The findings should be actionable and include specifics, not just links to other documentation.
+"""
+
+    class Functions(StrEnum):
+        RetrievePublicDocumentation = auto()
+
+    class OutputEvents(StrEnum):
+        RetrievePublicDocumentationComplete = auto()
+        RetrievePublicDocumentationError = auto()
+
+    @tracer.start_as_current_span(Functions.RetrievePublicDocumentation)
+    @kernel_function(name=Functions.RetrievePublicDocumentation)
+    async def retrieve_public_documentation(self, context: KernelProcessStepContext, params: RetrievePublicDocumentationStepParameters):
+        await post_beginning_info(title="Retrieve Public Documentation",
+                                  message=f"Retrieving public documentation...\n",
+                                  post_intermediate_message=self.state.post_intermediate_message)
+        try:
+            # This step runs on its own thread, so its output is always passed on below
+            final_response, _ = await run_cached_step(
+                step_name=self.Functions.RetrievePublicDocumentation,
+                params=params,
+                thread=self.state.thread, # type: ignore
+                message=f"Retrieve public security documentation. User message: {params.cloud_service_name}.",
+                additional_instructions=self.additional_instructions,
+                post_intermediate_message=self.state.post_intermediate_message
+            )
+
+            logger.debug(f"Final public documentation response: {final_response}")
+
+            await context.emit_event(
+                process_event=self.OutputEvents.RetrievePublicDocumentationComplete,
+                data=MakeSecurityRecommendationsStepParameters(
+                    cloud_service_name=params.cloud_service_name,
+                    previous_output_digest=build_step_output_digest(final_response),
+                    # This step runs on its own thread, so the joining step never sees its output otherwise
+                    pending_context=final_response
+                )
+            )
+
+            await post_end_info(post_intermediate_message=self.state.post_intermediate_message)
+        except Exception as e:
+            await post_error(title="Error retrieving public documentation",
+                             exception=e,
+                             post_intermediate_message=self.state.post_intermediate_message)
+
+            await context.emit_event(
+                process_event=self.OutputEvents.RetrievePublicDocumentationError,
+                data=RetrievePublicDocumentationStepParameters(
+                    cloud_service_name=params.cloud_service_name,
+                    error_message=str(e)
+                )
+            )
+
+
+__all__ = [
+    "RetrievePublicDocumentationStep",
+]
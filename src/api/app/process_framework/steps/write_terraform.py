@@ -1,18 +1,17 @@
 import json
 import logging
 from enum import StrEnum, auto
-from typing import Any, Awaitable, Callable, ClassVar
+from functools import partial
+from typing import Any, AsyncIterable, Awaitable, Callable, ClassVar
 
+from azure.ai.agents.models import MessageRole
 from opentelemetry import trace
 from pydantic import Field
-from semantic_kernel.contents import ChatHistory
 from semantic_kernel.functions import kernel_function
-from semantic_kernel.kernel_pydantic import KernelBaseModel
 from semantic_kernel.processes.kernel_process import (
     KernelProcessStep, KernelProcessStepContext, kernel_process_step_metadata)
-from semantic_kernel.contents.streaming_annotation_content import StreamingAnnotationContent
-from semantic_kernel.contents.streaming_file_reference_content import StreamingFileReferenceContent
 from semantic_kernel.contents.streaming_text_content import StreamingTextContent
+from semantic_kernel.agents.azure_ai.azure_ai_agent import AzureAIAgentThread
 
 from app.process_framework.models.write_terraform_step_parameters import \
     WriteTerraformStepParameters
@@ -20,7 +19,14 @@ from app.process_framework.models.cloud_service_onboarding_state import CloudSer
 from app.process_framework.utilities.utilities import (invoke_agent_stream,
                                                        post_beginning_info, post_end_info,
                                                        post_error,
-                                                       post_intermediate_info)
+                                                       post_intermediate_info,
+                                                       run_cached_step,
+                                                       with_branch)
+from app.process_framework.utilities.pipeline import SectionPipeline, pop_pipeline
+from app.services.agent_pool import get_create_agent_pool
+from app.services.runs import register_branch_thread, release_branch_thread
+from app.services.step_cache import build_step_output_digest
+from app.services.threads import get_thread_client
 
 logger = logging.getLogger("uvicorn.error")
 tracer = trace.get_tracer(__name__)
@@ -48,26 +54,27 @@ You are a helpful assistant that writes Terraform code for cloud services. You w
                                   message=f"Writing Terraform...\n",
                                   post_intermediate_message=self.state.post_intermediate_message)
 
+        pipeline = pop_pipeline(params.pipeline_id) if params.pipeline_id else None
         try:
-            final_response = ""
-            async for response in invoke_agent_stream(
-                agent_name="cloud-security-agent",
+            final_response, pending_context = await run_cached_step(
+                step_name=self.Functions.WriteTerraform,
+                params=params,
                 thread=self.state.thread, # type: ignore
                 message=f"Write Terraform code for deploying Azure Policy. User message: {params.cloud_service_name}.",
-                additional_instructions=self.additional_instructions
-            ):
-                if isinstance(response, StreamingTextContent):
-                    final_response += response.text
-
-                await post_intermediate_info(message=response,
-                                            post_intermediate_message=self.state.post_intermediate_message)
+                additional_instructions=self.additional_instructions,
+                post_intermediate_message=self.state.post_intermediate_message,
+                produce=partial(self.collect_pipeline, pipeline) \
+                    if pipeline is not None and pipeline.section_count > 0 else None
+            )
 
             logger.debug(f"Final Terraform response: {final_response}")
 
             await context.emit_event(
                 process_event=self.OutputEvents.WriteTerraformComplete,
                 data=WriteTerraformStepParameters(
-                    cloud_service_name=params.cloud_service_name
+                    cloud_service_name=params.cloud_service_name,
+                    previous_output_digest=build_step_output_digest(final_response),
+                    pending_context=pending_context
                 )
             )
 
@@ -84,8 +91,77 @@ You are a helpful assistant that writes Terraform code for cloud services. You w
                     error_message=str(e)
                 )
             )
+        finally:
+            # Stops generation that is no longer needed, e.g. after a step cache hit
+            if pipeline is not None:
+                pipeline.cancel()
+
+    async def collect_pipeline(self, pipeline: SectionPipeline) -> str:
+        # The sections have been streaming on their own branches since the policy was being written
+        await post_intermediate_info(message=f"Terraform is being written for {pipeline.section_count} "
+                                             f"policy definition(s) below.\n",
+                                     post_intermediate_message=self.state.post_intermediate_message)
+
+        sections: list[str] = [""] * pipeline.section_count
+        async for section, response in pipeline.stream():
+            if isinstance(response, StreamingTextContent):
+                sections[section] += response.text
+
+        output = "\n\n".join(sections)
+
+        # The sections were written on scratch threads, so the chat thread gets the
+        # Terraform the way it does when the step runs on it
+        try:
+            await get_thread_client(self.state.thread).agents.messages.create(  # type: ignore
+                thread_id=self.state.thread.id,  # type: ignore
+                role=MessageRole.AGENT,
+                content=output)
+        except Exception as e:
+            logger.error(f"Error adding the pipelined Terraform to thread {self.state.thread.id}: {e}")  # type: ignore
+        return output
+
+
+async def generate_section_terraform(cloud_service_name: str,
+                                     post_intermediate_message: Callable[[Any], Awaitable[None]] | None,
+                                     index: int,
+                                     section: str) -> AsyncIterable[Any]:
+    """Writes the Terraform for one policy section, streaming it to a branch of its own."""
+    if post_intermediate_message is not None:
+        post_intermediate_message = with_branch(post_intermediate_message, f"terraform_{index}")
+
+    await post_intermediate_info(message=f"\n## Write Terraform (policy definition {index + 1})\n",
+                                 post_intermediate_message=post_intermediate_message)
+
+    # Each section gets a scratch thread so that sections can be generated
+    # concurrently, in whichever project of the agent pool is least loaded
+    thread = AzureAIAgentThread(client=get_create_agent_pool().select_client("cloud-security-agent"))
+    registered = False
+    try:
+        async for response in invoke_agent_stream(
+            agent_name="cloud-security-agent",
+            thread=thread,
+            message=f"""Write Terraform code for deploying this Azure Policy. User message: {cloud_service_name}.
+
+```json
+{section}
+```""",
+            additional_instructions=WriteTerraformStep.additional_instructions
+        ):
+            # The thread is created by the first invocation, after which the run can cancel it
+            if not registered and thread.id is not None:
+                register_branch_thread(thread)
+                registered = True
+
+            await post_intermediate_info(message=response,
+                                         post_intermediate_message=post_intermediate_message)
+            yield response
+
+        await post_end_info(post_intermediate_message=post_intermediate_message)
+    finally:
+        await release_branch_thread(thread)
 
 
 __all__ = [
     "WriteTerraformStep",
+    "generate_section_terraform",
 ]
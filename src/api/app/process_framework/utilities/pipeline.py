@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import re
+import uuid
+from typing import Any, AsyncIterable, Callable
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class JsonSectionDetector:
+    """Finds fenced JSON blocks in streamed text as soon as they are closed.
+
+    A closed fence is the signal that a section, e.g. one Azure Policy
+    definition, is stable and can be handed to the next step while the rest of
+    the response is still streaming.
+    """
+
+    _SECTION = re.compile(r"```json[^\n]*\n(.*?)\n[ \t]*```", re.S)
+
+    def __init__(self):
+        self._text = ""
+        self._position = 0
+
+    def feed(self, text: str) -> list[str]:
+        """Adds ``text`` and returns the sections it closed."""
+        self._text += text
+
+        sections = []
+        while (match := self._SECTION.search(self._text, self._position)) is not None:
+            self._position = match.end()
+            sections.append(match.group(1))
+        return sections
+
+
+class _Section:
+    def __init__(self):
+        self.responses: list[Any] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.changed = asyncio.Event()
+
+
+class SectionPipeline:
+    """Runs ``generate`` for each section in the background.
+
+    ``generate`` is called with the index and text of the section. Its output
+    is buffered, so a downstream step can collect it in section order as soon
+    as it starts, however far generation has got.
+    """
+
+    def __init__(self, generate: Callable[[int, str], AsyncIterable[Any]]):
+        self.id = str(uuid.uuid4())
+        self._generate = generate
+        self._sections: list[_Section] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def section_count(self) -> int:
+        return len(self._sections)
+
+    def start(self, text: str):
+        section = _Section()
+        self._sections.append(section)
+
+        task = asyncio.create_task(self._run(section, len(self._sections) - 1, text))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, section: _Section, index: int, text: str):
+        try:
+            async for response in self._generate(index, text):
+                section.responses.append(response)
+                section.changed.set()
+        except Exception as e:
+            section.error = e
+        finally:
+            section.done = True
+            section.changed.set()
+
+    async def stream(self) -> AsyncIterable[tuple[int, Any]]:
+        """Yields ``(section index, response)`` in section order, waiting for output still being generated."""
+        for index, section in enumerate(self._sections):
+            position = 0
+            while True:
+                while position < len(section.responses):
+                    yield index, section.responses[position]
+                    position += 1
+
+                if section.done:
+                    break
+
+                section.changed.clear()
+                if position == len(section.responses) and not section.done:
+                    await section.changed.wait()
+
+            if section.error is not None:
+                raise section.error
+
+    def cancel(self):
+        _pipelines.pop(self.id, None)
+        for task in list(self._tasks):
+            task.cancel()
+
+
+# Pipelines started by one step and not yet picked up by the next
+_pipelines: dict[str, SectionPipeline] = {}
+
+
+def register_pipeline(pipeline: SectionPipeline):
+    _pipelines[pipeline.id] = pipeline
+
+
+def pop_pipeline(pipeline_id: str) -> SectionPipeline | None:
+    return _pipelines.pop(pipeline_id, None)
+
+
+__all__ = [
+    "JsonSectionDetector",
+    "SectionPipeline",
+    "pop_pipeline",
+    "register_pipeline",
+]
@@ -1,11 +1,12 @@
-import json
+import asyncio
 import logging
-from tracemalloc import start
-from typing import Any, AsyncIterable
+import math
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterable, Awaitable, Callable
 
 from opentelemetry import trace
-from semantic_kernel.contents import (ChatHistory,
-                                      ChatMessageContent,
+from semantic_kernel.contents import (ChatMessageContent,
                                       FunctionCallContent,
                                       FunctionResultContent, )
 from semantic_kernel.contents.annotation_content import CitationType
@@ -17,12 +18,32 @@ from semantic_kernel.contents.streaming_text_content import \
     StreamingTextContent
 from semantic_kernel.agents.azure_ai.azure_ai_agent import AzureAIAgentThread
 
-from app.models.streaming_annotation_file_output import StreamingAnnotationFileOutput, serialize_streaming_annotation_file_output
-from app.models.streaming_annotation_url_output import StreamingAnnotationUrlOutput, serialize_streaming_annotation_url_output
-from app.models.content_type_enum import ContentTypeEnum
-from app.models.streaming_sentinel_output import StreamingSentinelOutput, serialize_streaming_sentinel_output
-from app.models.streaming_text_output import StreamingTextOutput, serialize_streaming_text_output
-from app.services.agents import get_create_agent_manager
+from app.agents.cloud_security_agent import get_knowledge_base_hash
+from app.config import get_settings
+from app.models.chat_output import ChatOutput
+from app.models.streaming_annotation_file_output import StreamingAnnotationFileOutput
+from app.models.streaming_annotation_url_output import StreamingAnnotationUrlOutput
+from app.models.streaming_sentinel_output import StreamingSentinelOutput
+from app.models.streaming_text_output import StreamingTextOutput
+from app.services.annotations import (Annotation, apply_annotations,
+                                     file_annotation, url_annotation)
+from app.services.agent_pool import (AgentPoolMember,
+                                     estimate_invocation_tokens,
+                                     get_create_agent_pool)
+from app.services.hedging import (Hedge, ResponseStream, copy_hedge_output,
+                                  get_create_ttft_tracker, record_hedge_win,
+                                  record_invocation, wait_first)
+from app.services.resilience import (AgentTimeoutError,
+                                     get_create_circuit_breaker,
+                                     get_create_retry_budget, get_retry_after,
+                                     get_retry_delay, is_rate_limit_error,
+                                     is_retryable_error)
+from app.services.runs import (current_step_var, mark_run_failed,
+                               mark_step_completed, mark_step_started,
+                               record_step_output)
+from app.services.result_cache import normalize_service_name
+from app.services.step_cache import build_step_cache_key, get_create_step_cache
+from app.services.threads import cancel_active_runs, get_thread_client
 
 logger = logging.getLogger("uvicorn.error")
 tracer = trace.get_tracer(__name__)
@@ -33,13 +54,11 @@ async def _post_intermediate_message(post_intermediate_message,
                                      thread_id: str = "asdf"):
     if post_intermediate_message is not None:
         obj = None
-        default_serializer = None
         if isinstance(content, StreamingTextContent):
             obj = StreamingTextOutput(
                 text=content.text,
                 thread_id=thread_id,
             )
-            default_serializer = serialize_streaming_text_output
         elif isinstance(content, StreamingAnnotationContent):
             match content.citation_type:
                 case CitationType.URL_CITATION:
@@ -50,7 +69,6 @@ async def _post_intermediate_message(post_intermediate_message,
                         title=content.title, # type: ignore
                         thread_id=thread_id,
                     )
-                    default_serializer = serialize_streaming_annotation_url_output
                 case CitationType.FILE_CITATION:
                     obj = StreamingAnnotationFileOutput(
                         start_index=content.start_index, # type: ignore
@@ -59,7 +77,6 @@ async def _post_intermediate_message(post_intermediate_message,
                         quote=content.quote, # type: ignore
                         thread_id=thread_id,
                     )
-                    default_serializer = serialize_streaming_annotation_file_output
                 case _:
                     raise ValueError(f"Unknown citation type {content.citation_type}")
         elif isinstance(content, StreamingFileReferenceContent):
@@ -67,7 +84,6 @@ async def _post_intermediate_message(post_intermediate_message,
                 text=content.file_id, # type: ignore
                 thread_id=thread_id,
             )
-            default_serializer = serialize_streaming_text_output
         elif isinstance(content, str):
             try:
                 obj = StreamingTextOutput(
@@ -76,23 +92,39 @@ async def _post_intermediate_message(post_intermediate_message,
                 )
             except Exception as e:
                 logger.error(f"Error creating StreamingTextOutput: {e}")
-            default_serializer = serialize_streaming_text_output
         elif isinstance(content, StreamingSentinelOutput):
             obj = StreamingSentinelOutput(
                 thread_id=content.thread_id,
             )
-            default_serializer = serialize_streaming_sentinel_output
         else:
             logger.error(f"Unknown content type: {type(content)}")
             raise ValueError(f"Unknown content type: {type(content)}")
 
-        await post_intermediate_message(json.dumps(
-            obj=obj,
-            default=default_serializer,
-        ) + "\n")
+        if obj is not None:
+            await post_intermediate_message(obj)
+
+
+def build_annotation(content: StreamingAnnotationContent) -> Annotation | None:
+    """Returns the citation of a streamed annotation, to apply to the output of a step."""
+    if content.start_index is None or content.end_index is None:
+        return None
+
+    match content.citation_type:
+        case CitationType.URL_CITATION if content.url:
+            return url_annotation(start_index=content.start_index,
+                                  end_index=content.end_index,
+                                  title=content.title or content.url,
+                                  url=content.url)
+        case CitationType.FILE_CITATION if content.file_id:
+            return file_annotation(start_index=content.start_index,
+                                   end_index=content.end_index,
+                                   file_id=content.file_id)
+    return None
 
 
 async def post_beginning_info(title, message, post_intermediate_message):
+    mark_step_started(title)
+
     final_response = f"""
 ## {title}
 {message}
@@ -111,6 +143,8 @@ async def post_end_info(post_intermediate_message):
     await _post_intermediate_message(post_intermediate_message, StreamingSentinelOutput(thread_id=""))
 
 async def post_error(title, exception, post_intermediate_message):
+    mark_run_failed(f"{title}: {exception}", retryable=is_retryable_error(exception))
+
     final_response = f"""
 ***
 **{title}**
@@ -123,6 +157,126 @@ async def post_error(title, exception, post_intermediate_message):
     await _post_intermediate_message(post_intermediate_message, StreamingSentinelOutput(thread_id=""))
 
 
+async def get_cached_step_output(step_name: str,
+                                 params: Any,
+                                 message: str,
+                                 additional_instructions: str) -> tuple[str, str | None]:
+    """Returns the step cache key for this invocation and the cached output, if any."""
+    key = build_step_cache_key(step_name=step_name,
+                               inputs=[normalize_service_name(params.cloud_service_name),
+                                       params.previous_output_digest,
+                                       get_knowledge_base_hash()],
+                               prompt=f"{additional_instructions}\n{message}")
+
+    if not get_settings().step_cache_enabled:
+        return key, None
+
+    try:
+        output = await get_create_step_cache().get(key, step_name)
+    except Exception as e:
+        logger.error(f"Error reading step cache for {step_name}: {e}")
+        return key, None
+
+    if output is not None:
+        mark_step_completed()
+    return key, output
+
+
+async def put_cached_step_output(step_name: str, key: str, output: str):
+    if not get_settings().step_cache_enabled:
+        return
+
+    try:
+        await get_create_step_cache().put(key, step_name, output)
+    except Exception as e:
+        logger.error(f"Error writing step cache for {step_name}: {e}")
+        return
+
+    # A resumed run can now replay this step from the step cache
+    mark_step_completed()
+
+
+async def run_cached_step(step_name: str,
+                          params: Any,
+                          thread: AzureAIAgentThread,
+                          message: str,
+                          additional_instructions: str,
+                          post_intermediate_message: Callable[[Any], Awaitable[None]] | None,
+                          on_text: Callable[[str], None] | None = None,
+                          produce: Callable[[], Awaitable[str]] | None = None) -> tuple[str, str]:
+    """Replays a step's output from the step cache, or invokes the agent and caches its output.
+
+    ``on_text`` is called with each chunk of streamed text. ``produce``, if
+    given, is awaited for the output instead of invoking the agent. Returns
+    the output and the pending context to pass on to the next step.
+    """
+    step_cache_key, output = await get_cached_step_output(step_name=step_name,
+                                                          params=params,
+                                                          message=message,
+                                                          additional_instructions=additional_instructions)
+
+    if output is not None:
+        logger.info(f"Using cached output for {step_name}")
+        await post_intermediate_info(message=output, post_intermediate_message=post_intermediate_message)
+        record_step_output(output)
+
+        # The agent thread never saw this output, so pass it on to the next step that runs
+        return output, append_pending_context(params.pending_context, output)
+
+    if produce is not None:
+        output = await produce()
+    else:
+        output = ""
+        annotations = []
+        async for response in invoke_agent_stream(
+            agent_name="cloud-security-agent",
+            thread=thread,
+            message=add_pending_context(message, params.pending_context),
+            additional_instructions=additional_instructions
+        ):
+            if isinstance(response, StreamingTextContent):
+                output += response.text
+                if on_text is not None:
+                    on_text(response.text)
+            elif isinstance(response, StreamingAnnotationContent) \
+                    and (annotation := build_annotation(response)) is not None:
+                annotations.append(annotation)
+
+            await post_intermediate_info(message=response, post_intermediate_message=post_intermediate_message)
+
+        # The output is cached and passed on with its citations rather than their placeholders
+        output = apply_annotations(output, annotations)
+
+    await put_cached_step_output(step_name=step_name, key=step_cache_key, output=output)
+    record_step_output(output)
+    return output, ""
+
+
+def add_pending_context(message: str, pending_context: str) -> str:
+    # Earlier steps served from the step cache never ran on this thread, so hand the agent their output
+    if not pending_context:
+        return message
+
+    return f"""{message}
+
+Output of the previous steps:
+{pending_context}"""
+
+
+def append_pending_context(pending_context: str, output: str) -> str:
+    return f"{pending_context}\n\n{output}" if pending_context else output
+
+
+def with_branch(post_intermediate_message: Callable[[ChatOutput], Awaitable[None]],
+                branch: str) -> Callable[[ChatOutput], Awaitable[None]]:
+    """Tags every frame posted through ``post_intermediate_message`` with a process branch."""
+    async def post_branch_message(chat_output: ChatOutput):
+        chat_output.branch = branch
+        await post_intermediate_message(chat_output)
+
+    return post_branch_message
+
+
 async def print_on_intermediate_message(message: ChatMessageContent):
     for item in message.items or []:
         if isinstance(item, FunctionCallContent):
@@ -137,39 +291,179 @@ async def invoke_agent_stream(agent_name: str,
                               thread: AzureAIAgentThread,
                               message: str,
                               additional_instructions: str = "") -> AsyncIterable[Any]:
-    agent_manager = get_create_agent_manager()
+    """Streams the items of an agent invocation.
 
-    agent = None
-    for a in agent_manager:
-        if a.name == agent_name:
-            agent = a
-            break
+    Each attempt is routed to a deployment by the agent pool. The whole
+    invocation, retries included, must finish within the step deadline, and
+    each attempt must produce its first token within the TTFT timeout.
+    Failures before the first token are retried with jittered backoff while
+    the retry budget allows. Failures after it are not, as the output already
+    streamed can't be taken back; the run resumes instead. Calls fail fast
+    while the circuit breaker is open.
 
-    if not agent:
-        raise ValueError(f"{agent_name} not found.")
+    With hedging enabled, an attempt whose first token is later than its
+    step usually takes is duplicated on a scratch thread, and whichever of
+    the two responds first is kept.
+    """
+    settings = get_settings()
+    agent_pool = get_create_agent_pool()
+    circuit_breaker = get_create_circuit_breaker()
+    retry_budget = get_create_retry_budget()
+    ttft_tracker = get_create_ttft_tracker()
+    step_name = current_step_var.get() or agent_name
+    estimated_tokens = estimate_invocation_tokens(message, additional_instructions)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.agent_step_deadline_seconds
 
-    try:
-        async for response in agent.invoke_stream(
-            thread=thread,
-            messages=message,  # type: ignore
+    def invoke(member: AgentPoolMember, invoke_thread: AzureAIAgentThread, invoke_message: str):
+        return member.agent.invoke_stream(
+            thread=invoke_thread,
+            messages=invoke_message,  # type: ignore
             on_intermediate_message=print_on_intermediate_message,
             additional_instructions=additional_instructions,
-        ):
-            #thread = response.thread
+        )
 
-            for item in response.items:
-                yield item
-    except Exception as e:
-        logger.error(f"Error calling agent {agent_name}: {e}")
-        raise
+    retry_budget.deposit()
+    record_invocation(step_name)
+    attempt = 0
+    while True:
+        circuit_breaker.before_call()
+
+        # Picked again on every attempt, so a retry avoids a rate limited deployment
+        with agent_pool.lease(agent_name, thread, estimated_tokens) as member:
+            attempt_started_at = datetime.now(timezone.utc)
+            first_token_deadline = min(deadline, loop.time() + settings.agent_ttft_timeout_seconds)
+            hedge_at = loop.time() + ttft_tracker.hedge_delay(step_name) \
+                if settings.agent_hedging_enabled else math.inf
+
+            primary = ResponseStream(invoke(member, thread, message))
+            hedge: Hedge | None = None
+            stream: ResponseStream | None = None  # The stream kept, once one has responded
+            hedge_output = ""
+            first_token = False
+            try:
+                while True:
+                    if stream is None:
+                        streams = [primary] if hedge is None else [primary, hedge.stream]
+                        wait_until = first_token_deadline if hedge is not None else min(first_token_deadline, hedge_at)
+                        responded = await wait_first(streams, wait_until - loop.time())  # type: ignore
+
+                        if responded is None:
+                            if hedge is None and loop.time() < first_token_deadline:
+                                hedge_at = math.inf  # At most one hedge per attempt
+                                if retry_budget.try_withdraw():  # A hedge costs as much as a retry
+                                    try:
+                                        hedge = await Hedge.start(step_name, agent_name, thread, message,
+                                                                  estimated_tokens, exclude=member, invoke=invoke)
+                                    except Exception as e:
+                                        # A hedge that fails to start leaves the invocation it would duplicate running
+                                        logger.error(f"Error starting a hedge of {agent_name}: {e}")
+                                        hedge = None
+                                continue
+                            raise AgentTimeoutError(f"No first token from {agent_name} in time")
+
+                        if hedge is not None and responded is hedge.stream:
+                            try:
+                                response = responded.take()
+                            except Exception as e:
+                                # A failed hedge leaves the invocation it duplicated running
+                                logger.error(f"Error hedging {agent_name} on {hedge.member.deployment_name}: {e}")  # type: ignore
+                                if is_rate_limit_error(e):
+                                    agent_pool.cool_down(hedge.member, get_retry_after(e))  # type: ignore
+                                await hedge.close()
+                                hedge = None
+                                continue
+
+                            logger.info(f"Hedge of {step_name} responded first")
+                            record_hedge_win(step_name)
+                            await primary.cancel()
+                            await _cancel_attempt_runs(thread, attempt_started_at)
+                        else:
+                            response = responded.take()
+                            if hedge is not None:
+                                await hedge.close()
+                                hedge = None
+
+                        stream = responded
+                        ttft_tracker.record(step_name, time.monotonic() - stream.started_at)
+                    else:
+                        # Only the wait for the next response is timed, never the caller's handling of it
+                        if await wait_first([stream], deadline - loop.time()) is None:
+                            raise AgentTimeoutError(f"No response from {agent_name} in time")
+                        response = stream.take()
+
+                    if response is None:  # End of stream
+                        break
+
+                    #thread = response.thread
+
+                    for item in response.items:
+                        first_token = True
+                        if hedge is not None and isinstance(item, StreamingTextContent):
+                            hedge_output += item.text
+                        yield item
+
+                if hedge is not None:
+                    await copy_hedge_output(thread, hedge_output)
+            except Exception as e:
+                logger.error(f"Error calling agent {agent_name} on {member.deployment_name}: {e}")
+
+                await primary.cancel()
+                await _cancel_attempt_runs(thread, attempt_started_at)
+
+                retryable = is_retryable_error(e)
+                if is_rate_limit_error(e):
+                    # Only this deployment is out of quota, the others can take the retry
+                    agent_pool.cool_down(member, get_retry_after(e))
+                elif retryable:
+                    circuit_breaker.record_failure()
+                else:
+                    circuit_breaker.record_success()  # The agents service answered
+
+                attempt += 1
+                delay = get_retry_delay(attempt)
+                if not retryable or first_token or attempt >= settings.agent_max_attempts \
+                        or loop.time() + delay >= deadline or not retry_budget.try_withdraw():
+                    raise
+
+                logger.info(f"Retrying {agent_name} in {delay:.1f}s (attempt {attempt + 1})")
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                circuit_breaker.release()
+                await primary.cancel()
+                if hedge is not None:
+                    await hedge.close()
+
+        circuit_breaker.record_success()
+        break
 
     logger.debug(f"Final thread ID: {thread.id if thread else 'None'}")
 
 
+async def _cancel_attempt_runs(thread: AzureAIAgentThread, created_after: datetime):
+    # A run left active on the thread would reject the next attempt's message
+    if thread.id is None:
+        return
+
+    try:
+        await cancel_active_runs(thread_id=thread.id,
+                                 azure_ai_client=get_thread_client(thread),
+                                 created_after=created_after)
+    except Exception as e:
+        logger.error(f"Error cancelling agent runs on thread {thread.id}: {e}")
+
+
 __all__ = [
+    "add_pending_context",
+    "append_pending_context",
+    "get_cached_step_output",
     "invoke_agent_stream",
     "post_beginning_info",
     "post_intermediate_info",
     "post_end_info",
     "post_error",
+    "put_cached_step_output",
+    "run_cached_step",
+    "with_branch",
 ]
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+
+from fastapi import APIRouter
+from opentelemetry import trace
+
+from app.services.knowledge_base import KnowledgeBaseSyncResult
+from app.services.result_cache import get_create_result_cache
+from app.services.step_cache import get_create_step_cache
+
+logger = logging.getLogger("uvicorn.error")
+tracer = trace.get_tracer(__name__)
+
+router = APIRouter()
+
+
+@tracer.start_as_current_span(name="list_result_cache")
+@router.get("/admin/result_cache")
+async def list_result_cache():
+    return await get_create_result_cache().list_entries()
+
+
+@tracer.start_as_current_span(name="invalidate_result_cache_entry")
+@router.delete("/admin/result_cache/{key}")
+async def invalidate_result_cache_entry(key: str):
+    return {"invalidated": await get_create_result_cache().invalidate(key=key)}
+
+
+@tracer.start_as_current_span(name="invalidate_result_cache")
+@router.delete("/admin/result_cache")
+async def invalidate_result_cache(service_name: str | None = None):
+    # Without a service name every entry is invalidated
+    return {"invalidated": await get_create_result_cache().invalidate(service_name=service_name)}
+
+
+@tracer.start_as_current_span(name="invalidate_step_cache")
+@router.delete("/admin/step_cache")
+async def invalidate_step_cache(step_name: str | None = None):
+    # Without a step name every step's output is invalidated
+    return {"invalidated": await get_create_step_cache().invalidate(step_name=step_name)}
+
+
+@tracer.start_as_current_span(name="run_knowledge_base_sync")
+@router.post("/admin/knowledge_base/sync")
+async def run_knowledge_base_sync(dry_run: bool = False) -> list[KnowledgeBaseSyncResult]:
+    # Built on Semantic Kernel, so imported on first use rather than when the app is loaded
+    from app.agents.cloud_security_agent import (
+        get_knowledge_base_vector_store_id, sync_knowledge_base)
+    from app.services.agent_pool import get_create_agent_pool
+
+    # Agents in the same AI project share a vector store, every other project has its own
+    vector_stores = {}
+    for member in get_create_agent_pool().members:
+        vector_store_id = await get_knowledge_base_vector_store_id(member.client, member.agent.definition)
+        vector_stores[vector_store_id] = member.client
+
+    return list(await asyncio.gather(*(sync_knowledge_base(client, vector_store_id, dry_run)
+                                       for vector_store_id, client in vector_stores.items())))
@@ -1,18 +1,37 @@
 import asyncio
 import logging
+from functools import partial
+from typing import TYPE_CHECKING, Annotated
 
-from fastapi import APIRouter
-from fastapi.responses import Response, StreamingResponse
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from opentelemetry import trace
 
+from app.config import get_settings
+from app.models.chat_attach import ChatAttachInput
 from app.models.chat_get_image import ChatGetImageInput
 from app.models.chat_get_image_contents import ChatGetImageContents
 from app.models.chat_get_thread import ChatGetThreadInput
 from app.models.chat_input import ChatInput
-from app.routers.context import build_chat_context, chat_context_var
-from app.services.chat import build_chat_results
-from app.services.threads import create_thread, get_thread
-from app.services.dependencies import AIProjectClientDependency, AsyncAzureAIClientDependency
+from app.models.chat_output import ChatOutput
+from app.models.content_type_enum import ContentTypeEnum
+from app.models.streaming_queue_position_output import StreamingQueuePositionOutput
+from app.routers.context import (build_chat_context, build_stream_channel,
+                                 chat_context_var)
+from app.services.dependencies import (AIProjectClientDependency,
+                                       get_create_ai_project_client)
+from app.services.image_cache import detect_media_type, get_create_image_cache
+from app.services.result_cache import (CachedResult, get_create_result_cache,
+                                       replay_frames)
+from app.services.scheduler import (SchedulerSaturatedError,
+                                    get_create_run_scheduler)
+from app.services.stream_channel import StreamChannel
+from app.services.streaming import encode_chat_output, readdress_chat_output
+
+# The services built on Semantic Kernel are imported by the handlers, so that loading
+# the app doesn't import the SDKs. Warm-up imports them before the API reports ready.
+if TYPE_CHECKING:
+    from app.services.runs import OnboardingRun
 
 logger = logging.getLogger("uvicorn.error")
 tracer = trace.get_tracer(__name__)
@@ -22,14 +41,27 @@ router = APIRouter()
 @tracer.start_as_current_span(name="create_thread")
 @router.post("/create_thread")
 async def create_thread_router(azure_ai_client: AIProjectClientDependency):
+    from app.services.threads import create_thread
+
     return await create_thread(azure_ai_client)
 
 
 @tracer.start_as_current_span(name="get_thread")
 @router.get("/get_thread")
-async def get_thread_router(thread_input: ChatGetThreadInput,
+async def get_thread_router(thread_input: Annotated[ChatGetThreadInput, Query()],
                             azure_ai_client: AIProjectClientDependency):
-    return await get_thread(thread_input.thread_id, azure_ai_client)
+    from app.services.threads import get_thread, stream_thread
+
+    try:
+        if thread_input.stream:
+            return StreamingResponse(
+                await stream_thread(thread_input, azure_ai_client),
+                media_type="application/x-ndjson",
+            )
+
+        return await get_thread(thread_input, azure_ai_client)
+    except ValueError as e:  # A cursor that is not a message of the thread
+        raise HTTPException(status_code=400, detail=str(e)) from e
 
 
 @tracer.start_as_current_span(name="get_image_contents")
@@ -55,42 +87,170 @@ async def get_file_path_annotations(thread_input: ChatGetImageContents,
 
 @tracer.start_as_current_span(name="get_image")
 @router.get("/get_image", response_class=Response)
-async def get_image(thread_input: ChatGetImageInput,
+async def get_image(thread_input: Annotated[ChatGetImageInput, Query()],
+                    request: Request,
                     azure_ai_client: AIProjectClientDependency):
-    file_content_stream = await azure_ai_client.agents.files.get_content(thread_input.file_id)
+    cache_control = f"private, max-age={get_settings().image_cache_max_age_seconds}, immutable"
+
+    if get_settings().image_cache_enabled:
+        entry = await get_create_image_cache().get(thread_input.file_id)
+        if entry is not None:
+            etag = f'"{entry.sha256}"'
+            headers = {"ETag": etag, "Cache-Control": cache_control}
+            if_none_match = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+            if etag in if_none_match or "*" in if_none_match:
+                return Response(status_code=304, headers=headers)
+
+            # Serves Range and If-Range requests from the blob on disk
+            return FileResponse(entry.path, media_type=entry.media_type, headers=headers)
+
+    file_info, file_content_stream = await asyncio.gather(
+        azure_ai_client.agents.files.get(thread_input.file_id),
+        azure_ai_client.agents.files.get_content(thread_input.file_id),
+    )
     if not file_content_stream:
         raise RuntimeError(f"No content retrievable for file ID '{thread_input.file_id}'.")
 
-    chunks = []
-    async for chunk in file_content_stream:
-        if isinstance(chunk, (bytes, bytearray)):
-            chunks.append(chunk)
-        else:
-            raise TypeError(f"Expected bytes or bytearray, got {type(chunk).__name__}")
+    # Agent outputs aren't all PNG charts, so the type comes from the file's name or its first bytes
+    media_type, file_content_stream = await detect_media_type(file_info.filename, file_content_stream)
 
-    image_data = b"".join(chunks)
+    # Streamed straight through, as the file is only buffered on disk by the cache
+    if get_settings().image_cache_enabled:
+        file_content_stream = get_create_image_cache().tee(thread_input.file_id, file_content_stream,
+                                                           media_type=media_type)
 
-    return Response(content=image_data, media_type="image/png")
+    return StreamingResponse(file_content_stream,
+                             media_type=media_type,
+                             headers={"Cache-Control": cache_control})
 
 
 @tracer.start_as_current_span(name="chat")
 @router.post("/chat")
 async def post_chat(chat_input: ChatInput):
-    intermediate_message, close, queue = build_chat_context()
-    chat_context_var.set((intermediate_message, close, queue))
+    from app.process_framework.processes.cloud_service_onboarding_process import \
+        get_process_prompt_hash
+    from app.services.chat import build_chat_results, get_result_cache_key
+    from app.services.runs import (OnboardingRun, build_flight_key,
+                                   current_run_var, get_create_run_registry)
+
+    if get_settings().result_cache_enabled:
+        cached_result = await get_create_result_cache().get(get_result_cache_key(chat_input.content))
+        if cached_result is not None:
+            return StreamingResponse(
+                replay_cached_result(cached_result, chat_input.thread_id),
+                media_type="text/event-stream",
+            )
+
+    registry = get_create_run_registry()
+    channel = build_stream_channel()
+
+    flight_key = None
+    if get_settings().single_flight_enabled:
+        flight_key = build_flight_key(chat_input.content, get_process_prompt_hash())
+        run = registry.join_flight(flight_key, chat_input.thread_id)
+        if run is not None:
+            replay = await run.broadcast.subscribe(channel)
+            return StreamingResponse(
+                event_generator(run, channel, replay, thread_id=chat_input.thread_id),
+                media_type="text/event-stream",
+            )
+
+    scheduler = get_create_run_scheduler()
+    try:
+        ticket = scheduler.admit()
+    except SchedulerSaturatedError as e:
+        raise HTTPException(status_code=429,
+                            detail=str(e),
+                            headers={"Retry-After": str(e.retry_after)}) from e
+
+    intermediate_message, close, broadcast = build_chat_context(chat_input.thread_id)
+    chat_context_var.set((intermediate_message, close, broadcast))
+
+    run = OnboardingRun(thread_id=chat_input.thread_id, broadcast=broadcast, flight_key=flight_key)
+    current_run_var.set(run)
+    # The stream that started the run paces it, so a slow client is never cut off from its own run
+    replay = await broadcast.subscribe(channel, backpressure=True)
+
+    async def post_queue_position(position: int):
+        await intermediate_message(StreamingQueuePositionOutput(
+            thread_id=chat_input.thread_id,
+            position=position,
+        ))
+
+    run.task = scheduler.start(ticket=ticket,
+                               run_function=partial(build_chat_results, chat_input=chat_input),
+                               on_position=post_queue_position)
+    registry.register(run)
 
-    asyncio.create_task(
-        build_chat_results(chat_input=chat_input)
+    return StreamingResponse(
+        event_generator(run, channel, replay, thread_id=chat_input.thread_id),
+        media_type="text/event-stream",
     )
 
-    async def event_generator():
-        while True:
-            event = await queue.get()
-            if event is None:  # End of stream
-                break
-            yield event
+
+@tracer.start_as_current_span(name="chat_attach")
+@router.post("/chat/attach")
+async def post_chat_attach(chat_attach_input: ChatAttachInput):
+    from app.services.runs import get_create_run_registry
+
+    run = get_create_run_registry().attach(chat_attach_input.thread_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"No run in progress for thread '{chat_attach_input.thread_id}'.")
+    if not run.broadcast.replayable:
+        raise HTTPException(status_code=409, detail=f"The run for thread '{chat_attach_input.thread_id}' "
+                                                    f"is too large to replay.")
+
+    channel = build_stream_channel()
+    replay = await run.broadcast.subscribe(channel)
 
     return StreamingResponse(
-        event_generator(),
+        event_generator(run, channel, replay, thread_id=chat_attach_input.thread_id),
         media_type="text/event-stream",
     )
+
+
+async def replay_cached_result(cached_result: CachedResult, thread_id: str):
+    from app.services.threads import add_agent_messages
+
+    async for line in replay_frames(cached_result.frames,
+                                    thread_id=thread_id,
+                                    delay_ms=get_settings().result_cache_replay_delay_ms):
+        yield line
+
+    # Before the stream ends, so that the client finds the output on its thread like after a run
+    try:
+        await add_agent_messages(thread_id=thread_id,
+                                 contents=cached_result.step_outputs,
+                                 azure_ai_client=get_create_ai_project_client())
+    except Exception as e:
+        logger.error(f"Error adding the cached result to thread {thread_id}: {e}")
+
+
+async def event_generator(run: "OnboardingRun", channel: StreamChannel, replay: list[ChatOutput], thread_id: str):
+    from app.services.runs import get_create_run_registry
+
+    # A client that joined the run of another thread gets its frames addressed to its own
+    # thread, without the queue positions of the run it joined
+    joined = thread_id != run.thread_id
+
+    def encode(event: ChatOutput) -> bytes | None:
+        if not joined:
+            return encode_chat_output(event)
+        if event.content_type == ContentTypeEnum.QUEUE_POSITION:
+            return None
+        return encode_chat_output(readdress_chat_output(event, thread_id))
+
+    try:
+        for event in replay:
+            if (line := encode(event)) is not None:
+                yield line
+
+        while (event := await channel.get()) is not None:
+            if (line := encode(event)) is not None:
+                yield line
+    finally:
+        # The stream ended before the run did, so the client went away or, having joined the run, fell
+        # behind and was detached
+        if not run.broadcast.closed:
+            run.broadcast.unsubscribe(channel)
+            get_create_run_registry().detach(run)
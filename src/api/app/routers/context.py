@@ -1,25 +1,53 @@
-import asyncio
 import contextvars
 
+from app.config import get_settings
+from app.models.content_type_enum import ContentTypeEnum
+from app.services.stream_broadcast import StreamBroadcast
+from app.services.stream_channel import (DEFAULT_POLICIES,
+                                         BackpressurePolicyEnum,
+                                         StreamChannel)
+from app.services.streaming import FrameCoalescer
+
 # Create a context variable to store request-specific data
 chat_context_var = contextvars.ContextVar("chat_context")
 
 # Function to initialize the context (per request)
 
 
-def build_chat_context():
-    queue = asyncio.Queue()
+def build_chat_context(thread_id: str):
+    broadcast = StreamBroadcast(thread_id=thread_id, max_history_bytes=get_settings().stream_replay_max_bytes)
+
+    coalescer = FrameCoalescer(
+        sink=broadcast.publish,
+        max_delay_ms=get_settings().stream_coalesce_max_delay_ms,
+        max_bytes=get_settings().stream_coalesce_max_bytes,
+    )
 
     async def post_intermediate_message(event):
-        await queue.put(event)
+        await coalescer.post(event)
 
     async def close():
-        await queue.put(None)  # Signals to close the stream
+        await coalescer.flush()
+        await broadcast.close()  # Signals to close the stream
+
+    return post_intermediate_message, close, broadcast
+
+
+# Function to initialize the stream for each client reading a run
+
 
-    return post_intermediate_message, close, queue
+def build_stream_channel():
+    return StreamChannel(
+        high_water_mark=get_settings().stream_channel_high_water_mark,
+        policies=DEFAULT_POLICIES | {
+            ContentTypeEnum.MARKDOWN: BackpressurePolicyEnum(get_settings().stream_channel_text_policy),
+        },
+        merge_max_bytes=get_settings().stream_channel_merge_max_bytes,
+    )
 
 
 __all__ = [
     "chat_context_var",
     "build_chat_context",
+    "build_stream_channel",
 ]
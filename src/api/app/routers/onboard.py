@@ -0,0 +1,36 @@
+import logging
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from opentelemetry import trace
+
+from app.config import get_settings
+from app.models.batch_onboarding_input import BatchOnboardingInput
+
+logger = logging.getLogger("uvicorn.error")
+tracer = trace.get_tracer(__name__)
+
+router = APIRouter()
+
+
+@tracer.start_as_current_span(name="onboard_batch")
+@router.post("/onboard/batch")
+async def post_onboard_batch(batch_input: BatchOnboardingInput):
+    # Built on Semantic Kernel, so imported on first use rather than when the app is loaded
+    from app.services.batch import BatchOnboarding
+
+    if len(batch_input.service_names) > get_settings().batch_max_services:
+        raise HTTPException(status_code=400,
+                            detail=f"A batch can onboard at most {get_settings().batch_max_services} services.")
+
+    max_parallelism = min(batch_input.max_parallelism or get_settings().batch_max_parallelism,
+                          get_settings().batch_max_parallelism)
+
+    batch = BatchOnboarding(service_names=batch_input.service_names,
+                            max_parallelism=max_parallelism,
+                            high_water_mark=get_settings().stream_channel_high_water_mark)
+
+    return StreamingResponse(
+        batch.stream(),
+        media_type="application/x-ndjson",
+    )
@@ -1,9 +1,24 @@
 from fastapi import APIRouter, Response
 
+from app.services.health import (CRITICAL_DEPENDENCIES,
+                                 get_create_health_monitor)
+from app.services.warm_up import get_create_warm_up
+
 router = APIRouter()
 
 
 @router.get("/readiness")
 async def readiness_probe(response: Response):
+    warm_up = get_create_warm_up()
+    if not warm_up.ready:
+        response.status_code = 503
+        return {"status": "Not ready", "warm_up": warm_up.snapshot().model_dump()}
+
+    dependencies = {name: result.model_dump() for name, result in get_create_health_monitor().snapshot().items()}
+
+    if any(dependencies[name]["status"] != 200 for name in CRITICAL_DEPENDENCIES):
+        response.status_code = 503
+        return {"status": "Not ready", "warm_up": warm_up.snapshot().model_dump(), "dependencies": dependencies}
+
     response.status_code = 200
-    return {"status": "Ready"}
+    return {"status": "Ready", "warm_up": warm_up.snapshot().model_dump(), "dependencies": dependencies}
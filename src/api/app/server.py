@@ -0,0 +1,126 @@
+"""Runs the API in worker processes forked from a preloading master.
+
+The master binds the socket, loads the app along with the SDKs it otherwise
+imports on first use, and resolves the agents into the startup state file.
+It then forks the workers, which start with everything imported and use the
+agents the master resolved rather than looking them up again. Workers that
+exit are replaced until the master is asked to stop.
+
+In-flight runs live in the worker that started them, so reattaching to a run
+or joining its flight only works on that worker, and the scheduler limits
+apply per worker. Run from ``src/api`` with the usual ``.env``::
+
+    python -m app.server --workers 4
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import signal
+import time
+from typing import Callable
+
+import uvicorn
+
+from app.config import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Delay before replacing a worker that exited, so a worker failing on startup doesn't spin the master
+RESPAWN_DELAY_SECONDS = 1
+
+
+def run(app: str,
+        host: str,
+        port: int,
+        workers: int,
+        prepare: Callable[[], None] | None = None,
+        log_level: str = "info"):
+    config = uvicorn.Config(app, host=host, port=port, log_level=log_level)
+    sock = config.bind_socket()
+
+    config.load()
+    if prepare is not None:
+        prepare()
+
+    # Objects allocated so far are shared with the workers, keep the collector from touching their pages
+    gc.freeze()
+
+    def spawn() -> int:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            exit_code = 0
+            try:
+                uvicorn.Server(config).run(sockets=[sock])
+            except BaseException:
+                logger.exception(f"Worker {os.getpid()} failed")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        logger.info(f"Started worker {pid}")
+        return pid
+
+    children = {spawn() for _ in range(workers)}
+    stopping = False
+
+    def stop(signum: int, _):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+
+        if not stopping:
+            logger.warning(f"Worker {pid} exited with code {os.waitstatus_to_exitcode(status)}, replacing it")
+            time.sleep(RESPAWN_DELAY_SECONDS)
+            if not stopping:
+                children.add(spawn())
+
+    sock.close()
+    logger.info("All workers stopped")
+
+
+def prepare_workers():
+    from app.preload import preload
+    from app.services.agents import resolve_startup_state
+
+    preload()
+
+    started = time.perf_counter()
+    try:
+        asyncio.run(resolve_startup_state())
+        logger.info(f"Resolved the agents for the workers in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        # Every worker looks the agents up itself instead
+        logger.error(f"Error resolving the agents for the workers: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=get_settings().api_workers)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    run("app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        prepare=prepare_workers,
+        log_level=args.log_level)
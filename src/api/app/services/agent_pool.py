@@ -0,0 +1,158 @@
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterator
+
+from opentelemetry import metrics
+from semantic_kernel.agents.azure_ai.azure_ai_agent import (AzureAIAgent,
+                                                            AzureAIAgentThread)
+
+from app.config import get_settings
+from app.services.dependencies import AIProjectClient
+from app.services.threads import get_thread_client
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+invocations_counter = meter.create_counter(
+    name="cloud_service_onboarding.agent_pool.invocations",
+    unit="{invocation}",
+    description="Number of agent invocations routed to each deployment",
+)
+cooldowns_counter = meter.create_counter(
+    name="cloud_service_onboarding.agent_pool.cooldowns",
+    unit="{cooldown}",
+    description="Number of times a deployment was taken out of rotation because it was rate limited",
+)
+
+
+@dataclass(eq=False)
+class AgentPoolMember:
+    name: str  # Name the agent is invoked by, the same on every deployment
+    agent: AzureAIAgent
+    client: AIProjectClient
+    deployment_name: str
+    weight: int = 1
+    outstanding_tokens: int = 0
+    cooldown_until: float = 0
+    current_weight: int = 0  # Smooth weighted round-robin state
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+
+class AgentPool:
+    """Routes agent invocations across the deployments an agent is registered on.
+
+    A thread belongs to one AI project, so an invocation is only routed to the
+    deployments of its thread's project. Among those, members are picked by
+    least outstanding tokens or by smooth weighted round-robin. A member that
+    was rate limited is out of rotation until its Retry-After has passed,
+    unless every member of the project is.
+    """
+
+    def __init__(self, strategy: str, default_cooldown_seconds: float):
+        if strategy not in ("least_outstanding_tokens", "weighted_round_robin"):
+            raise ValueError(f"Unknown agent pool strategy '{strategy}'")
+
+        self._strategy = strategy
+        self._default_cooldown_seconds = default_cooldown_seconds
+        self._members: list[AgentPoolMember] = []
+
+    @property
+    def members(self) -> list[AgentPoolMember]:
+        return self._members
+
+    def add(self, member: AgentPoolMember):
+        self._members.append(member)
+
+    def select_client(self, name: str, exclude: AgentPoolMember | None = None) -> AIProjectClient:
+        """Returns the client of the least loaded project ``name`` is registered in, for a new scratch thread."""
+        members = self._exclude(self._get_members(name), exclude)
+        available = [member for member in members if not member.cooling_down] or members
+
+        load: dict[int, int] = {}
+        for member in available:
+            load[id(member.client)] = load.get(id(member.client), 0) + member.outstanding_tokens
+        return min(available, key=lambda member: load[id(member.client)]).client
+
+    @contextmanager
+    def lease(self,
+              name: str,
+              thread: AzureAIAgentThread,
+              estimated_tokens: int,
+              exclude: AgentPoolMember | None = None) -> Iterator[AgentPoolMember]:
+        """Picks the member to invoke ``name`` on for ``thread`` and counts its tokens as outstanding.
+
+        ``exclude`` is only picked if no other member is registered in the thread's project.
+        """
+        client = get_thread_client(thread)
+        members = [member for member in self._get_members(name) if member.client is client]
+        if not members:
+            raise ValueError(f"{name} is not registered in the project of thread {thread.id}.")
+        members = self._exclude(members, exclude)
+
+        member = self._pick(members)
+        member.outstanding_tokens += estimated_tokens
+        invocations_counter.add(1, {"deployment": member.deployment_name})
+        try:
+            yield member
+        finally:
+            member.outstanding_tokens -= estimated_tokens
+
+    def cool_down(self, member: AgentPoolMember, retry_after: float | None):
+        seconds = retry_after if retry_after is not None else self._default_cooldown_seconds
+        member.cooldown_until = max(member.cooldown_until, time.monotonic() + seconds)
+        cooldowns_counter.add(1, {"deployment": member.deployment_name})
+        logger.warning(f"Deployment {member.deployment_name} was rate limited, "
+                       f"taking it out of rotation for {seconds:.0f}s")
+
+    def _get_members(self, name: str) -> list[AgentPoolMember]:
+        members = [member for member in self._members if member.name == name]
+        if not members:
+            raise ValueError(f"{name} not found.")
+        return members
+
+    @staticmethod
+    def _exclude(members: list[AgentPoolMember], exclude: AgentPoolMember | None) -> list[AgentPoolMember]:
+        return [member for member in members if member is not exclude] or members
+
+    def _pick(self, members: list[AgentPoolMember]) -> AgentPoolMember:
+        available = [member for member in members if not member.cooling_down]
+        if not available:
+            # Every deployment is rate limited, so use the one available again first
+            return min(members, key=lambda member: member.cooldown_until)
+
+        if self._strategy == "least_outstanding_tokens":
+            return min(available, key=lambda member: member.outstanding_tokens / member.weight)
+
+        total_weight = sum(member.weight for member in available)
+        for member in available:
+            member.current_weight += member.weight
+        member = max(available, key=lambda member: member.current_weight)
+        member.current_weight -= total_weight
+        return member
+
+
+def estimate_invocation_tokens(message: str, additional_instructions: str) -> int:
+    # Roughly four characters per prompt token, plus the completion
+    return (len(message) + len(additional_instructions)) // 4 + get_settings().agent_pool_estimated_completion_tokens
+
+
+@lru_cache
+def get_create_agent_pool() -> AgentPool:
+    return AgentPool(
+        strategy=get_settings().agent_pool_strategy,
+        default_cooldown_seconds=get_settings().agent_pool_default_cooldown_seconds,
+    )
+
+
+__all__ = [
+    "AgentPool",
+    "AgentPoolMember",
+    "estimate_invocation_tokens",
+    "get_create_agent_pool",
+]
@@ -1,33 +1,101 @@
+import asyncio
 from functools import lru_cache
 from typing import Annotated, List
 
 from fastapi import Depends
 from semantic_kernel import Kernel
 from semantic_kernel.agents import Agent
+from semantic_kernel.agents.azure_ai.azure_ai_agent import AzureAIAgent
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 
-from app.agents.cloud_security_agent import create_cloud_security_agent
-from app.config.config import get_settings
-from app.services.dependencies import (get_create_ai_project_client,
+from app.agents.cloud_security_agent import \
+    get_cloud_security_agent_definition
+from app.config.config import AgentPoolMemberSettings, get_settings
+from app.services.agent_pool import AgentPoolMember, get_create_agent_pool
+from app.services.dependencies import (create_azure_ai_client,
+                                       get_create_ai_project_client,
+                                       get_create_ai_project_client_for,
                                        get_create_async_azure_ai_client)
 
 
+def get_agent_pool_members() -> list[AgentPoolMemberSettings]:
+    return get_settings().agent_pool_members or [
+        AgentPoolMemberSettings(deployment_name=get_settings().azure_openai_model_deployment_name)
+    ]
+
+
+def get_agent_deployments() -> list[tuple[str, str]]:
+    """Returns the endpoint and deployment of every agent, the default deployment first."""
+    settings = get_settings()
+
+    # The same agent definition on every deployment of the pool, one agent per deployment of each project
+    return list(dict.fromkeys(
+        [(settings.azure_ai_agent_endpoint, settings.azure_openai_model_deployment_name)]
+        + [(member.endpoint or settings.azure_ai_agent_endpoint, member.deployment_name)
+           for member in get_agent_pool_members()]
+    ))
+
+
+async def resolve_startup_state():
+    """Looks up or creates every agent, recording them in the startup state for the workers to use.
+
+    Runs in the preloading master before it forks, on clients of its own, as
+    clients can't be shared with the event loops of the workers. The
+    deployments of a project are resolved one after the other, so the
+    per-project locks the workers inherit are never bound to this loop.
+    """
+    deployments: dict[str, list[str]] = {}
+    for endpoint, deployment_name in get_agent_deployments():
+        deployments.setdefault(endpoint, []).append(deployment_name)
+
+    async def resolve_project(endpoint: str, deployment_names: list[str]):
+        async with create_azure_ai_client(endpoint) as client:
+            for deployment_name in deployment_names:
+                await get_cloud_security_agent_definition(client=client, deployment_name=deployment_name)
+
+    await asyncio.gather(*(resolve_project(endpoint, deployment_names)
+                           for endpoint, deployment_names in deployments.items()))
+
+
 async def setup_agents():
+    settings = get_settings()
+    members = get_agent_pool_members()
+    deployments = get_agent_deployments()
+
+    # Looking up or creating each agent is independent of the others and of the chat client
+    async_azure_ai_client, *definitions = await asyncio.gather(
+        get_create_async_azure_ai_client(),
+        *(get_cloud_security_agent_definition(client=get_create_ai_project_client_for(endpoint),
+                                              deployment_name=deployment_name)
+          for endpoint, deployment_name in deployments),
+    )
+
     # kernel = await get_create_kernel()
     kernel = Kernel()
     kernel.add_service(AzureChatCompletion(
-        async_client=await get_create_async_azure_ai_client(),
-        deployment_name=get_settings().azure_openai_model_deployment_name,
+        async_client=async_azure_ai_client,
+        deployment_name=settings.azure_openai_model_deployment_name,
     ))
 
-    cloud_security_agent = await create_cloud_security_agent(
-        client=get_create_ai_project_client(),
-        kernel=kernel
-    )
+    agents = {
+        deployment: AzureAIAgent(client=get_create_ai_project_client_for(deployment[0]),
+                                 definition=definition,
+                                 kernel=kernel)
+        for deployment, definition in zip(deployments, definitions)
+    }
 
     agent_manager = get_create_agent_manager()
 
-    agent_manager.append(cloud_security_agent)
+    agent_manager.append(agents[deployments[0]])
+
+    agent_pool = get_create_agent_pool()
+    for member in members:
+        endpoint = member.endpoint or settings.azure_ai_agent_endpoint
+        agent_pool.add(AgentPoolMember(name="cloud-security-agent",
+                                       agent=agents[(endpoint, member.deployment_name)],
+                                       client=get_create_ai_project_client_for(endpoint),
+                                       deployment_name=member.deployment_name,
+                                       weight=member.weight))
 
 async def delete_agents():
     agent_manager = get_create_agent_manager()
@@ -50,4 +118,4 @@ def get_create_agent_manager() -> List[Agent]:
 
 AgentManagerDependency = Annotated[List[Agent], Depends(get_create_agent_manager)]
 
-__all__ = ['setup_agents', 'delete_agents', 'get_create_agent_manager', 'AgentManagerDependency']
+__all__ = ['setup_agents', 'delete_agents', 'get_create_agent_manager', 'resolve_startup_state', 'AgentManagerDependency']
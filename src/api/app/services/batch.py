@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import time
+
+from opentelemetry import metrics, trace
+from semantic_kernel.agents.azure_ai.azure_ai_agent import AzureAIAgentThread
+
+from app.config import get_settings
+from app.models.chat_output import ChatOutput
+from app.models.streaming_batch_summary_output import (
+    BatchServiceSummary, StreamingBatchSummaryOutput)
+from app.models.streaming_text_output import StreamingTextOutput
+from app.models.token_usage import TokenUsage
+from app.routers.context import build_chat_context, build_stream_channel
+from app.services.chat import run_onboarding_process, store_chat_results
+from app.services.dependencies import get_create_ai_project_client
+from app.services.result_cache import normalize_service_name
+from app.services.runs import (OnboardingRun, current_run_var,
+                               get_create_run_registry, mark_run_failed)
+from app.services.stream_channel import StreamChannel
+from app.services.streaming import chat_output_to_dict, serialize_chat_output
+from app.services.threads import create_thread, get_thread_token_usage
+
+logger = logging.getLogger("uvicorn.error")
+tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
+
+services_counter = meter.create_counter(
+    name="cloud_service_onboarding.batch.services",
+    unit="{service}",
+    description="Number of services onboarded in batches, by outcome",
+)
+service_duration_histogram = meter.create_histogram(
+    name="cloud_service_onboarding.batch.service_duration",
+    unit="s",
+    description="Time taken to onboard one service of a batch",
+)
+
+
+class BatchOnboarding:
+    """Onboards a batch of services and multiplexes their frames onto one NDJSON stream.
+
+    At most ``max_parallelism`` services run at a time, each on a new thread.
+    Every line is tagged with the service name and thread id, and the stream
+    ends with a summary of each service. If the client disconnects, services
+    still running are cancelled and services not yet started are skipped.
+    """
+
+    def __init__(self, service_names: list[str], max_parallelism: int, high_water_mark: int):
+        # Identical names would only onboard the same service twice
+        unique_service_names: dict[str, str] = {}
+        for name in service_names:
+            unique_service_names.setdefault(normalize_service_name(name), name)
+        self._service_names = list(unique_service_names.values())
+        self._semaphore = asyncio.Semaphore(max_parallelism)
+        self._lines: asyncio.Queue[str | None] = asyncio.Queue(maxsize=high_water_mark)
+        self._runs: list[OnboardingRun] = []
+        self._cancel_tasks: set[asyncio.Task] = set()
+
+    async def stream(self):
+        batch_task = asyncio.create_task(self._run_batch())
+
+        finished = False
+        try:
+            while (line := await self._lines.get()) is not None:
+                yield line
+            finished = True
+        finally:
+            if not finished:
+                self._cancel(batch_task)
+
+    def _cancel(self, batch_task: asyncio.Task):
+        logger.info(f"Client disconnected from batch of {len(self._service_names)} service(s), cancelling it")
+
+        # Cancelling runs is scheduled because the response is being torn down
+        registry = get_create_run_registry()
+        for run in self._runs:
+            task = asyncio.create_task(registry.cancel(run))
+            self._cancel_tasks.add(task)
+            task.add_done_callback(self._cancel_tasks.discard)
+
+        batch_task.cancel()
+
+    async def _run_batch(self):
+        with tracer.start_as_current_span(name="run_onboarding_batch"):
+            started = time.perf_counter()
+            try:
+                summaries = await asyncio.gather(*(self._onboard_service(name) for name in self._service_names))
+
+                await self._lines.put(serialize_chat_output(StreamingBatchSummaryOutput(
+                    thread_id="",
+                    services=summaries,
+                    duration_seconds=time.perf_counter() - started,
+                )))
+            except Exception as e:
+                logger.error(f"Error running onboarding batch: {e}")
+
+            await self._lines.put(None)  # End of stream
+
+    async def _onboard_service(self, service_name: str) -> BatchServiceSummary:
+        async with self._semaphore:
+            started = time.perf_counter()
+            azure_ai_client = get_create_ai_project_client()
+
+            try:
+                thread_id = (await create_thread(azure_ai_client)).thread_id
+            except Exception as e:
+                logger.error(f"Error creating a thread for {service_name}: {e}")
+                return self._summarize(service_name, "", started, succeeded=False, error=str(e), token_usage=TokenUsage())
+
+            post_intermediate_message, close, broadcast = build_chat_context(thread_id)
+
+            run = OnboardingRun(thread_id=thread_id, broadcast=broadcast, token_usage=TokenUsage())
+            run.task = asyncio.current_task()
+            current_run_var.set(run)
+            self._runs.append(run)
+
+            channel = build_stream_channel()
+            await broadcast.subscribe(channel, backpressure=True)  # The batch stream paces its runs
+            forwarder = asyncio.create_task(self._forward(service_name, thread_id, channel))
+
+            try:
+                await run_onboarding_process(cloud_service_name=service_name,
+                                             thread=AzureAIAgentThread(client=azure_ai_client, thread_id=thread_id),
+                                             post_intermediate_message=post_intermediate_message)
+            except Exception as e:
+                logger.error(f"Error onboarding {service_name}: {e}")
+                mark_run_failed(str(e))
+
+                await post_intermediate_message(StreamingTextOutput(
+                    text=f"\n***\n**Error onboarding {service_name}**\n{e}\n",
+                    thread_id=thread_id,
+                ))
+            finally:
+                await close()
+
+            await forwarder
+
+            try:
+                run.token_usage.add(await get_thread_token_usage(thread_id=thread_id,  # type: ignore
+                                                                 azure_ai_client=azure_ai_client,
+                                                                 created_after=run.started_at))
+            except Exception as e:
+                logger.error(f"Error reading token usage of thread {thread_id}: {e}")
+
+            if not run.failed and not run.resumes and broadcast.replayable and get_settings().result_cache_enabled:
+                await store_chat_results(service_name, broadcast.frames, list(run.step_outputs.values()))
+
+            return self._summarize(service_name, thread_id, started, succeeded=not run.failed,
+                                   error=run.error, token_usage=run.token_usage)  # type: ignore
+
+    async def _forward(self, service_name: str, thread_id: str, channel: StreamChannel):
+        while (frame := await channel.get()) is not None:
+            await self._lines.put(serialize_batch_frame(service_name, thread_id, frame))
+
+    @staticmethod
+    def _summarize(service_name: str, thread_id: str, started: float, succeeded: bool,
+                   error: str | None, token_usage: TokenUsage) -> BatchServiceSummary:
+        duration = time.perf_counter() - started
+
+        services_counter.add(1, {"succeeded": succeeded})
+        service_duration_histogram.record(duration, {"succeeded": succeeded})
+
+        return BatchServiceSummary(
+            service_name=service_name,
+            thread_id=thread_id,
+            succeeded=succeeded,
+            duration_seconds=duration,
+            error=error,
+            token_usage=token_usage,
+        )
+
+
+def serialize_batch_frame(service_name: str, thread_id: str, chat_output: ChatOutput) -> str:
+    # Frames are posted with a placeholder thread id, so tag them with the service's real one
+    return json.dumps({
+        **chat_output_to_dict(chat_output),
+        "thread_id": thread_id,
+        "service_name": service_name,
+    }) + "\n"
+
+
+__all__ = [
+    "BatchOnboarding",
+    "serialize_batch_frame",
+]
@@ -1,24 +1,36 @@
-import json
 import logging
+from typing import Awaitable, Callable
 
-from httpx import get
 from opentelemetry import trace
 from semantic_kernel import Kernel
+from semantic_kernel.agents.azure_ai.azure_ai_agent import AzureAIAgentThread
 from semantic_kernel.contents import AuthorRole
 from semantic_kernel.processes.kernel_process import KernelProcessEvent
 from semantic_kernel.processes.local_runtime.local_kernel_process import start
 
+from app.agents.cloud_security_agent import get_knowledge_base_hash
+from app.config import get_settings
 from app.models.chat_input import ChatInput
 from app.models.chat_output import ChatOutput
 from app.models.content_type_enum import ContentTypeEnum
-from app.models.streaming_text_output import StreamingTextOutput, serialize_streaming_text_output
+from app.models.streaming_text_output import StreamingTextOutput
 from app.process_framework.models.retrieve_internal_security_recommendations_step_parameters import \
     RetrieveInternalSecurityRecommendationsStepParameters
-from app.process_framework.processes.cloud_service_onboarding_process import \
-    build_process_cloud_service_onboarding
+from app.process_framework.processes.cloud_service_onboarding_process import (
+    build_process_cloud_service_onboarding, get_process_prompt_hash)
 from app.routers.context import chat_context_var
+from app.services.agent_pool import get_create_agent_pool
 from app.services.dependencies import get_create_ai_project_client
-from app.services.threads import get_agent_thread
+from app.services.result_cache import (build_result_cache_key,
+                                       get_create_result_cache)
+from app.services.resilience import get_create_retry_budget
+from app.services.runs import (OnboardingRun, current_run_var,
+                               current_step_var, mark_run_failed,
+                               register_branch_thread, release_branch_thread)
+from app.services.streaming import serialize_chat_output
+from app.services.message_store import get_create_message_store
+from app.services.threads import (add_agent_messages, get_agent_thread,
+                                  sync_thread_quietly)
 
 logger = logging.getLogger("uvicorn.error")
 tracer = trace.get_tracer(__name__)
@@ -26,23 +38,16 @@ tracer = trace.get_tracer(__name__)
 
 async def build_chat_results(chat_input: ChatInput):
     with tracer.start_as_current_span(name="build_chat_results"):
-        post_intermediate_message, _, queue = chat_context_var.get()
+        post_intermediate_message, close, broadcast = chat_context_var.get()
+        run = current_run_var.get()
 
         try:
 
             thread = await get_agent_thread(thread_id=chat_input.thread_id, azure_ai_client=get_create_ai_project_client())
 
-            process = build_process_cloud_service_onboarding(thread=thread,
-                                                             post_intermediate_message=post_intermediate_message)
-
-            async with await start(
-                process=process,
-                kernel=Kernel(),
-                initial_event=KernelProcessEvent(id="Start", data=RetrieveInternalSecurityRecommendationsStepParameters(
-                    cloud_service_name=chat_input.content,
-                )),
-            ) as process_context:
-                process_state = await process_context.get_state()
+            await run_onboarding_process(cloud_service_name=chat_input.content,
+                                         thread=thread,
+                                         post_intermediate_message=post_intermediate_message)
 
         except Exception as e:
             error_message = f"""
@@ -52,23 +57,133 @@ async def build_chat_results(chat_input: ChatInput):
 """
             logger.error(error_message)
 
-            await post_intermediate_message(json.dumps(
-                obj=StreamingTextOutput(
-                    content_type=ContentTypeEnum.MARKDOWN,
-                    text=error_message,
-                    thread_id=chat_input.thread_id,
-                ),
-                default=serialize_streaming_text_output,
-            ) + "\n")
+            mark_run_failed(str(e))
+
+            await post_intermediate_message(StreamingTextOutput(
+                content_type=ContentTypeEnum.MARKDOWN,
+                text=error_message,
+                thread_id=chat_input.thread_id,
+            ))
 
             # if cloud_security_agent is not None:
             #     await azure_ai_client.agents.delete_agent(agent_id=cloud_security_agent.id)
 
-        await queue.put(None)
+        # Before the stream ends, so that the joined clients find the output on their threads
+        if run is not None:
+            await copy_output_to_joined_threads(run)
+
+        await close()
+
+        # A resumed run's frames include the output of the failed attempt
+        if run is not None and not run.failed and not run.resumes and broadcast.replayable \
+                and get_settings().result_cache_enabled:
+            await store_chat_results(chat_input.content, broadcast.frames, list(run.step_outputs.values()))
+
+
+async def copy_output_to_joined_threads(run: OnboardingRun):
+    # Threads can still join while this runs, and are picked up by the loop
+    for thread_id in run.joined_thread_ids:
+        try:
+            await add_agent_messages(thread_id=thread_id,
+                                     contents=list(run.step_outputs.values()),
+                                     azure_ai_client=get_create_ai_project_client())
+        except Exception as e:
+            logger.error(f"Error copying the output of the run on thread {run.thread_id} to thread {thread_id}: {e}")
+
+
+async def run_onboarding_process(cloud_service_name: str,
+                                 thread: AzureAIAgentThread,
+                                 post_intermediate_message: Callable[[ChatOutput], Awaitable[None]]):
+    run = current_run_var.get()
+
+    # Reads of the thread go through to the agents service until the run has
+    # ended and its messages are written through to the message store
+    await get_create_message_store().mark_stale(thread.id)  # type: ignore
+
+    # The parallel public documentation branch runs on a scratch thread of its
+    # own, which can be in any project of the agent pool
+    public_documentation_thread = AzureAIAgentThread(
+        client=get_create_agent_pool().select_client("cloud-security-agent"))
+    try:
+        await public_documentation_thread.create()
+        register_branch_thread(public_documentation_thread)
+
+        post_step_message = post_intermediate_message
+        while True:
+            process = build_process_cloud_service_onboarding(thread=thread,
+                                                             public_documentation_thread=public_documentation_thread,
+                                                             post_intermediate_message=post_step_message)
+
+            if run is not None:
+                run.total_steps = len(process.steps)
+
+            async with await start(
+                process=process,
+                kernel=Kernel(),
+                # Sent as a dict so that each step of the fan-out validates it into its own parameter type
+                initial_event=KernelProcessEvent(id="Start", data=RetrieveInternalSecurityRecommendationsStepParameters(
+                    cloud_service_name=cloud_service_name,
+                ).model_dump()),
+            ) as process_context:
+                process_state = await process_context.get_state()
+
+            if not can_resume(run):
+                break
+
+            # Rerun the process. The steps that completed are served from the
+            # step cache, and their output, already streamed, is not posted again.
+            run.resumes += 1  # type: ignore
+            run.failed, run.error, run.retryable = False, None, False  # type: ignore
+            logger.info(f"Resuming run on thread {thread.id} after {len(run.completed_steps)} completed step(s)")  # type: ignore
+
+            await post_intermediate_message(StreamingTextOutput(
+                content_type=ContentTypeEnum.MARKDOWN,
+                text="\n***\n**Resuming from the last completed step**\n",
+                thread_id=thread.id,  # type: ignore
+            ))
+            post_step_message = skip_completed_steps(post_intermediate_message, set(run.completed_steps))  # type: ignore
+    finally:
+        await release_branch_thread(public_documentation_thread)
+        await sync_thread_quietly(thread.id, get_create_ai_project_client())  # type: ignore
+
+
+def can_resume(run: OnboardingRun | None) -> bool:
+    return run is not None and run.failed and run.retryable and get_settings().step_cache_enabled \
+        and run.resumes < get_settings().agent_max_resumes and get_create_retry_budget().try_withdraw()
+
+
+def skip_completed_steps(post_intermediate_message: Callable[[ChatOutput], Awaitable[None]],
+                         completed_steps: set[str]) -> Callable[[ChatOutput], Awaitable[None]]:
+    """Drops the frames of ``completed_steps``, whose output the client already received."""
+    async def post_step_message(chat_output: ChatOutput):
+        if current_step_var.get() not in completed_steps:
+            await post_intermediate_message(chat_output)
+
+    return post_step_message
+
+
+def get_result_cache_key(cloud_service_name: str) -> str:
+    return build_result_cache_key(cloud_service_name=cloud_service_name,
+                                  knowledge_base_hash=get_knowledge_base_hash(),
+                                  prompt_hash=get_process_prompt_hash())
 
 
+async def store_chat_results(cloud_service_name: str, frames: list[ChatOutput], step_outputs: list[str]):
+    try:
+        await get_create_result_cache().put(
+            key=get_result_cache_key(cloud_service_name),
+            service_name=cloud_service_name,
+            frames="".join(serialize_chat_output(frame) for frame in frames
+                           if frame.content_type != ContentTypeEnum.QUEUE_POSITION),
+            step_outputs=step_outputs,
+        )
+    except Exception as e:
+        logger.error(f"Error storing results for {cloud_service_name} in the result cache: {e}")
 
 
 __all__ = [
     "build_chat_results",
+    "get_result_cache_key",
+    "run_onboarding_process",
+    "store_chat_results",
 ]
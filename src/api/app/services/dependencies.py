@@ -1,30 +1,49 @@
 from functools import lru_cache
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated, Any
 
 from async_lru import alru_cache
-from azure.ai.projects.aio import AIProjectClient
-from azure.identity.aio import DefaultAzureCredential
 from fastapi import Depends
-from openai import AsyncAzureOpenAI
-from semantic_kernel import Kernel
-from semantic_kernel.agents.azure_ai.azure_ai_agent import AzureAIAgent
-from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
 
 from app.config import get_settings
 
+# The Azure AI, OpenAI and Semantic Kernel SDKs take seconds to import, so they are
+# only imported once a client is created rather than when the app is loaded
+if TYPE_CHECKING:
+    from azure.ai.projects.aio import AIProjectClient
+    from openai import AsyncAzureOpenAI
+    from semantic_kernel import Kernel
+
+
+def __getattr__(name: str) -> Any:
+    # Keeps "from app.services.dependencies import AIProjectClient" working for the modules built on it
+    if name == "AIProjectClient":
+        from azure.ai.projects.aio import AIProjectClient
+        return AIProjectClient
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def create_azure_ai_client(endpoint: str | None = None) -> "AIProjectClient":
+    from azure.identity.aio import DefaultAzureCredential
+    from semantic_kernel.agents.azure_ai.azure_ai_agent import AzureAIAgent
 
-def create_azure_ai_client() -> AIProjectClient:
     creds = DefaultAzureCredential()
 
     client = AzureAIAgent.create_client(
         credential=creds,
-        endpoint=get_settings().azure_ai_agent_endpoint
+        endpoint=endpoint or get_settings().azure_ai_agent_endpoint
     )
 
     return client
 
 
-async def create_async_azure_ai_client() -> AsyncAzureOpenAI:
+def get_client_endpoint(client: "AIProjectClient") -> str:
+    return client._config.endpoint  # type: ignore # The client doesn't expose its endpoint
+
+
+async def create_async_azure_ai_client() -> "AsyncAzureOpenAI":
+    from azure.ai.projects.aio import AIProjectClient
+    from azure.identity.aio import DefaultAzureCredential
+
     project_client = AIProjectClient(
         endpoint=get_settings().azure_ai_agent_endpoint,
         credential=DefaultAzureCredential()
@@ -37,7 +56,10 @@ async def create_async_azure_ai_client() -> AsyncAzureOpenAI:
     return async_azure_ai_client
 
 
-async def create_kernel() -> Kernel:
+async def create_kernel() -> "Kernel":
+    from semantic_kernel import Kernel
+    from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+
     kernel = Kernel()
 
     kernel.add_service(AzureChatCompletion(
@@ -49,29 +71,39 @@ async def create_kernel() -> Kernel:
 
 
 @lru_cache
-def get_create_ai_project_client() -> AIProjectClient:
+def get_create_ai_project_client() -> "AIProjectClient":
     return create_azure_ai_client()
 
 
+@lru_cache
+def get_create_ai_project_client_for(endpoint: str) -> "AIProjectClient":
+    # One client per AI project, the default project sharing the default client
+    if endpoint == get_settings().azure_ai_agent_endpoint:
+        return get_create_ai_project_client()
+    return create_azure_ai_client(endpoint)
+
+
 @alru_cache
-async def get_create_async_azure_ai_client() -> AsyncAzureOpenAI:
+async def get_create_async_azure_ai_client() -> "AsyncAzureOpenAI":
     return await create_async_azure_ai_client()
 
 
 @alru_cache
-async def get_create_kernel() -> Kernel:
+async def get_create_kernel() -> "Kernel":
     return await create_kernel()
 
-AIProjectClientDependency = Annotated[AIProjectClient, Depends(get_create_ai_project_client)]
-AsyncAzureAIClientDependency = Annotated[AsyncAzureOpenAI,
+AIProjectClientDependency = Annotated["AIProjectClient", Depends(get_create_ai_project_client)]
+AsyncAzureAIClientDependency = Annotated["AsyncAzureOpenAI",
                                          Depends(get_create_async_azure_ai_client)]
-KernelDependency = Annotated[Kernel, Depends(get_create_kernel)]
+KernelDependency = Annotated["Kernel", Depends(get_create_kernel)]
 
 __all__ = [
     "AIProjectClientDependency",
     "AsyncAzureAIClientDependency",
     "KernelDependency",
+    "get_client_endpoint",
     "get_create_ai_project_client",
+    "get_create_ai_project_client_for",
     "get_create_async_azure_ai_client",
     "get_create_kernel",
 ]
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from functools import lru_cache
+from typing import Awaitable, Callable
+
+from azure.ai.agents.models import VectorStoreStatus
+from opentelemetry import metrics
+from pydantic import BaseModel
+
+from app.config import get_settings
+from app.services.dependencies import get_create_ai_project_client
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+check_duration_histogram = meter.create_histogram(
+    name="cloud_service_onboarding.health.check_duration",
+    unit="ms",
+    description="Latency of each dependency health check, by dependency and result",
+)
+
+
+# Dependencies without which no run can succeed. The others are reported but don't take a
+# replica out of rotation: a Bing outage hits every replica at once, and the vector store
+# is briefly not completed while the knowledge base syncs.
+CRITICAL_DEPENDENCIES = {"model_deployment", "agent_service"}
+
+
+class DependencyHealth(BaseModel):
+    status: int = 503
+    latency_ms: float | None = None
+    last_checked_at: float | None = None
+    last_success_at: float | None = None
+    error: str | None = "Not checked yet"
+
+
+class HealthMonitor:
+    """Checks the dependencies of the API on a schedule of its own.
+
+    Each check is a cheap read of the dependency rather than a model call,
+    and the latest results are cached so that probes are answered instantly.
+    A result older than ``stale_after_seconds`` counts as failed, so a stuck
+    monitor doesn't keep reporting old successes.
+    """
+
+    def __init__(self,
+                 checks: dict[str, Callable[[], Awaitable[None]]],
+                 interval_seconds: float,
+                 timeout_seconds: float,
+                 stale_after_seconds: float):
+        self._checks = checks
+        self._interval_seconds = interval_seconds
+        self._timeout_seconds = timeout_seconds
+        self._stale_after_seconds = stale_after_seconds
+        self._results = {name: DependencyHealth() for name in checks}
+        self._task: asyncio.Task | None = None
+
+    def start(self, delay_first_check: bool = False):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(delay_first_check))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict[str, DependencyHealth]:
+        now = time.time()
+        results = {}
+        for name, result in self._results.items():
+            if result.status == 200 and now - result.last_checked_at > self._stale_after_seconds:  # type: ignore
+                result = result.model_copy(update={"status": 503, "error": "Health check result is stale"})
+            results[name] = result
+        return results
+
+    async def check_all(self):
+        await asyncio.gather(*(self._check(name, check) for name, check in self._checks.items()))
+
+    async def _run(self, delay_first_check: bool):
+        if delay_first_check:
+            await asyncio.sleep(self._interval_seconds)
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self._interval_seconds)
+
+    async def _check(self, name: str, check: Callable[[], Awaitable[None]]):
+        previous = self._results[name]
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(check(), timeout=self._timeout_seconds)
+            error = None
+        except asyncio.TimeoutError:
+            error = f"Timed out after {self._timeout_seconds}s"
+        except Exception as e:
+            error = str(e)
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        now = time.time()
+        check_duration_histogram.record(latency_ms, {"dependency": name, "result": "error" if error else "ok"})
+
+        if error is not None and previous.error != error:
+            logger.error(f"Health check of {name} failed: {error}")
+
+        self._results[name] = DependencyHealth(
+            status=503 if error else 200,
+            latency_ms=round(latency_ms, 1),
+            last_checked_at=now,
+            last_success_at=previous.last_success_at if error else now,
+            error=error,
+        )
+
+
+async def check_model_deployment():
+    await get_create_ai_project_client().deployments.get(get_settings().azure_openai_model_deployment_name)
+
+
+async def check_agent_service():
+    from app.services.agents import get_create_agent_manager
+
+    agents = get_create_agent_manager()
+    if not agents:
+        raise RuntimeError("No agent has been set up")
+
+    await get_create_ai_project_client().agents.get_agent(agents[0].id)
+
+
+async def check_vector_store():
+    from app.services.agents import get_create_agent_manager
+
+    agents = get_create_agent_manager()
+    if not agents:
+        raise RuntimeError("No agent has been set up")
+
+    tool_resources = agents[0].definition.tool_resources
+    if tool_resources is None or tool_resources.file_search is None \
+            or not tool_resources.file_search.vector_store_ids:
+        raise RuntimeError("Agent has no vector store")
+
+    vector_store = await get_create_ai_project_client().agents.vector_stores.get(
+        tool_resources.file_search.vector_store_ids[0])
+    if vector_store.status != VectorStoreStatus.COMPLETED:
+        raise RuntimeError(f"Vector store {vector_store.id} is {vector_store.status}")
+
+
+async def check_bing_connection():
+    await get_create_ai_project_client().connections.get(get_settings().bing_connection_name)
+
+
+@lru_cache
+def get_create_health_monitor() -> HealthMonitor:
+    return HealthMonitor(
+        checks={
+            "model_deployment": check_model_deployment,
+            "agent_service": check_agent_service,
+            "vector_store": check_vector_store,
+            "bing_connection": check_bing_connection,
+        },
+        interval_seconds=get_settings().health_check_interval_seconds,
+        timeout_seconds=get_settings().health_check_timeout_seconds,
+        stale_after_seconds=3 * get_settings().health_check_interval_seconds
+                            + get_settings().health_check_timeout_seconds,
+    )
+
+
+__all__ = [
+    "CRITICAL_DEPENDENCIES",
+    "DependencyHealth",
+    "HealthMonitor",
+    "get_create_health_monitor",
+]
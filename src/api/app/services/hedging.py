@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable
+
+from azure.ai.agents.models import (ListSortOrder, MessageRole,
+                                    ThreadMessageOptions)
+from opentelemetry import metrics
+from semantic_kernel.agents.azure_ai.azure_ai_agent import AzureAIAgentThread
+
+from app.config import get_settings
+from app.services.agent_pool import AgentPoolMember, get_create_agent_pool
+from app.services.message_store import get_create_message_store
+from app.services.runs import register_branch_thread, release_branch_thread
+from app.services.threads import get_thread_client
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+invocations_counter = meter.create_counter(
+    name="cloud_service_onboarding.hedging.invocations",
+    unit="{invocation}",
+    description="Number of agent invocations that could have been hedged, by step",
+)
+hedges_counter = meter.create_counter(
+    name="cloud_service_onboarding.hedging.hedges",
+    unit="{hedge}",
+    description="Number of duplicate invocations started because the first token was late, by step",
+)
+hedge_wins_counter = meter.create_counter(
+    name="cloud_service_onboarding.hedging.wins",
+    unit="{hedge}",
+    description="Number of hedges that produced a first token before the invocation they duplicated, by step",
+)
+ttft_histogram = meter.create_histogram(
+    name="cloud_service_onboarding.hedging.time_to_first_token",
+    unit="s",
+    description="Time to the first response of the invocation that was kept, by step",
+)
+
+Invoke = Callable[[AgentPoolMember, AzureAIAgentThread, str], AsyncIterator[Any]]
+
+
+class ResponseStream:
+    """Consumes the responses of an agent invocation in a task of its own.
+
+    Invocations can then be raced and cancelled without ever advancing the
+    underlying stream from two tasks.
+    """
+
+    def __init__(self, responses: AsyncIterator[Any]):
+        self.started_at = time.monotonic()
+        self._queue: asyncio.Queue[tuple[Any, Exception | None]] = asyncio.Queue(maxsize=1)
+        self._get_task: asyncio.Task | None = None
+        self._pump_task = asyncio.create_task(self._pump(responses))
+
+    async def _pump(self, responses: AsyncIterator[Any]):
+        try:
+            async for response in responses:
+                await self._queue.put((response, None))
+            await self._queue.put((None, None))  # End of stream
+        except Exception as e:
+            await self._queue.put((None, e))
+        finally:
+            await responses.aclose()  # type: ignore
+
+    def next_response(self) -> asyncio.Task:
+        # The same task until its response is taken, so losing a race loses no response
+        if self._get_task is None:
+            self._get_task = asyncio.create_task(self._queue.get())
+        return self._get_task
+
+    def take(self) -> Any | None:
+        """Returns the response that arrived, or None at the end of the stream."""
+        response, error = self._get_task.result()  # type: ignore
+        self._get_task = None
+        if error is not None:
+            raise error
+        return response
+
+    async def cancel(self):
+        tasks = [task for task in (self._get_task, self._pump_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def wait_first(streams: list[ResponseStream], timeout: float) -> ResponseStream | None:
+    """Returns the first of ``streams`` with a response to take, or None if none has one in time."""
+    tasks = {stream.next_response(): stream for stream in streams}
+    done, _ = await asyncio.wait(tasks, timeout=max(timeout, 0), return_when=asyncio.FIRST_COMPLETED)
+    for task, stream in tasks.items():
+        if task in done:
+            return stream
+    return None
+
+
+class TtftTracker:
+    """Learns the time to first token of each step from a sliding window of samples.
+
+    An invocation is hedged once its first token is later than the
+    ``percentile`` of its step. Until a step has ``min_samples`` samples
+    ``default_delay_seconds`` is used instead.
+    """
+
+    def __init__(self,
+                 percentile: float,
+                 window_size: int,
+                 min_samples: int,
+                 default_delay_seconds: float,
+                 min_delay_seconds: float):
+        self._percentile = percentile
+        self._window_size = window_size
+        self._min_samples = min_samples
+        self._default_delay_seconds = default_delay_seconds
+        self._min_delay_seconds = min_delay_seconds
+        self._samples: dict[str, deque[float]] = {}
+
+    def record(self, step_name: str, seconds: float):
+        self._samples.setdefault(step_name, deque(maxlen=self._window_size)).append(seconds)
+        ttft_histogram.record(seconds, {"step": step_name})
+
+    def hedge_delay(self, step_name: str) -> float:
+        samples = self._samples.get(step_name)
+        if samples is None or len(samples) < self._min_samples:
+            return self._default_delay_seconds
+
+        ordered = sorted(samples)
+        delay = ordered[min(int(self._percentile * len(ordered)), len(ordered) - 1)]
+        return max(delay, self._min_delay_seconds)
+
+
+class Hedge:
+    """A duplicate of an invocation, running on a scratch thread of its own."""
+
+    def __init__(self, step_name: str, thread: AzureAIAgentThread):
+        self.step_name = step_name
+        self.thread = thread
+        self.member: AgentPoolMember | None = None
+        self.stream: ResponseStream | None = None
+        self._lease = None
+
+    @classmethod
+    async def start(cls,
+                    step_name: str,
+                    agent_name: str,
+                    thread: AzureAIAgentThread,
+                    message: str,
+                    estimated_tokens: int,
+                    exclude: AgentPoolMember,
+                    invoke: Invoke) -> "Hedge":
+        """Seeds a scratch thread with the history of ``thread`` and invokes ``message`` on it.
+
+        The scratch thread is created on another deployment than ``exclude``,
+        the deployment of the invocation being hedged, if there is one.
+        """
+        agent_pool = get_create_agent_pool()
+        hedge = cls(step_name, AzureAIAgentThread(
+            client=agent_pool.select_client(agent_name, exclude=exclude),
+            messages=await build_seed_messages(thread, message),
+        ))
+
+        try:
+            await hedge.thread.create()
+            register_branch_thread(hedge.thread)
+
+            hedge._lease = agent_pool.lease(agent_name, hedge.thread, estimated_tokens, exclude=exclude)
+            hedge.member = hedge._lease.__enter__()
+            hedge.stream = ResponseStream(invoke(hedge.member, hedge.thread, message))
+        except BaseException:
+            await hedge.close()
+            raise
+
+        hedges_counter.add(1, {"step": step_name})
+        logger.info(f"Hedging {step_name} on {hedge.member.deployment_name}")
+        return hedge
+
+    async def close(self):
+        if self.stream is not None:
+            await self.stream.cancel()
+        if self._lease is not None:
+            self._lease.__exit__(None, None, None)
+            self._lease = None
+        await release_branch_thread(self.thread)
+
+
+async def build_seed_messages(thread: AzureAIAgentThread, message: str) -> list[ThreadMessageOptions]:
+    """Returns the text of the latest messages of ``thread``, from the message store."""
+    store = get_create_message_store()
+    await store.sync(thread.id, get_thread_client(thread))  # type: ignore
+    # The run is still adding messages, so reads must keep going through to the agents service
+    await store.mark_stale(thread.id)  # type: ignore
+
+    messages = [stored async for stored in store.iter_messages(
+        thread_id=thread.id,  # type: ignore
+        limit=get_settings().agent_hedge_seed_max_messages,
+        order=ListSortOrder.DESCENDING,
+    )]
+    messages.reverse()
+
+    seed_messages = []
+    for stored in messages:
+        text = "".join(content["text"]["value"] for content in stored["content"] if content.get("type") == "text")
+        if text:
+            seed_messages.append(ThreadMessageOptions(
+                role=MessageRole.USER if stored["role"] == MessageRole.USER else MessageRole.AGENT,
+                content=text,
+            ))
+
+    # The invocation being hedged may already have added the message, which the hedge sends itself
+    if seed_messages and seed_messages[-1].role == MessageRole.USER and seed_messages[-1].content == message:
+        seed_messages.pop()
+
+    return seed_messages
+
+
+async def copy_hedge_output(thread: AzureAIAgentThread, output: str):
+    # Later steps run on the main thread and expect to find the output of this one there
+    await get_thread_client(thread).agents.messages.create(thread_id=thread.id,  # type: ignore
+                                                           role=MessageRole.AGENT,
+                                                           content=output)
+
+
+def record_invocation(step_name: str):
+    invocations_counter.add(1, {"step": step_name})
+
+
+def record_hedge_win(step_name: str):
+    hedge_wins_counter.add(1, {"step": step_name})
+
+
+@lru_cache
+def get_create_ttft_tracker() -> TtftTracker:
+    return TtftTracker(
+        percentile=get_settings().agent_hedge_percentile,
+        window_size=get_settings().agent_hedge_window_size,
+        min_samples=get_settings().agent_hedge_min_samples,
+        default_delay_seconds=get_settings().agent_hedge_default_delay_seconds,
+        min_delay_seconds=get_settings().agent_hedge_min_delay_seconds,
+    )
+
+
+__all__ = [
+    "Hedge",
+    "ResponseStream",
+    "TtftTracker",
+    "build_seed_messages",
+    "copy_hedge_output",
+    "get_create_ttft_tracker",
+    "record_hedge_win",
+    "record_invocation",
+    "wait_first",
+]
@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import AsyncIterable, AsyncIterator
+
+from opentelemetry import metrics
+from pydantic import BaseModel
+
+from app.config import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+lookups_counter = meter.create_counter(
+    name="cloud_service_onboarding.image_cache.lookups",
+    unit="{lookup}",
+    description="Number of image cache lookups, by hit or miss",
+)
+evictions_counter = meter.create_counter(
+    name="cloud_service_onboarding.image_cache.evictions",
+    unit="{blob}",
+    description="Number of image blobs evicted because the cache was full",
+)
+
+# Signatures of the image formats the code interpreter writes, for files whose name has no known extension
+_IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"<svg", "image/svg+xml"),
+]
+
+
+class ImageCacheEntry(BaseModel):
+    file_id: str
+    path: str
+    sha256: str
+    size: int
+    media_type: str
+
+
+class ImageCache:
+    """Content-addressed disk cache of files downloaded from the agents service.
+
+    Blobs are stored once per SHA-256 of their content, and an SQLite index
+    maps file ids to blobs. Once the blobs exceed ``max_bytes`` the least
+    recently used ones are evicted along with every file id pointing to them.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._blobs_path = os.path.join(path, "blobs")
+        self._index_path = os.path.join(path, "index.sqlite3")
+
+        os.makedirs(self._blobs_path, exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS images (
+                    file_id TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    media_type TEXT NOT NULL,
+                    last_accessed_at REAL NOT NULL
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256)")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self._index_path, timeout=30)
+        try:
+            with connection:  # Commits, or rolls back on error
+                yield connection
+        finally:
+            connection.close()
+
+    async def get(self, file_id: str) -> ImageCacheEntry | None:
+        return await asyncio.to_thread(self._get, file_id)
+
+    async def tee(self,
+                  file_id: str,
+                  chunks: AsyncIterable[bytes],
+                  media_type: str) -> AsyncIterator[bytes]:
+        """Yields ``chunks`` as they arrive while writing them to the cache.
+
+        The file is only added once the whole of it was read, so a download cut
+        short by an error or a client disconnect leaves nothing behind.
+        """
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self._path, suffix=".part")
+        file = os.fdopen(file_descriptor, "wb")
+        digest = hashlib.sha256()
+        size = 0
+        stored = False
+        try:
+            async for chunk in chunks:
+                if not isinstance(chunk, (bytes, bytearray)):
+                    raise TypeError(f"Expected bytes or bytearray, got {type(chunk).__name__}")
+
+                digest.update(chunk)
+                size += len(chunk)
+                # Files larger than the cache are streamed through without being written
+                if size <= self._max_bytes:
+                    await asyncio.to_thread(file.write, chunk)
+                yield chunk
+
+            file.close()
+            if size <= self._max_bytes:
+                await asyncio.to_thread(self._put, file_id, temporary_path, digest.hexdigest(), size, media_type)
+                stored = True
+        finally:
+            # Not awaited, as this also runs when the response is torn down
+            file.close()
+            if not stored:
+                _remove_quietly(temporary_path)
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self._blobs_path, sha256[:2], sha256)
+
+    def _get(self, file_id: str) -> ImageCacheEntry | None:
+        with self._connect() as connection:
+            row = connection.execute("SELECT sha256, size, media_type FROM images WHERE file_id = ?",
+                                     (file_id,)).fetchone()
+
+            if row is not None and not os.path.exists(self._blob_path(row[0])):
+                # The blob was removed from disk behind the index's back
+                connection.execute("DELETE FROM images WHERE sha256 = ?", (row[0],))
+                row = None
+
+            if row is None:
+                lookups_counter.add(1, {"result": "miss"})
+                return None
+
+            connection.execute("UPDATE images SET last_accessed_at = ? WHERE sha256 = ?", (time.time(), row[0]))
+
+        lookups_counter.add(1, {"result": "hit"})
+        return ImageCacheEntry(file_id=file_id, path=self._blob_path(row[0]), sha256=row[0], size=row[1],
+                               media_type=row[2])
+
+    def _put(self, file_id: str, temporary_path: str, sha256: str, size: int, media_type: str):
+        blob_path = self._blob_path(sha256)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        if os.path.exists(blob_path):
+            os.remove(temporary_path)  # Same content under another file id
+        else:
+            os.replace(temporary_path, blob_path)
+
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO images (file_id, sha256, size, media_type, last_accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (file_id, sha256, size, media_type, time.time()),
+            )
+            self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection):
+        blobs = connection.execute(
+            "SELECT sha256, MAX(size), MAX(last_accessed_at) FROM images GROUP BY sha256 ORDER BY 3 ASC"
+        ).fetchall()
+
+        total_size = sum(size for _, size, _ in blobs)
+        evicted = 0
+        for sha256, size, _ in blobs:
+            if total_size <= self._max_bytes:
+                break
+            connection.execute("DELETE FROM images WHERE sha256 = ?", (sha256,))
+            _remove_quietly(self._blob_path(sha256))
+            total_size -= size
+            evicted += 1
+
+        if evicted:
+            evictions_counter.add(evicted)
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Error removing {path} from the image cache: {e}")
+
+
+async def detect_media_type(filename: str | None,
+                            content: AsyncIterator[bytes]) -> tuple[str, AsyncIterator[bytes]]:
+    """Returns the media type of a file from its name, or else its first bytes, and its content.
+
+    Detecting from the first bytes reads the first chunk of ``content``, so the
+    returned content must be read instead of ``content``.
+    """
+    media_type, _ = mimetypes.guess_type(filename or "")
+    if media_type is not None:
+        return media_type, content
+
+    first_chunk = await anext(content, b"")
+    media_type = next((signature_media_type for signature, signature_media_type in _IMAGE_SIGNATURES
+                       if first_chunk.startswith(signature)), "application/octet-stream")
+
+    async def read_all():
+        if first_chunk:
+            yield first_chunk
+        async for chunk in content:
+            yield chunk
+
+    return media_type, read_all()
+
+
+@lru_cache
+def get_create_image_cache() -> ImageCache:
+    return ImageCache(
+        path=get_settings().image_cache_path,
+        max_bytes=get_settings().image_cache_max_bytes,
+    )
+
+
+__all__ = [
+    "ImageCache",
+    "ImageCacheEntry",
+    "detect_media_type",
+    "get_create_image_cache",
+]
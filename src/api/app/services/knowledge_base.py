@@ -0,0 +1,353 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from azure.ai.agents.models import (FilePurpose, VectorStoreFileBatchStatus,
+                                    VectorStoreFileStatusFilter)
+from opentelemetry import metrics
+from pydantic import BaseModel
+
+from app.config import get_settings
+
+if TYPE_CHECKING:
+    from azure.ai.projects.aio import AIProjectClient
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+files_synced_counter = meter.create_counter(
+    name="cloud_service_onboarding.knowledge_base.files_synced",
+    unit="{file}",
+    description="Number of knowledge base files uploaded to or deleted from the vector store, by action",
+)
+sync_duration_histogram = meter.create_histogram(
+    name="cloud_service_onboarding.knowledge_base.sync_duration",
+    unit="ms",
+    description="Duration of each knowledge base sync, by phase",
+)
+
+
+# Files are uploaded as "<first characters of the content hash>_<name>"
+UPLOAD_HASH_LENGTH = 16
+_UPLOAD_NAME_PATTERN = re.compile(rf"([0-9a-f]{{{UPLOAD_HASH_LENGTH}}})_(.+)", re.DOTALL)
+
+
+@dataclass
+class LocalFile:
+    name: str
+    path: str
+    sha256: str
+    size: int
+
+
+class KnowledgeBaseSyncResult(BaseModel):
+    vector_store_id: str
+    uploaded: list[str] = []
+    deleted: list[str] = []
+    failed: list[str] = []
+    unchanged: int = 0
+    adopted: list[str] = []  # Files found in the store under their content hash, not uploaded again
+    removed_from_store: int = 0  # Files of removed or replaced versions, duplicates and plain-named uploads
+    dry_run: bool = False
+    hash_ms: float = 0
+    list_ms: float = 0
+    upload_ms: float = 0
+    attach_ms: float = 0
+    delete_ms: float = 0
+    total_ms: float = 0
+
+
+class KnowledgeBaseSync:
+    """Keeps a vector store in line with a directory of documentation files.
+
+    A SQLite manifest records the content hash and agent file id of every
+    file synced to each vector store, so only new or changed files are
+    uploaded, several at a time, and files removed from the directory are
+    deleted from the store rather than the store being rebuilt. A changed
+    file's previous version is only deleted once its new version has been
+    added, so the store never lacks a document that still exists.
+
+    Files are uploaded under a name holding their content hash, so the store
+    itself says which version of which file each of its files holds. A file
+    the manifest doesn't know of, e.g. on a fresh container or one uploaded by
+    another replica, is adopted into the manifest if it holds the content of
+    a local file, and deleted otherwise. Files uploaded under their plain name,
+    before names held the content hash, are replaced by hash-named uploads.
+    """
+
+    def __init__(self, path: str, max_concurrency: int):
+        self._path = path
+        self._max_concurrency = max_concurrency
+        self._locks: dict[str, asyncio.Lock] = {}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS knowledge_base_files (
+                    vector_store_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    file_id TEXT NOT NULL,
+                    synced_at REAL NOT NULL,
+                    PRIMARY KEY (vector_store_id, name)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self._path, timeout=30)
+        try:
+            with connection:  # Commits, or rolls back on error
+                yield connection
+        finally:
+            connection.close()
+
+    async def sync(self,
+                   client: "AIProjectClient",
+                   vector_store_id: str,
+                   directory: str,
+                   dry_run: bool = False) -> KnowledgeBaseSyncResult:
+        # Syncs of the same store would upload the same files twice
+        async with self._locks.setdefault(vector_store_id, asyncio.Lock()):
+            return await self._sync(client, vector_store_id, directory, dry_run)
+
+    async def _sync(self,
+                    client: "AIProjectClient",
+                    vector_store_id: str,
+                    directory: str,
+                    dry_run: bool) -> KnowledgeBaseSyncResult:
+        result = KnowledgeBaseSyncResult(vector_store_id=vector_store_id, dry_run=dry_run)
+        started_at = time.perf_counter()
+
+        phase_started_at = time.perf_counter()
+        local_files = await asyncio.to_thread(hash_directory, directory)
+        manifest = await asyncio.to_thread(self._get_manifest, vector_store_id)
+        result.hash_ms = (time.perf_counter() - phase_started_at) * 1000
+
+        phase_started_at = time.perf_counter()
+        remote_file_ids = {file.id async for file in client.agents.vector_store_files.list(vector_store_id)}
+        result.list_ms = (time.perf_counter() - phase_started_at) * 1000
+
+        store_files = await self._list_store_files(client, remote_file_ids)
+
+        # The file kept for each local file, the lowest id among those holding its current content,
+        # so that replicas that uploaded the same file at once keep the same one
+        kept: dict[str, str] = {}
+        for file_id, (upload_hash, name) in sorted(store_files.items()):
+            if name in local_files and upload_hash == local_files[name].sha256[:UPLOAD_HASH_LENGTH]:
+                kept.setdefault(name, file_id)
+        adopted = {file_id: name for name, file_id in kept.items()
+                   if name not in manifest or manifest[name][1] != file_id}
+        result.adopted = sorted(adopted.values())
+
+        to_upload = [file for name, file in local_files.items() if name not in kept]
+        result.unchanged = len(local_files) - len(to_upload)
+
+        # Everything else in the store is a removed file, a replaced version, a duplicate upload or a
+        # file uploaded under its plain name before names held the content hash
+        to_delete = set(store_files) - set(kept.values())
+        removed_names = sorted({name for name in manifest if name not in local_files}
+                               | {name for _, name in store_files.values() if name not in local_files})
+
+        if dry_run:
+            result.uploaded = sorted(file.name for file in to_upload)
+            result.deleted = sorted(removed_names)
+            result.removed_from_store = len(to_delete)
+            result.total_ms = (time.perf_counter() - started_at) * 1000
+            return result
+
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        phase_started_at = time.perf_counter()
+        uploads = await asyncio.gather(*(self._upload(client, semaphore, file) for file in to_upload),
+                                       return_exceptions=True)
+        result.upload_ms = (time.perf_counter() - phase_started_at) * 1000
+
+        uploaded: dict[str, str] = {}
+        for file, upload in zip(to_upload, uploads):
+            if isinstance(upload, BaseException):
+                logger.error(f"Error uploading {file.name} to Agent storage: {upload}")
+                result.failed.append(file.name)
+            else:
+                uploaded[upload] = file.name
+
+        phase_started_at = time.perf_counter()
+        if uploaded:
+            failed_file_ids = await self._attach(client, vector_store_id, list(uploaded))
+            for file_id in failed_file_ids:
+                result.failed.append(uploaded.pop(file_id))
+            # Files that didn't make it into the store are of no use in Agent storage
+            await asyncio.gather(*(self._delete(client, semaphore, vector_store_id, file_id)
+                                   for file_id in failed_file_ids), return_exceptions=True)
+        result.attach_ms = (time.perf_counter() - phase_started_at) * 1000
+
+        # Keep the previous versions of a file whose new version failed
+        to_delete = list(to_delete - {file_id for file_id, (_, name) in store_files.items() if name in result.failed})
+
+        phase_started_at = time.perf_counter()
+        deletions = await asyncio.gather(
+            *(self._delete(client, semaphore, vector_store_id, file_id) for file_id in to_delete),
+            return_exceptions=True)
+        result.delete_ms = (time.perf_counter() - phase_started_at) * 1000
+
+        for file_id, deletion in zip(to_delete, deletions):
+            if isinstance(deletion, BaseException):
+                logger.error(f"Error deleting {file_id} from vector store {vector_store_id}: {deletion}")
+            else:
+                result.removed_from_store += 1
+
+        await asyncio.to_thread(self._update_manifest,
+                                vector_store_id,
+                                [(local_files[name], file_id) for file_id, name in (uploaded | adopted).items()],
+                                removed_names)
+
+        result.uploaded = sorted(uploaded.values())
+        result.deleted = sorted(removed_names)
+        result.failed.sort()
+        result.total_ms = (time.perf_counter() - started_at) * 1000
+
+        files_synced_counter.add(len(result.uploaded), {"action": "uploaded"})
+        files_synced_counter.add(result.removed_from_store, {"action": "deleted"})
+        for phase in ("hash", "list", "upload", "attach", "delete", "total"):
+            sync_duration_histogram.record(getattr(result, f"{phase}_ms"), {"phase": phase})
+
+        logger.info(f"Synced knowledge base to vector store {vector_store_id} in {result.total_ms:.0f}ms: "
+                    f"{len(result.uploaded)} uploaded, {len(result.adopted)} adopted, {len(result.deleted)} deleted, "
+                    f"{result.unchanged} unchanged, {len(result.failed)} failed")
+        return result
+
+    @staticmethod
+    async def _list_store_files(client: "AIProjectClient",
+                                remote_file_ids: set[str]) -> dict[str, tuple[str | None, str]]:
+        """Returns the content hash prefix and local file name of each file in the store, by file id.
+
+        These come from the name the file was uploaded under, not the manifest,
+        which is missing on a fresh container. The hash prefix is None for a
+        file uploaded under its plain name.
+        """
+        if not remote_file_ids:
+            return {}
+        return {file_info.id: parse_upload_name(file_info.filename)
+                for file_info in (await client.agents.files.list(purpose=FilePurpose.AGENTS)).data
+                if file_info.id in remote_file_ids}
+
+    @staticmethod
+    async def _upload(client: "AIProjectClient", semaphore: asyncio.Semaphore, file: LocalFile) -> str:
+        async with semaphore:
+            with open(file.path, "rb") as f:
+                uploaded_file = await client.agents.files.upload_and_poll(file=f,
+                                                                          purpose=FilePurpose.AGENTS,
+                                                                          filename=build_upload_name(file))
+            logger.info(f"Uploaded {file.name} to Agent storage as {uploaded_file.id}.")
+            return uploaded_file.id
+
+    @staticmethod
+    async def _attach(client: "AIProjectClient", vector_store_id: str, file_ids: list[str]) -> list[str]:
+        """Adds files to the vector store in a single batch, returning the ids of those that failed."""
+        batch = await client.agents.vector_store_file_batches.create_and_poll(vector_store_id=vector_store_id,
+                                                                              file_ids=file_ids)
+        if batch.status == VectorStoreFileBatchStatus.COMPLETED and not batch.file_counts.failed:
+            return []
+
+        # Files the batch failed on, or that were still in progress when it ended
+        completed_file_ids = {file.id async for file in client.agents.vector_store_file_batches.list_files(
+            vector_store_id=vector_store_id, batch_id=batch.id, filter=VectorStoreFileStatusFilter.COMPLETED)}
+        return [file_id for file_id in file_ids if file_id not in completed_file_ids]
+
+    async def _delete(self,
+                      client: "AIProjectClient",
+                      semaphore: asyncio.Semaphore,
+                      vector_store_id: str,
+                      file_id: str):
+        async with semaphore:
+            await client.agents.vector_store_files.delete(vector_store_id=vector_store_id, file_id=file_id)
+        await self._delete_file(client, semaphore, file_id)
+
+    @staticmethod
+    async def _delete_file(client: "AIProjectClient", semaphore: asyncio.Semaphore, file_id: str):
+        async with semaphore:
+            try:
+                await client.agents.files.delete(file_id)
+            except Exception as e:
+                # The file may be shared by another vector store
+                logger.warning(f"Error deleting {file_id} from Agent storage: {e}")
+
+    def _get_manifest(self, vector_store_id: str) -> dict[str, tuple[str, str]]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT name, sha256, file_id FROM knowledge_base_files WHERE vector_store_id = ?",
+                (vector_store_id,),
+            ).fetchall()
+        return {name: (sha256, file_id) for name, sha256, file_id in rows}
+
+    def _update_manifest(self,
+                         vector_store_id: str,
+                         uploaded: list[tuple[LocalFile, str]],
+                         removed_names: list[str]):
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO knowledge_base_files "
+                "(vector_store_id, name, sha256, size, file_id, synced_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(vector_store_id, file.name, file.sha256, file.size, file_id, now) for file, file_id in uploaded],
+            )
+            connection.executemany(
+                "DELETE FROM knowledge_base_files WHERE vector_store_id = ? AND name = ?",
+                [(vector_store_id, name) for name in removed_names],
+            )
+
+
+def build_upload_name(file: LocalFile) -> str:
+    # The content hash lets a sync without a manifest recognize the files already in the store
+    return f"{file.sha256[:UPLOAD_HASH_LENGTH]}_{file.name}"
+
+
+def parse_upload_name(upload_name: str) -> tuple[str | None, str]:
+    """Returns the content hash prefix and local file name of an upload name, the prefix being None for a plain name."""
+    match = _UPLOAD_NAME_PATTERN.fullmatch(upload_name)
+    if match is None:
+        return None, upload_name
+    return match.group(1), match.group(2)
+
+
+def hash_directory(directory: str) -> dict[str, LocalFile]:
+    files = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        files[name] = LocalFile(name=name, path=path, sha256=digest.hexdigest(), size=os.path.getsize(path))
+    return files
+
+
+@lru_cache
+def get_create_knowledge_base_sync() -> KnowledgeBaseSync:
+    return KnowledgeBaseSync(
+        path=get_settings().knowledge_base_manifest_path,
+        max_concurrency=get_settings().knowledge_base_sync_max_concurrency,
+    )
+
+
+__all__ = [
+    "KnowledgeBaseSync",
+    "KnowledgeBaseSyncResult",
+    "build_upload_name",
+    "get_create_knowledge_base_sync",
+    "hash_directory",
+    "parse_upload_name",
+]
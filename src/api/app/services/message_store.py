@@ -0,0 +1,305 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, AsyncIterator
+
+from azure.ai.agents.models import ListSortOrder, MessageStatus, ThreadMessage
+from opentelemetry import metrics
+
+from app.config import get_settings
+
+if TYPE_CHECKING:
+    from azure.ai.projects.aio import AIProjectClient
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+messages_fetched_counter = meter.create_counter(
+    name="cloud_service_onboarding.message_store.messages_fetched",
+    unit="{message}",
+    description="Number of thread messages fetched from the agents service into the message store",
+)
+reads_counter = meter.create_counter(
+    name="cloud_service_onboarding.message_store.reads",
+    unit="{read}",
+    description="Number of thread history reads, by whether the agents service had to be called",
+)
+
+
+class MessagePage:
+    def __init__(self, messages: list[dict[str, Any]], has_more: bool):
+        self.messages = messages
+        self.has_more = has_more
+
+
+class MessageStore:
+    """SQLite-backed copy of the messages of threads.
+
+    Each thread has a high-water mark, the id of the newest stored message.
+    Messages are listed newest first and listing stops at the high-water mark,
+    so a sync only fetches the messages added since the previous one.
+
+    Reads go through to the agents service only for threads never synced or
+    marked stale by a run. Runs write through by syncing when they end. The
+    least recently read threads are dropped beyond ``max_threads``.
+    """
+
+    def __init__(self, path: str, max_threads: int):
+        self._path = path
+        self._max_threads = max_threads
+        self._locks: dict[str, asyncio.Lock] = {}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS threads (
+                    thread_id TEXT PRIMARY KEY,
+                    high_water_mark TEXT,
+                    stale INTEGER NOT NULL DEFAULT 0,
+                    last_accessed_at REAL NOT NULL
+                )
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    thread_id TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (thread_id, id)
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS messages_seq ON messages (thread_id, seq)")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self._path, timeout=30)
+        try:
+            with connection:  # Commits, or rolls back on error
+                yield connection
+        finally:
+            connection.close()
+
+    async def read_through(self, thread_id: str, azure_ai_client: "AIProjectClient", refresh: bool = False):
+        """Syncs ``thread_id`` if it was never synced, a run marked it stale or ``refresh`` is set."""
+        needs_sync = refresh or await asyncio.to_thread(self._needs_sync, thread_id)
+        reads_counter.add(1, {"result": "miss" if needs_sync else "hit"})
+        if needs_sync:
+            await self.sync(thread_id, azure_ai_client)
+
+    async def sync(self, thread_id: str, azure_ai_client: "AIProjectClient") -> int:
+        """Fetches the messages added to ``thread_id`` since the last sync and returns how many were stored."""
+        async with self._locks.setdefault(thread_id, asyncio.Lock()):
+            high_water_mark = await asyncio.to_thread(self._get_high_water_mark, thread_id)
+
+            new_messages: list[ThreadMessage] = []
+            found_high_water_mark = False
+            async for message in azure_ai_client.agents.messages.list(thread_id=thread_id,
+                                                                      order=ListSortOrder.DESCENDING):
+                if message.id == high_water_mark:
+                    found_high_water_mark = True
+                    break
+                new_messages.append(message)
+
+            messages_fetched_counter.add(len(new_messages))
+
+            # The high-water mark message is gone, so the whole thread was listed
+            rebuild = high_water_mark is not None and not found_high_water_mark
+            if rebuild:
+                logger.info(f"High-water mark of thread {thread_id} not found, rebuilding its messages")
+
+            final_messages = []
+            for message in reversed(new_messages):
+                # A message still being written is stored by a later sync, once it is final
+                if message.status == MessageStatus.IN_PROGRESS:
+                    break
+                final_messages.append(message_to_dict(message))
+
+            # Stays stale while a message is in progress, so the next read syncs again
+            stale = len(final_messages) < len(new_messages)
+            await asyncio.to_thread(self._store, thread_id, final_messages, rebuild, stale)
+            return len(final_messages)
+
+    async def mark_stale(self, thread_id: str):
+        await asyncio.to_thread(self._mark_stale, thread_id)
+
+    async def get_page(self,
+                       thread_id: str,
+                       limit: int,
+                       after: str | None = None,
+                       before: str | None = None,
+                       order: ListSortOrder = ListSortOrder.DESCENDING) -> MessagePage:
+        """Returns up to ``limit`` messages in ``order``, following ``after`` or preceding ``before``.
+
+        Raises ``ValueError`` if a cursor is not a message of the thread.
+        """
+        # Paging backwards from a cursor reads the closest messages first
+        backwards = before is not None and after is None
+        return await asyncio.to_thread(self._get_page, thread_id, limit, after, before, order, backwards)
+
+    async def check_cursors(self, thread_id: str, *message_ids: str | None):
+        """Raises ``ValueError`` if a cursor is not a message of the thread."""
+        await asyncio.to_thread(self._check_cursors, thread_id, message_ids)
+
+    async def iter_messages(self,
+                            thread_id: str,
+                            limit: int | None = None,
+                            after: str | None = None,
+                            before: str | None = None,
+                            order: ListSortOrder = ListSortOrder.DESCENDING,
+                            page_size: int = 100) -> AsyncIterator[dict[str, Any]]:
+        """Yields messages a page at a time, so a long thread is never held in memory at once.
+
+        Messages are yielded in ``order`` from the start of the range, so with
+        ``before`` and a ``limit`` the messages closest to the cursor are the ones cut.
+        """
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page_limit = page_size if remaining is None else min(page_size, remaining)
+            page = await asyncio.to_thread(self._get_page, thread_id, page_limit, after, before, order, False)
+
+            for message in page.messages:
+                yield message
+
+            if not page.has_more or not page.messages:
+                return
+
+            if remaining is not None:
+                remaining -= len(page.messages)
+            after = page.messages[-1]["id"]
+
+    def _needs_sync(self, thread_id: str) -> bool:
+        with self._connect() as connection:
+            row = connection.execute("SELECT stale FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+            connection.execute("UPDATE threads SET last_accessed_at = ? WHERE thread_id = ?", (time.time(), thread_id))
+        return row is None or bool(row[0])
+
+    def _get_high_water_mark(self, thread_id: str) -> str | None:
+        with self._connect() as connection:
+            row = connection.execute("SELECT high_water_mark FROM threads WHERE thread_id = ?",
+                                     (thread_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def _store(self, thread_id: str, messages: list[dict[str, Any]], rebuild: bool, stale: bool):
+        now = time.time()
+        with self._connect() as connection:
+            if rebuild:
+                connection.execute("DELETE FROM messages WHERE thread_id = ?", (thread_id,))
+
+            seq = connection.execute("SELECT COALESCE(MAX(seq), 0) FROM messages WHERE thread_id = ?",
+                                     (thread_id,)).fetchone()[0]
+            connection.executemany(
+                "INSERT OR REPLACE INTO messages (thread_id, id, seq, created_at, role, content) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(thread_id, message["id"], seq + index + 1, message["created_at"], message["role"],
+                  json.dumps(message["content"])) for index, message in enumerate(messages)],
+            )
+
+            high_water_mark = messages[-1]["id"] if messages else None
+            connection.execute(
+                "INSERT INTO threads (thread_id, high_water_mark, stale, last_accessed_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (thread_id) DO UPDATE SET "
+                "high_water_mark = COALESCE(excluded.high_water_mark, "
+                "CASE WHEN ? THEN NULL ELSE threads.high_water_mark END), "
+                "stale = excluded.stale, last_accessed_at = excluded.last_accessed_at",
+                (thread_id, high_water_mark, int(stale), now, int(rebuild)),
+            )
+
+            self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection):
+        evicted = connection.execute(
+            "SELECT thread_id FROM threads ORDER BY last_accessed_at DESC LIMIT -1 OFFSET ?",
+            (self._max_threads,),
+        ).fetchall()
+        for (thread_id,) in evicted:
+            connection.execute("DELETE FROM messages WHERE thread_id = ?", (thread_id,))
+            connection.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,))
+            self._locks.pop(thread_id, None)
+
+    def _mark_stale(self, thread_id: str):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO threads (thread_id, high_water_mark, stale, last_accessed_at) VALUES (?, NULL, 1, ?) "
+                "ON CONFLICT (thread_id) DO UPDATE SET stale = 1",
+                (thread_id, time.time()),
+            )
+
+    def _check_cursors(self, thread_id: str, message_ids: tuple[str | None, ...]):
+        with self._connect() as connection:
+            for message_id in message_ids:
+                if message_id is not None:
+                    _get_seq(connection, thread_id, message_id)
+
+    def _get_page(self, thread_id: str, limit: int, after: str | None, before: str | None,
+                  order: ListSortOrder, backwards: bool) -> MessagePage:
+        descending = order == ListSortOrder.DESCENDING
+        with self._connect() as connection:
+            conditions = ["thread_id = ?"]
+            parameters: list[Any] = [thread_id]
+            if after is not None:
+                conditions.append("seq < ?" if descending else "seq > ?")
+                parameters.append(_get_seq(connection, thread_id, after))
+            if before is not None:
+                conditions.append("seq > ?" if descending else "seq < ?")
+                parameters.append(_get_seq(connection, thread_id, before))
+
+            sql_order = "DESC" if descending != backwards else "ASC"
+
+            rows = connection.execute(
+                f"SELECT id, created_at, role, content FROM messages WHERE {' AND '.join(conditions)} "
+                f"ORDER BY seq {sql_order} LIMIT ?",
+                (*parameters, limit + 1),
+            ).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if backwards:  # Restores the order
+            rows.reverse()
+
+        return MessagePage(
+            messages=[{"id": row[0], "created_at": row[1], "role": row[2], "content": json.loads(row[3])}
+                      for row in rows],
+            has_more=has_more,
+        )
+
+
+def _get_seq(connection: sqlite3.Connection, thread_id: str, message_id: str) -> int:
+    row = connection.execute("SELECT seq FROM messages WHERE thread_id = ? AND id = ?",
+                             (thread_id, message_id)).fetchone()
+    if row is None:
+        raise ValueError(f"Message '{message_id}' not found in thread '{thread_id}'.")
+    return row[0]
+
+
+def message_to_dict(message: ThreadMessage) -> dict[str, Any]:
+    return {
+        "id": message.id,
+        "created_at": message.created_at.timestamp(),
+        "role": message.role,
+        "content": [content.as_dict() for content in message.content],
+    }
+
+
+@lru_cache
+def get_create_message_store() -> MessageStore:
+    return MessageStore(
+        path=get_settings().message_store_path,
+        max_threads=get_settings().message_store_max_threads,
+    )
+
+
+__all__ = [
+    "MessagePage",
+    "MessageStore",
+    "get_create_message_store",
+    "message_to_dict",
+]
@@ -0,0 +1,179 @@
+import logging
+import random
+import re
+import time
+from functools import lru_cache
+
+from azure.core.exceptions import (HttpResponseError, ServiceRequestError,
+                                   ServiceResponseError)
+from opentelemetry import metrics
+from semantic_kernel.exceptions import AgentInvokeException
+
+from app.config import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+circuit_transitions_counter = meter.create_counter(
+    name="cloud_service_onboarding.resilience.circuit_transitions",
+    unit="{transition}",
+    description="Number of circuit breaker state changes, by the state entered",
+)
+circuit_rejections_counter = meter.create_counter(
+    name="cloud_service_onboarding.resilience.circuit_rejections",
+    unit="{call}",
+    description="Number of agent invocations failed fast because the circuit breaker was open",
+)
+
+
+class AgentTimeoutError(TimeoutError):
+    pass
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Agent invocations are failing, not retrying for {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fails calls fast while the backend keeps failing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls are rejected for ``reset_timeout_seconds``. Then a single trial call
+    is let through: its success closes the circuit, its failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout_seconds: float):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout_seconds = reset_timeout_seconds
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self._reset_timeout_seconds:
+            return "open"
+        return "half_open"
+
+    def before_call(self):
+        """Raises ``CircuitOpenError`` if the call must not go through."""
+        state = self.state
+        if state == "closed":
+            return
+
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+
+        circuit_rejections_counter.add(1)
+        retry_after = self._reset_timeout_seconds - (time.monotonic() - self._opened_at)  # type: ignore
+        raise CircuitOpenError(retry_after=max(retry_after, 1))
+
+    def record_success(self):
+        self._failures = 0
+        self._trial_in_flight = False
+        if self._opened_at is not None:
+            self._opened_at = None
+            logger.info("Circuit breaker closed")
+            circuit_transitions_counter.add(1, {"state": "closed"})
+
+    def release(self):
+        """Lets another trial call through if this one ended without a result, e.g. it was cancelled."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._trial_in_flight or (self._opened_at is None and self._failures >= self._failure_threshold):
+            self._trial_in_flight = False
+            self._opened_at = time.monotonic()
+            logger.warning(f"Circuit breaker opened after {self._failures} consecutive failure(s)")
+            circuit_transitions_counter.add(1, {"state": "open"})
+
+
+class RetryBudget:
+    """Caps retries to a fraction of calls, so retries can't multiply the load on a struggling backend.
+
+    Every call deposits ``ratio`` of a token and every retry withdraws a whole
+    one. The balance starts at, and is capped at, ``max_tokens``.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self._ratio = ratio
+        self._max_tokens = max_tokens
+        self._tokens = max_tokens
+
+    def deposit(self):
+        self._tokens = min(self._tokens + self._ratio, self._max_tokens)
+
+    def try_withdraw(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    if isinstance(error, HttpResponseError) and error.status_code == 429:
+        return True
+    # Runs failing on the deployment's quota only surface as their error message
+    return "rate limit" in str(error).lower()
+
+
+def get_retry_after(error: BaseException) -> float | None:
+    """Returns how long a rate limited deployment asked to be left alone, if it said."""
+    if isinstance(error, HttpResponseError) and error.response is not None:
+        retry_after = error.response.headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+
+    match = re.search(r"try again in (\d+) seconds?", str(error), re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, ServiceRequestError, ServiceResponseError, AgentInvokeException)) \
+            or is_rate_limit_error(error):
+        return True
+    if isinstance(error, HttpResponseError):
+        return error.status_code in (408, 429) or (error.status_code or 0) >= 500
+    return False
+
+
+def get_retry_delay(attempt: int) -> float:
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(get_settings().agent_retry_max_delay_seconds,
+                                 get_settings().agent_retry_base_delay_seconds * 2 ** attempt))
+
+
+@lru_cache
+def get_create_circuit_breaker() -> CircuitBreaker:
+    return CircuitBreaker(
+        failure_threshold=get_settings().agent_circuit_failure_threshold,
+        reset_timeout_seconds=get_settings().agent_circuit_reset_timeout_seconds,
+    )
+
+
+@lru_cache
+def get_create_retry_budget() -> RetryBudget:
+    return RetryBudget(
+        ratio=get_settings().agent_retry_budget_ratio,
+        max_tokens=get_settings().agent_retry_budget_max_tokens,
+    )
+
+
+__all__ = [
+    "AgentTimeoutError",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "RetryBudget",
+    "get_create_circuit_breaker",
+    "get_create_retry_budget",
+    "get_retry_after",
+    "get_retry_delay",
+    "is_rate_limit_error",
+    "is_retryable_error",
+]
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from opentelemetry import metrics
+from pydantic import BaseModel
+
+from app.config import get_settings
+from app.models.wire import encode_string
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+lookups_counter = meter.create_counter(
+    name="cloud_service_onboarding.result_cache.lookups",
+    unit="{lookup}",
+    description="Number of result cache lookups, by hit or miss",
+)
+evictions_counter = meter.create_counter(
+    name="cloud_service_onboarding.result_cache.evictions",
+    unit="{entry}",
+    description="Number of result cache entries evicted because they expired or the cache was full",
+)
+
+
+# Every stored frame starts with its content type and thread id, see app.models.wire
+_FRAME_THREAD_ID = re.compile(r'^(\{"content_type": "[^"]*", "thread_id": )"([^"\\]*)"')
+
+
+class CachedResult(BaseModel):
+    frames: str
+    step_outputs: list[str]  # Added to the thread of the request the result is replayed to
+
+
+class ResultCacheEntry(BaseModel):
+    key: str
+    service_name: str
+    size: int
+    created_at: float
+    last_accessed_at: float
+    hit_count: int
+
+
+class ResultCache:
+    """SQLite-backed cache of the frames emitted by completed onboarding runs.
+
+    Entries expire after ``ttl_seconds``. Once the stored frames exceed
+    ``max_bytes`` the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int, max_bytes: int):
+        self._path = path
+        self._ttl_seconds = ttl_seconds
+        self._max_bytes = max_bytes
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    service_name TEXT NOT NULL,
+                    frames TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed_at REAL NOT NULL,
+                    hit_count INTEGER NOT NULL DEFAULT 0,
+                    step_outputs TEXT
+                )
+            """)
+            # Entries stored before step outputs were kept can't be replayed to a thread and are skipped
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(results)")]
+            if "step_outputs" not in columns:
+                connection.execute("ALTER TABLE results ADD COLUMN step_outputs TEXT")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self._path, timeout=30)
+        try:
+            with connection:  # Commits, or rolls back on error
+                yield connection
+        finally:
+            connection.close()
+
+    async def get(self, key: str) -> CachedResult | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def put(self, key: str, service_name: str, frames: str, step_outputs: list[str]):
+        await asyncio.to_thread(self._put, key, service_name, frames, step_outputs)
+
+    async def list_entries(self) -> list[ResultCacheEntry]:
+        return await asyncio.to_thread(self._list)
+
+    async def invalidate(self, key: str | None = None, service_name: str | None = None) -> int:
+        return await asyncio.to_thread(self._invalidate, key, service_name)
+
+    def _get(self, key: str) -> CachedResult | None:
+        now = time.time()
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT frames, step_outputs FROM results "
+                "WHERE key = ? AND created_at >= ? AND step_outputs IS NOT NULL",
+                (key, now - self._ttl_seconds),
+            ).fetchone()
+
+            if row is None:
+                lookups_counter.add(1, {"result": "miss"})
+                return None
+
+            connection.execute(
+                "UPDATE results SET last_accessed_at = ?, hit_count = hit_count + 1 WHERE key = ?",
+                (now, key),
+            )
+
+        lookups_counter.add(1, {"result": "hit"})
+        return CachedResult(frames=row[0], step_outputs=json.loads(row[1]))
+
+    def _put(self, key: str, service_name: str, frames: str, step_outputs: list[str]):
+        now = time.time()
+        step_outputs_json = json.dumps(step_outputs)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, service_name, frames, size, created_at, last_accessed_at, hit_count, step_outputs) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0, ?)",
+                (key, normalize_service_name(service_name), frames,
+                 len(frames.encode("utf-8")) + len(step_outputs_json.encode("utf-8")), now, now, step_outputs_json),
+            )
+            self._evict(connection, now)
+
+    def _evict(self, connection: sqlite3.Connection, now: float):
+        evicted = connection.execute(
+            "DELETE FROM results WHERE created_at < ?", (now - self._ttl_seconds,)
+        ).rowcount
+
+        total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total_size > self._max_bytes:
+            for key, size in connection.execute(
+                    "SELECT key, size FROM results ORDER BY last_accessed_at ASC").fetchall():
+                if total_size <= self._max_bytes:
+                    break
+                connection.execute("DELETE FROM results WHERE key = ?", (key,))
+                total_size -= size
+                evicted += 1
+
+        if evicted:
+            evictions_counter.add(evicted)
+
+    def _list(self) -> list[ResultCacheEntry]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT key, service_name, size, created_at, last_accessed_at, hit_count "
+                "FROM results ORDER BY last_accessed_at DESC"
+            ).fetchall()
+
+        return [
+            ResultCacheEntry(key=row[0], service_name=row[1], size=row[2],
+                             created_at=row[3], last_accessed_at=row[4], hit_count=row[5])
+            for row in rows
+        ]
+
+    def _invalidate(self, key: str | None, service_name: str | None) -> int:
+        with self._connect() as connection:
+            if key is not None:
+                return connection.execute("DELETE FROM results WHERE key = ?", (key,)).rowcount
+            if service_name is not None:
+                return connection.execute("DELETE FROM results WHERE service_name = ?",
+                                          (normalize_service_name(service_name),)).rowcount
+            return connection.execute("DELETE FROM results").rowcount
+
+
+def normalize_service_name(cloud_service_name: str) -> str:
+    return " ".join(cloud_service_name.lower().split())
+
+
+def build_result_cache_key(cloud_service_name: str, knowledge_base_hash: str, prompt_hash: str) -> str:
+    return hashlib.sha256(
+        f"{normalize_service_name(cloud_service_name)}\n{knowledge_base_hash}\n{prompt_hash}".encode("utf-8")
+    ).hexdigest()
+
+
+async def replay_frames(frames: str, thread_id: str, delay_ms: int = 0):
+    """Replays stored frames, addressing those of the original run's thread to ``thread_id``."""
+    thread_id_json = encode_string(thread_id)
+    for line in frames.split("\n"):
+        if not line:
+            continue
+        line = _FRAME_THREAD_ID.sub(lambda match: match.group(1) + (thread_id_json if match.group(2) else '""'),
+                                    line, count=1)
+        yield line + "\n"
+        if delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000)
+
+
+@lru_cache
+def get_create_result_cache() -> ResultCache:
+    return ResultCache(
+        path=get_settings().result_cache_path,
+        ttl_seconds=get_settings().result_cache_ttl_seconds,
+        max_bytes=get_settings().result_cache_max_bytes,
+    )
+
+
+__all__ = [
+    "CachedResult",
+    "ResultCache",
+    "ResultCacheEntry",
+    "build_result_cache_key",
+    "get_create_result_cache",
+    "normalize_service_name",
+    "replay_frames",
+]
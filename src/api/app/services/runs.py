@@ -0,0 +1,262 @@
+import asyncio
+import contextvars
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Callable
+
+from opentelemetry import metrics
+from semantic_kernel.agents.azure_ai.azure_ai_agent import AzureAIAgentThread
+
+from app.config import get_settings
+from app.models.token_usage import TokenUsage
+from app.services.dependencies import get_create_ai_project_client
+from app.services.result_cache import normalize_service_name
+from app.services.stream_broadcast import StreamBroadcast
+from app.services.threads import (cancel_active_runs, delete_thread_quietly,
+                                  get_thread_client, get_thread_token_usage)
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+runs_cancelled_counter = meter.create_counter(
+    name="cloud_service_onboarding.runs.cancelled",
+    unit="{run}",
+    description="Number of onboarding runs cancelled because the client disconnected",
+)
+steps_skipped_counter = meter.create_counter(
+    name="cloud_service_onboarding.runs.steps_skipped",
+    unit="{step}",
+    description="Number of process steps not executed because their run was cancelled",
+)
+tokens_saved_counter = meter.create_counter(
+    name="cloud_service_onboarding.runs.tokens_saved",
+    unit="{token}",
+    description="Estimated model tokens not spent because their run was cancelled",
+)
+
+# The run driving the current request, if any
+current_run_var: contextvars.ContextVar["OnboardingRun | None"] = \
+    contextvars.ContextVar("current_run", default=None)
+
+# The process step executing in the current task, if any. Each step runs in a task of its own.
+current_step_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_step", default=None)
+
+
+@dataclass(eq=False)
+class OnboardingRun:
+    thread_id: str
+    broadcast: StreamBroadcast
+    branch_threads: list[AzureAIAgentThread] = field(default_factory=list)  # Threads of parallel process branches
+    flight_key: str | None = None
+    task: asyncio.Task | None = None
+    total_steps: int = 0
+    steps_started: int = 0
+    started_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    cancel_handle: asyncio.TimerHandle | None = None
+    failed: bool = False
+    error: str | None = None
+    retryable: bool = False  # Whether the run failed on an error that may go away on a retry
+    completed_steps: set[str] = field(default_factory=set)
+    resumes: int = 0
+    token_usage: TokenUsage | None = None  # Only collected when set, as it costs a call per thread
+    joined_thread_ids: list[str] = field(default_factory=list)  # Threads of requests sharing this run
+    step_outputs: dict[str, str] = field(default_factory=dict)  # Output of each step, by step name
+
+
+class RunRegistry:
+    """Tracks in-flight onboarding runs by thread id and single-flight key.
+
+    When the last client streaming a run disconnects, the run is detached and
+    cancelled after a grace window unless a client attaches to it again.
+    """
+
+    def __init__(self, grace_seconds: float):
+        self._grace_seconds = grace_seconds
+        self._runs: dict[str, OnboardingRun] = {}
+        self._flights: dict[str, OnboardingRun] = {}
+        self._cancel_tasks: set[asyncio.Task] = set()
+        self._average_step_tokens = 0.0
+
+    def register(self, run: OnboardingRun):
+        self._runs[run.thread_id] = run
+        if run.flight_key is not None:
+            self._flights[run.flight_key] = run
+        if run.task is not None:
+            run.task.add_done_callback(lambda _: self._remove(run))
+
+    def get(self, thread_id: str) -> OnboardingRun | None:
+        return self._runs.get(thread_id)
+
+    def join_flight(self, flight_key: str, thread_id: str) -> OnboardingRun | None:
+        """Returns the in-flight run for ``flight_key`` and makes it reachable from ``thread_id``."""
+        run = self._flights.get(flight_key)
+        # Once the broadcast is closed, the output has already been copied to the joined threads
+        if run is None or run.task is None or run.task.done() \
+                or run.broadcast.closed or not run.broadcast.replayable:
+            return None
+
+        logger.info(f"Thread {thread_id} joined the run on thread {run.thread_id}")
+        self._runs[thread_id] = run
+        if thread_id != run.thread_id:
+            run.joined_thread_ids.append(thread_id)
+        self._cancel_pending(run)
+        return run
+
+    def attach(self, thread_id: str) -> OnboardingRun | None:
+        run = self._runs.get(thread_id)
+        if run is not None:
+            self._cancel_pending(run)
+        return run
+
+    def detach(self, run: OnboardingRun):
+        if run.task is None or run.task.done() or run.cancel_handle is not None \
+                or run.broadcast.subscriber_count > 0:
+            return
+
+        logger.info(f"Last client detached from run on thread {run.thread_id}, "
+                    f"cancelling in {self._grace_seconds}s unless one reattaches")
+        run.cancel_handle = asyncio.get_running_loop().call_later(
+            self._grace_seconds, self._schedule_cancel, run)
+
+    def _schedule_cancel(self, run: OnboardingRun):
+        run.cancel_handle = None
+        task = asyncio.create_task(self.cancel(run))
+        self._cancel_tasks.add(task)
+        task.add_done_callback(self._cancel_tasks.discard)
+
+    async def cancel(self, run: OnboardingRun):
+        if run.task is None or run.task.done():
+            return
+
+        run.task.cancel()
+        await run.broadcast.close()
+
+        steps_skipped = max(run.total_steps - run.steps_started, 0)
+
+        # Branch threads may live in other AI projects of the agent pool
+        threads = [(run.thread_id, get_create_ai_project_client())]
+        threads += [(thread.id, get_thread_client(thread)) for thread in run.branch_threads]
+
+        completed_step_tokens = []
+        for thread_id, azure_ai_client in threads:
+            try:
+                completed_step_tokens += await cancel_active_runs(
+                    thread_id=thread_id,  # type: ignore
+                    azure_ai_client=azure_ai_client,
+                    created_after=run.started_at,
+                )
+            except Exception as e:
+                logger.error(f"Error cancelling agent runs on thread {thread_id}: {e}")
+
+        if completed_step_tokens:
+            self._average_step_tokens = sum(completed_step_tokens) / len(completed_step_tokens)
+
+        runs_cancelled_counter.add(1)
+        steps_skipped_counter.add(steps_skipped)
+        tokens_saved_counter.add(int(steps_skipped * self._average_step_tokens))
+
+        logger.info(f"Cancelled run on thread {run.thread_id}, skipped {steps_skipped} step(s)")
+
+    def _cancel_pending(self, run: OnboardingRun):
+        if run.cancel_handle is not None:
+            logger.info(f"Client reattached to run on thread {run.thread_id}")
+            run.cancel_handle.cancel()
+            run.cancel_handle = None
+
+    def _remove(self, run: OnboardingRun):
+        if run.cancel_handle is not None:
+            run.cancel_handle.cancel()
+            run.cancel_handle = None
+        for thread_id in [k for k, v in self._runs.items() if v is run]:
+            del self._runs[thread_id]
+        if run.flight_key is not None and self._flights.get(run.flight_key) is run:
+            del self._flights[run.flight_key]
+
+
+def build_flight_key(cloud_service_name: str, prompt_hash: str) -> str:
+    return hashlib.sha256(
+        f"{normalize_service_name(cloud_service_name)}\n{prompt_hash}".encode("utf-8")
+    ).hexdigest()
+
+
+def mark_step_started(step_name: str):
+    current_step_var.set(step_name)
+    run = current_run_var.get()
+    if run is not None:
+        run.steps_started += 1
+
+
+def mark_step_completed():
+    run = current_run_var.get()
+    step_name = current_step_var.get()
+    if run is not None and step_name is not None:
+        run.completed_steps.add(step_name)
+
+
+def record_step_output(output: str):
+    """Records the output of the current step, to copy to the threads that didn't run it."""
+    run = current_run_var.get()
+    step_name = current_step_var.get()
+    if run is not None and step_name is not None:
+        run.step_outputs[step_name] = output
+
+
+def mark_run_failed(error: str | None = None, retryable: bool = False):
+    run = current_run_var.get()
+    if run is not None:
+        # Only retryable if every error of the run is
+        run.retryable = retryable and (not run.failed or run.retryable)
+        run.failed = True
+        run.error = run.error or error
+
+
+def register_branch_thread(thread: AzureAIAgentThread):
+    run = current_run_var.get()
+    if run is not None:
+        run.branch_threads.append(thread)
+
+
+async def release_branch_thread(thread: AzureAIAgentThread):
+    """Deletes a scratch thread of the current run, recording its token usage first if the run collects it."""
+    run = current_run_var.get()
+    if run is not None and run.token_usage is not None and thread.id is not None:
+        try:
+            run.token_usage.add(await get_thread_token_usage(thread_id=thread.id,
+                                                             azure_ai_client=get_thread_client(thread),
+                                                             created_after=run.started_at))
+        except Exception as e:
+            logger.error(f"Error reading token usage of thread {thread.id}: {e}")
+
+    await delete_thread_quietly(thread)
+
+
+def on_run_finished(callback: Callable[[], None]):
+    """Calls ``callback`` when the current run completes, fails or is cancelled."""
+    run = current_run_var.get()
+    if run is not None and run.task is not None:
+        run.task.add_done_callback(lambda _: callback())
+
+
+@lru_cache
+def get_create_run_registry() -> RunRegistry:
+    return RunRegistry(grace_seconds=get_settings().run_disconnect_grace_seconds)
+
+
+__all__ = [
+    "OnboardingRun",
+    "RunRegistry",
+    "build_flight_key",
+    "current_run_var",
+    "current_step_var",
+    "get_create_run_registry",
+    "mark_run_failed",
+    "mark_step_completed",
+    "mark_step_started",
+    "on_run_finished",
+    "record_step_output",
+    "register_branch_thread",
+    "release_branch_thread",
+]
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Awaitable, Callable
+
+from opentelemetry import metrics
+
+from app.config import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+queue_wait_histogram = meter.create_histogram(
+    name="cloud_service_onboarding.scheduler.queue_wait",
+    unit="s",
+    description="Time an onboarding run waited for a free run slot",
+)
+run_duration_histogram = meter.create_histogram(
+    name="cloud_service_onboarding.scheduler.run_duration",
+    unit="s",
+    description="Time an onboarding run held a run slot",
+)
+rejected_counter = meter.create_counter(
+    name="cloud_service_onboarding.scheduler.rejected",
+    unit="{run}",
+    description="Number of onboarding runs rejected because the scheduler was saturated",
+)
+
+
+class SchedulerSaturatedError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Run scheduler is saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+@dataclass(eq=False)
+class RunTicket:
+    admitted_at: float = field(default_factory=time.perf_counter)
+    started_at: float | None = None
+    released: bool = False
+
+
+class RunScheduler:
+    """Caps the number of onboarding runs executing on this replica.
+
+    Runs over the cap wait in a bounded FIFO queue. Once the queue is full,
+    admission fails with a suggested retry delay.
+    """
+
+    def __init__(self, max_concurrent_runs: int, max_queued_runs: int, default_retry_after: int):
+        self._max_concurrent_runs = max_concurrent_runs
+        self._max_queued_runs = max_queued_runs
+        self._default_retry_after = default_retry_after
+        self._condition = asyncio.Condition()
+        self._waiting: deque[RunTicket] = deque()
+        self._notify_tasks: set[asyncio.Task] = set()
+        self._running = 0
+        self._average_run_seconds: float | None = None
+
+    def admit(self) -> RunTicket:
+        # Admitted tickets only take a run slot once their task gets to run, so the
+        # free slots are counted against the waiting tickets too
+        if len(self._waiting) >= self._max_queued_runs + max(0, self._max_concurrent_runs - self._running):
+            rejected_counter.add(1)
+            raise SchedulerSaturatedError(retry_after=self.retry_after())
+
+        ticket = RunTicket()
+        self._waiting.append(ticket)
+        return ticket
+
+    def retry_after(self) -> int:
+        if self._average_run_seconds is None:
+            return self._default_retry_after
+        # Time for the runs ahead of a new arrival to drain through the run slots
+        return max(1, math.ceil(self._average_run_seconds * (len(self._waiting) + 1) / self._max_concurrent_runs))
+
+    def start(self,
+              ticket: RunTicket,
+              run_function: Callable[[], Awaitable[None]],
+              on_position: Callable[[int], Awaitable[None]] | None = None) -> asyncio.Task:
+        """Runs an admitted ticket in a task of its own.
+
+        A task cancelled before it first runs never gets to release its ticket,
+        which would then hold up every ticket behind it, so the ticket is also
+        released once the task is done.
+        """
+        task = asyncio.create_task(self.run(ticket=ticket, run_function=run_function, on_position=on_position))
+        task.add_done_callback(lambda _: self._release_soon(ticket))
+        return task
+
+    async def run(self,
+                  ticket: RunTicket,
+                  run_function: Callable[[], Awaitable[None]],
+                  on_position: Callable[[int], Awaitable[None]] | None = None):
+        try:
+            await self._acquire(ticket, on_position)
+            await run_function()
+        finally:
+            await self._release(ticket)
+
+    async def _acquire(self, ticket: RunTicket, on_position: Callable[[int], Awaitable[None]] | None):
+        last_position = 0
+        while True:
+            async with self._condition:
+                if self._waiting[0] is ticket and self._running < self._max_concurrent_runs:
+                    self._waiting.popleft()
+                    self._running += 1
+                    ticket.started_at = time.perf_counter()
+                    queue_wait_histogram.record(ticket.started_at - ticket.admitted_at)
+                    # The next ticket in line may be able to start as well
+                    self._condition.notify_all()
+                    return
+
+                position = self._waiting.index(ticket) + 1
+                if position == last_position:
+                    await self._condition.wait()
+                    continue
+
+            # Report outside of the lock so a slow client can't stall the scheduler
+            last_position = position
+            if on_position is not None:
+                await on_position(position)
+
+    async def _release(self, ticket: RunTicket):
+        async with self._condition:
+            self._forget(ticket)
+            self._condition.notify_all()
+
+    def _release_soon(self, ticket: RunTicket):
+        if ticket.released:
+            return
+
+        self._forget(ticket)
+        # Waking the tickets behind it takes the lock, so it can't be done from a done callback
+        task = asyncio.get_running_loop().create_task(self._notify())
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_tasks.discard)
+
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify_all()
+
+    def _forget(self, ticket: RunTicket):
+        if ticket.released:
+            return
+        ticket.released = True
+
+        if ticket.started_at is None:
+            self._waiting.remove(ticket)
+            return
+
+        self._running -= 1
+        duration = time.perf_counter() - ticket.started_at
+        run_duration_histogram.record(duration)
+        self._average_run_seconds = duration if self._average_run_seconds is None \
+            else 0.8 * self._average_run_seconds + 0.2 * duration
+
+
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from app.config import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class StartupState:
+    """SQLite-backed record of the ids resolved while setting up the agents.
+
+    Ids are keyed by AI project endpoint, kind (agent, connection, vector
+    store) and name, so a restart can fetch each resource by id instead of
+    scanning the project for it. A stored id may be out of date, so callers
+    verify it and ``invalidate`` it if the resource is gone.
+
+    The definitions of the agents are kept as well, so that the workers of
+    a preloading master can use the agents the master has just resolved
+    without a call of their own.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS resolved_ids (
+                    endpoint TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    resolved_at REAL NOT NULL,
+                    PRIMARY KEY (endpoint, kind, name)
+                )
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS agent_definitions (
+                    endpoint TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    definition TEXT NOT NULL,
+                    resolved_at REAL NOT NULL,
+                    PRIMARY KEY (endpoint, name)
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self._path, timeout=30)
+        try:
+            with connection:  # Commits, or rolls back on error
+                yield connection
+        finally:
+            connection.close()
+
+    async def get(self, endpoint: str, kind: str, name: str) -> str | None:
+        return await asyncio.to_thread(self._get, endpoint, kind, name)
+
+    async def put(self, endpoint: str, kind: str, name: str, resolved_id: str):
+        await asyncio.to_thread(self._put, endpoint, kind, name, resolved_id)
+
+    async def invalidate(self, endpoint: str, kind: str, name: str):
+        await asyncio.to_thread(self._invalidate, endpoint, kind, name)
+
+    async def get_agent_definition(self, endpoint: str, name: str, max_age_seconds: float) -> dict | None:
+        return await asyncio.to_thread(self._get_agent_definition, endpoint, name, max_age_seconds)
+
+    async def put_agent_definition(self, endpoint: str, name: str, definition: dict):
+        await asyncio.to_thread(self._put_agent_definition, endpoint, name, definition)
+
+    def _get(self, endpoint: str, kind: str, name: str) -> str | None:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT id FROM resolved_ids WHERE endpoint = ? AND kind = ? AND name = ?",
+                (endpoint, kind, name),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def _put(self, endpoint: str, kind: str, name: str, resolved_id: str):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO resolved_ids (endpoint, kind, name, id, resolved_at) VALUES (?, ?, ?, ?, ?)",
+                (endpoint, kind, name, resolved_id, time.time()),
+            )
+
+    def _invalidate(self, endpoint: str, kind: str, name: str):
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM resolved_ids WHERE endpoint = ? AND kind = ? AND name = ?",
+                (endpoint, kind, name),
+            )
+
+    def _get_agent_definition(self, endpoint: str, name: str, max_age_seconds: float) -> dict | None:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT definition FROM agent_definitions WHERE endpoint = ? AND name = ? AND resolved_at >= ?",
+                (endpoint, name, time.time() - max_age_seconds),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _put_agent_definition(self, endpoint: str, name: str, definition: dict):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO agent_definitions (endpoint, name, definition, resolved_at) "
+                "VALUES (?, ?, ?, ?)",
+                (endpoint, name, json.dumps(definition, default=str), time.time()),
+            )
+
+
+@lru_cache
+def get_create_startup_state() -> StartupState:
+    return StartupState(path=get_settings().startup_state_path)
+
+
+__all__ = [
+    "StartupState",
+    "get_create_startup_state",
+]
@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from opentelemetry import metrics
+
+from app.config import get_settings
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+lookups_counter = meter.create_counter(
+    name="cloud_service_onboarding.step_cache.lookups",
+    unit="{lookup}",
+    description="Number of step cache lookups, by step and hit or miss",
+)
+
+
+class StepCache:
+    """SQLite-backed cache of the final output of each process step.
+
+    Entries are keyed by step name, step inputs and prompt version, and
+    expire after ``ttl_seconds``.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int):
+        self._path = path
+        self._ttl_seconds = ttl_seconds
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS step_outputs (
+                    key TEXT PRIMARY KEY,
+                    step_name TEXT NOT NULL,
+                    output TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self._path, timeout=30)
+        try:
+            with connection:  # Commits, or rolls back on error
+                yield connection
+        finally:
+            connection.close()
+
+    async def get(self, key: str, step_name: str) -> str | None:
+        return await asyncio.to_thread(self._get, key, step_name)
+
+    async def put(self, key: str, step_name: str, output: str):
+        await asyncio.to_thread(self._put, key, step_name, output)
+
+    async def invalidate(self, step_name: str | None = None) -> int:
+        return await asyncio.to_thread(self._invalidate, step_name)
+
+    def _get(self, key: str, step_name: str) -> str | None:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT output FROM step_outputs WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self._ttl_seconds),
+            ).fetchone()
+
+        lookups_counter.add(1, {"step": step_name, "result": "miss" if row is None else "hit"})
+        return None if row is None else row[0]
+
+    def _put(self, key: str, step_name: str, output: str):
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO step_outputs (key, step_name, output, created_at) VALUES (?, ?, ?, ?)",
+                (key, step_name, output, now),
+            )
+            connection.execute("DELETE FROM step_outputs WHERE created_at < ?", (now - self._ttl_seconds,))
+
+    def _invalidate(self, step_name: str | None) -> int:
+        with self._connect() as connection:
+            if step_name is not None:
+                return connection.execute("DELETE FROM step_outputs WHERE step_name = ?", (step_name,)).rowcount
+            return connection.execute("DELETE FROM step_outputs").rowcount
+
+
+def build_step_cache_key(step_name: str, inputs: list[str], prompt: str) -> str:
+    digest = hashlib.sha256(step_name.encode("utf-8"))
+    for value in inputs:
+        digest.update(b"\n")
+        digest.update(value.encode("utf-8"))
+    # The prompt version is the hash of the step's instructions
+    digest.update(b"\n")
+    digest.update(hashlib.sha256(prompt.encode("utf-8")).digest())
+    return digest.hexdigest()
+
+
+def build_step_output_digest(output: str) -> str:
+    return hashlib.sha256(output.encode("utf-8")).hexdigest()
+
+
+@lru_cache
+def get_create_step_cache() -> StepCache:
+    return StepCache(
+        path=get_settings().step_cache_path,
+        ttl_seconds=get_settings().step_cache_ttl_seconds,
+    )
+
+
+__all__ = [
+    "StepCache",
+    "build_step_cache_key",
+    "build_step_output_digest",
+    "get_create_step_cache",
+]
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+
+from opentelemetry import metrics
+
+from app.models.chat_output import ChatOutput
+from app.models.content_type_enum import ContentTypeEnum
+from app.models.streaming_detached_output import StreamingDetachedOutput
+from app.models.streaming_text_output import StreamingTextOutput
+from app.services.stream_channel import StreamChannel
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+subscribers_detached_counter = meter.create_counter(
+    name="cloud_service_onboarding.stream.subscribers_detached",
+    unit="{subscriber}",
+    description="Number of chat streams detached from their run because they read too slowly",
+)
+
+# Frames other than text are counted as this many bytes of the replay history
+_FRAME_OVERHEAD_BYTES = 256
+
+
+class StreamBroadcast:
+    """Fans the frames of one run out to every subscribed stream channel.
+
+    Frames are kept for the lifetime of the run so that a subscriber joining
+    late can first be replayed everything published so far, except for queue
+    positions, which are stale by then. Once the history exceeds
+    ``max_history_bytes`` it is dropped and the run can no longer be replayed.
+
+    Only subscribers that ask for backpressure, like the stream that started
+    the run, hold it up. Publishing never waits for the others: one whose
+    channel is full is sent a detached frame and its stream ends, so that the
+    client knows to attach again.
+    """
+
+    def __init__(self, thread_id: str, max_history_bytes: int = 4194304):
+        self._thread_id = thread_id
+        self._max_history_bytes = max_history_bytes
+        self._lock = asyncio.Lock()
+        self._frames: list[ChatOutput] | None = []
+        self._history_bytes = 0
+        self._subscribers: list[StreamChannel] = []
+        self._blocking_subscribers: set[StreamChannel] = set()
+        self._closed = False
+        self._close_tasks: set[asyncio.Task] = set()
+
+    @property
+    def frames(self) -> list[ChatOutput]:
+        if self._frames is None:
+            raise RuntimeError("The run's frames exceeded the replay history and were dropped")
+        return self._frames
+
+    @property
+    def replayable(self) -> bool:
+        return self._frames is not None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def publish(self, frame: ChatOutput):
+        blocking = []
+        async with self._lock:
+            self._remember(frame)
+            for channel in list(self._subscribers):
+                if channel in self._blocking_subscribers:
+                    blocking.append(channel)
+                elif not channel.put_nowait(frame):
+                    logger.info(f"Detaching a chat stream that fell behind the run on thread {self._thread_id}")
+                    subscribers_detached_counter.add(1)
+                    # Detached frames are never held back, so this is the last frame the client reads
+                    channel.put_nowait(StreamingDetachedOutput(thread_id=self._thread_id))
+                    self.unsubscribe(channel)
+
+        # Outside of the lock, so a subscriber waiting for room never blocks a subscribe or close
+        for channel in blocking:
+            await channel.put(frame)
+
+    async def subscribe(self, channel: StreamChannel, backpressure: bool = False) -> list[ChatOutput]:
+        """Subscribes ``channel`` to new frames and returns the frames published so far.
+
+        The caller streams the returned frames before reading from the channel.
+        Replaying them through the channel instead could overflow it before
+        anyone reads from it. With ``backpressure``, the run waits for room in
+        the channel instead of detaching it.
+        """
+        replay = list(self.frames)
+        if self._closed:
+            await channel.close()
+        else:
+            self._subscribers.append(channel)
+            if backpressure:
+                self._blocking_subscribers.add(channel)
+        return replay
+
+    def unsubscribe(self, channel: StreamChannel):
+        if channel in self._subscribers:
+            self._subscribers.remove(channel)
+        self._blocking_subscribers.discard(channel)
+
+        # Closing wakes up a publish blocked on this channel and ends the
+        # subscriber's stream. This is scheduled because unsubscribe runs
+        # while the subscriber's response is being torn down.
+        task = asyncio.get_running_loop().create_task(channel.close())
+        self._close_tasks.add(task)
+        task.add_done_callback(self._close_tasks.discard)
+
+    async def close(self):
+        async with self._lock:
+            self._closed = True
+            for channel in self._subscribers:
+                await channel.close()
+
+    def _remember(self, frame: ChatOutput):
+        if self._frames is None or frame.content_type == ContentTypeEnum.QUEUE_POSITION:
+            return
+
+        self._history_bytes += len(frame.text) if isinstance(frame, StreamingTextOutput) else _FRAME_OVERHEAD_BYTES
+        if self._history_bytes > self._max_history_bytes:
+            logger.warning(f"Dropping the replay history of a run after {self._history_bytes} bytes")
+            self._frames = None
+            return
+
+        self._frames.append(frame)
+
+
+__all__ = [
+    "StreamBroadcast",
+]
@@ -0,0 +1,162 @@
+import asyncio
+import time
+from collections import deque
+from enum import StrEnum, auto
+
+from opentelemetry import metrics
+
+from app.models.chat_output import ChatOutput
+from app.models.content_type_enum import ContentTypeEnum
+from app.models.streaming_text_output import StreamingTextOutput
+
+meter = metrics.get_meter(__name__)
+
+queue_depth_histogram = meter.create_histogram(
+    name="cloud_service_onboarding.stream.queue_depth",
+    unit="{frame}",
+    description="Number of frames buffered in a chat stream channel",
+)
+producer_wait_histogram = meter.create_histogram(
+    name="cloud_service_onboarding.stream.producer_wait",
+    unit="ms",
+    description="Time a producer waited for space in a chat stream channel",
+)
+frames_merged_counter = meter.create_counter(
+    name="cloud_service_onboarding.stream.frames_merged",
+    unit="{frame}",
+    description="Number of text frames merged into the channel tail because the channel was full",
+)
+
+
+class BackpressurePolicyEnum(StrEnum):
+    BLOCK = auto()  # Wait for the consumer to make room
+    MERGE = auto()  # Merge text into the last buffered frame up to a size cap, otherwise block
+    NEVER_DROP = auto()  # Always enqueue, even above the high-water mark
+
+
+DEFAULT_POLICIES = {
+    ContentTypeEnum.MARKDOWN: BackpressurePolicyEnum.MERGE,
+    ContentTypeEnum.ANNOTATION_URL: BackpressurePolicyEnum.NEVER_DROP,
+    ContentTypeEnum.ANNOTATION_FILE: BackpressurePolicyEnum.NEVER_DROP,
+    ContentTypeEnum.SENTINEL: BackpressurePolicyEnum.NEVER_DROP,
+    ContentTypeEnum.DETACHED: BackpressurePolicyEnum.NEVER_DROP,
+}
+
+
+class StreamChannel:
+    """Bounded, per-request frame channel between a run and its HTTP stream.
+
+    Once ``high_water_mark`` frames are buffered, each frame is handled
+    according to the policy registered for its content type. Text merged into
+    the last frame is capped at ``merge_max_bytes``, after which the producer
+    blocks like it does under BLOCK.
+    """
+
+    def __init__(self,
+                 high_water_mark: int,
+                 policies: dict[ContentTypeEnum, BackpressurePolicyEnum] | None = None,
+                 merge_max_bytes: int = 65536):
+        self._high_water_mark = high_water_mark
+        self._policies = policies or DEFAULT_POLICIES
+        self._merge_max_bytes = merge_max_bytes
+        self._frames: deque[ChatOutput] = deque()
+        # Text merged into the last frame, joined once the frame is read or another frame follows it
+        self._tail_parts: list[str] = []
+        self._tail_size = 0
+        self._readable = asyncio.Event()  # Set when a frame was added or the channel closed
+        self._writable = asyncio.Event()  # Set when a frame was read or the channel closed
+        self._closed = False
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def put_nowait(self, frame: ChatOutput) -> bool:
+        """Adds ``frame`` unless its policy would have the producer wait, in which case it returns False."""
+        if self._closed:
+            return True
+
+        if len(self._frames) >= self._high_water_mark:
+            policy = self._policies.get(frame.content_type, BackpressurePolicyEnum.BLOCK)
+            if policy == BackpressurePolicyEnum.MERGE and self._merge_into_tail(frame):
+                return True
+            if policy != BackpressurePolicyEnum.NEVER_DROP:
+                return False
+
+        self._seal_tail()
+        self._frames.append(frame)
+        queue_depth_histogram.record(len(self._frames))
+        self._readable.set()
+        return True
+
+    async def put(self, frame: ChatOutput):
+        if self.put_nowait(frame):
+            return
+
+        start = time.perf_counter()
+        while not self.put_nowait(frame):
+            self._writable.clear()
+            await self._writable.wait()
+        producer_wait_histogram.record((time.perf_counter() - start) * 1000,
+                                       {"content_type": frame.content_type.value})
+
+    async def get(self) -> ChatOutput | None:
+        """Returns the next frame, or None once the channel is closed and drained."""
+        while not self._frames and not self._closed:
+            self._readable.clear()
+            await self._readable.wait()
+
+        if not self._frames:
+            return None
+
+        if len(self._frames) == 1:
+            self._seal_tail()
+        frame = self._frames.popleft()
+        self._writable.set()
+        return frame
+
+    async def close(self):
+        self._closed = True
+        self._readable.set()
+        self._writable.set()
+
+    def _merge_into_tail(self, frame: ChatOutput) -> bool:
+        if not self._frames or not isinstance(frame, StreamingTextOutput):
+            return False
+
+        tail = self._frames[-1]
+        if not isinstance(tail, StreamingTextOutput) \
+                or tail.content_type != frame.content_type \
+                or tail.thread_id != frame.thread_id \
+                or tail.branch != frame.branch:
+            return False
+
+        tail_size = self._tail_size if self._tail_parts else len(tail.text.encode("utf-8"))
+        merged_size = tail_size + len(frame.text.encode("utf-8"))
+        if merged_size > self._merge_max_bytes:
+            return False
+
+        if not self._tail_parts:
+            self._tail_parts.append(tail.text)
+        self._tail_parts.append(frame.text)
+        self._tail_size = merged_size
+        frames_merged_counter.add(1)
+        return True
+
+    def _seal_tail(self):
+        if not self._tail_parts:
+            return
+
+        self._frames[-1] = self._frames[-1].model_copy(update={"text": "".join(self._tail_parts)})
+        self._tail_parts = []
+        self._tail_size = 0
+
+
+__all__ = [
+    "DEFAULT_POLICIES",
+    "BackpressurePolicyEnum",
+    "StreamChannel",
+]
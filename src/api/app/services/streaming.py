@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from opentelemetry import metrics
+
+from app.models.chat_output import ChatOutput
+from app.models.content_type_enum import ContentTypeEnum
+from app.models.streaming_annotation_file_output import (
+    StreamingAnnotationFileOutput, encode_streaming_annotation_file_output,
+    serialize_streaming_annotation_file_output)
+from app.models.streaming_annotation_url_output import (
+    StreamingAnnotationUrlOutput, encode_streaming_annotation_url_output,
+    serialize_streaming_annotation_url_output)
+from app.models.streaming_batch_summary_output import (
+    StreamingBatchSummaryOutput, encode_streaming_batch_summary_output,
+    serialize_streaming_batch_summary_output)
+from app.models.streaming_detached_output import (
+    StreamingDetachedOutput, encode_streaming_detached_output,
+    serialize_streaming_detached_output)
+from app.models.streaming_queue_position_output import (
+    StreamingQueuePositionOutput, encode_streaming_queue_position_output,
+    serialize_streaming_queue_position_output)
+from app.models.streaming_sentinel_output import (
+    StreamingSentinelOutput, encode_streaming_sentinel_output,
+    serialize_streaming_sentinel_output)
+from app.models.streaming_text_output import (StreamingTextOutput,
+                                              encode_streaming_text_output,
+                                              serialize_streaming_text_output)
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+frames_emitted_counter = meter.create_counter(
+    name="cloud_service_onboarding.stream.frames_emitted",
+    unit="{frame}",
+    description="Number of frames written to the chat stream",
+)
+deltas_coalesced_counter = meter.create_counter(
+    name="cloud_service_onboarding.stream.deltas_coalesced",
+    unit="{delta}",
+    description="Number of text deltas merged into a frame",
+)
+frame_interval_histogram = meter.create_histogram(
+    name="cloud_service_onboarding.stream.frame_interval",
+    unit="ms",
+    description="Time between consecutive frames written to a chat stream, the inverse of its frame rate",
+)
+bytes_saved_counter = meter.create_counter(
+    name="cloud_service_onboarding.stream.bytes_saved",
+    unit="By",
+    description="Estimated frame envelope bytes not sent because of coalescing",
+)
+
+_SERIALIZERS = {
+    StreamingTextOutput: serialize_streaming_text_output,
+    StreamingAnnotationUrlOutput: serialize_streaming_annotation_url_output,
+    StreamingAnnotationFileOutput: serialize_streaming_annotation_file_output,
+    StreamingSentinelOutput: serialize_streaming_sentinel_output,
+    StreamingQueuePositionOutput: serialize_streaming_queue_position_output,
+    StreamingBatchSummaryOutput: serialize_streaming_batch_summary_output,
+    StreamingDetachedOutput: serialize_streaming_detached_output,
+}
+
+# Encode frames straight to the bytes sent on the wire, without building a dict first
+_ENCODERS = {
+    StreamingTextOutput: encode_streaming_text_output,
+    StreamingAnnotationUrlOutput: encode_streaming_annotation_url_output,
+    StreamingAnnotationFileOutput: encode_streaming_annotation_file_output,
+    StreamingSentinelOutput: encode_streaming_sentinel_output,
+    StreamingQueuePositionOutput: encode_streaming_queue_position_output,
+    StreamingBatchSummaryOutput: encode_streaming_batch_summary_output,
+    StreamingDetachedOutput: encode_streaming_detached_output,
+}
+
+
+def chat_output_to_dict(chat_output: ChatOutput) -> dict[str, Any]:
+    return _SERIALIZERS[type(chat_output)](chat_output)
+
+
+def encode_chat_output(chat_output: ChatOutput) -> bytes:
+    """Encodes a frame as a line of NDJSON, the same as ``serialize_chat_output`` but as bytes."""
+    return _ENCODERS[type(chat_output)](chat_output)
+
+
+def serialize_chat_output(chat_output: ChatOutput) -> str:
+    return _ENCODERS[type(chat_output)](chat_output).decode("ascii")
+
+
+def readdress_chat_output(chat_output: ChatOutput, thread_id: str) -> ChatOutput:
+    """Returns the frame addressed to ``thread_id``, for a client reading a run of another thread."""
+    if not chat_output.thread_id or chat_output.thread_id == thread_id:
+        return chat_output
+    return chat_output.model_copy(update={"thread_id": thread_id})
+
+
+class _PendingText:
+    def __init__(self, frame: StreamingTextOutput):
+        self.frame = frame
+        self.parts: list[str] = []
+        self.size = 0
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class FrameCoalescer:
+    """Merges adjacent text deltas into a single frame.
+
+    Text is held for at most ``max_delay_ms`` or ``max_bytes`` before it is
+    forwarded to ``sink``. Any other frame (annotations, sentinels) flushes the
+    pending text of its branch first and is forwarded immediately so ordering
+    within a branch is preserved. Branches of a process running in parallel
+    are coalesced independently, so interleaving them doesn't break up frames.
+    """
+
+    def __init__(self,
+                 sink: Callable[[ChatOutput], Awaitable[None]],
+                 max_delay_ms: int,
+                 max_bytes: int):
+        self._sink = sink
+        self._max_delay = max_delay_ms / 1000
+        self._max_bytes = max_bytes
+        self._lock = asyncio.Lock()
+        self._pending: dict[str, _PendingText] = {}
+        self._timer_tasks: set[asyncio.Task] = set()
+        self._envelope_sizes: dict[tuple[str, str, str], int] = {}
+        self._last_emitted_at: float | None = None
+
+    async def post(self, frame: ChatOutput):
+        async with self._lock:
+            if not self._is_text(frame):
+                await self._flush_pending(frame.branch)
+                await self._emit(frame, deltas=1)
+                return
+
+            pending = self._pending.get(frame.branch)
+            if pending is not None and pending.frame.thread_id != frame.thread_id:
+                await self._flush_pending(frame.branch)
+                pending = None
+
+            if pending is None:
+                pending = self._pending[frame.branch] = _PendingText(frame)  # type: ignore
+                self._start_timer(pending)
+
+            pending.parts.append(frame.text)  # type: ignore
+            pending.size += len(frame.text.encode("utf-8"))  # type: ignore
+
+            if pending.size >= self._max_bytes or self._max_delay <= 0:
+                await self._flush_pending(frame.branch)
+
+    async def flush(self, branch: str | None = None):
+        async with self._lock:
+            if branch is not None:
+                await self._flush_pending(branch)
+                return
+            for pending_branch in list(self._pending):
+                await self._flush_pending(pending_branch)
+
+    @staticmethod
+    def _is_text(frame: ChatOutput) -> bool:
+        return isinstance(frame, StreamingTextOutput) and frame.content_type == ContentTypeEnum.MARKDOWN
+
+    def _start_timer(self, pending: _PendingText):
+        if self._max_delay <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        pending.timer = loop.call_later(self._max_delay, self._on_timer, pending)
+
+    def _on_timer(self, pending: _PendingText):
+        pending.timer = None
+        task = asyncio.create_task(self._flush_expired(pending))
+        self._timer_tasks.add(task)
+        task.add_done_callback(self._timer_tasks.discard)
+
+    async def _flush_expired(self, pending: _PendingText):
+        async with self._lock:
+            # The text may have been flushed by size since the timer fired, and newer text be pending
+            if self._pending.get(pending.frame.branch) is pending:
+                await self._flush_pending(pending.frame.branch)
+
+    async def _flush_pending(self, branch: str):
+        pending = self._pending.pop(branch, None)
+        if pending is None:
+            return
+
+        if pending.timer is not None:
+            pending.timer.cancel()
+
+        deltas = len(pending.parts)
+        frame = pending.frame
+        if deltas > 1:
+            frame = frame.model_copy(update={"text": "".join(pending.parts)})
+
+        await self._emit(frame, deltas=deltas)
+
+    async def _emit(self, frame: ChatOutput, deltas: int):
+        frames_emitted_counter.add(1, {"content_type": frame.content_type.value})
+        now = time.perf_counter()
+        if self._last_emitted_at is not None:
+            frame_interval_histogram.record((now - self._last_emitted_at) * 1000)
+        self._last_emitted_at = now
+        if deltas > 1:
+            deltas_coalesced_counter.add(deltas)
+            # Every merged delta would have carried its own JSON envelope
+            bytes_saved_counter.add((deltas - 1) * self._envelope_size(frame))  # type: ignore
+
+        await self._sink(frame)
+
+    def _envelope_size(self, frame: StreamingTextOutput) -> int:
+        # The envelope only depends on these fields, which rarely change within a run
+        key = (frame.content_type.value, frame.thread_id, frame.branch)
+        size = self._envelope_sizes.get(key)
+        if size is None:
+            size = len(encode_chat_output(frame.model_copy(update={"text": ""}))) - len('""')
+            self._envelope_sizes[key] = size
+        return size
+
+
+__all__ = [
+    "FrameCoalescer",
+    "chat_output_to_dict",
+    "encode_chat_output",
+    "readdress_chat_output",
+    "serialize_chat_output",
+]
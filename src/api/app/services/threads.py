@@ -1,8 +1,20 @@
-from azure.ai.agents.models import ThreadMessageOptions
+import json
+import logging
+from datetime import datetime
+
+from azure.ai.agents.models import ListSortOrder, MessageRole, RunStatus
 from semantic_kernel.agents.azure_ai.azure_ai_agent import AzureAIAgentThread
 
+from app.config import get_settings
 from app.models.chat_create_thread_output import ChatCreateThreadOutput
+from app.models.chat_get_thread import ChatGetThreadInput
+from app.models.chat_get_thread_output import (ChatGetThreadOutput,
+                                               ThreadMessageOutput)
+from app.models.token_usage import TokenUsage
 from app.services.dependencies import AIProjectClient
+from app.services.message_store import get_create_message_store
+
+logger = logging.getLogger("uvicorn.error")
 
 async def create_thread(azure_ai_client: AIProjectClient):
     thread = await azure_ai_client.agents.threads.create()
@@ -10,39 +22,126 @@ async def create_thread(azure_ai_client: AIProjectClient):
     return ChatCreateThreadOutput(thread_id=thread.id)
 
 async def get_agent_thread(thread_id, azure_ai_client: AIProjectClient):
-        thread_messages = await get_thread(thread_id, azure_ai_client)
+    # Binds to the existing thread. Its history already lives in the agents service, so none is copied.
+    return AzureAIAgentThread(
+        client=azure_ai_client,
+        thread_id=thread_id,
+    )
+
+def get_thread_client(thread: AzureAIAgentThread) -> AIProjectClient:
+    # The client of the AI project the thread lives in
+    return thread._client
+
+async def delete_thread_quietly(thread: AzureAIAgentThread):
+    # Used to clean up scratch threads, where a failure shouldn't fail the run
+    try:
+        await thread.delete()
+    except Exception as e:
+        logger.error(f"Error deleting thread {thread.id}: {e}")
+
+async def get_thread(thread_input: ChatGetThreadInput, azure_ai_client: AIProjectClient):
+    # Read-through: the agents service is only called for threads not yet stored or changed by a run
+    store = get_create_message_store()
+    await store.read_through(thread_input.thread_id, azure_ai_client, refresh=thread_input.refresh)
+
+    # Without a limit or cursor, the whole history is returned as a list, as it was before pagination
+    if thread_input.limit is None and thread_input.after is None and thread_input.before is None:
+        return [ThreadMessageOutput(**message)
+                async for message in store.iter_messages(thread_id=thread_input.thread_id,
+                                                         order=ListSortOrder(thread_input.order),
+                                                         page_size=get_settings().get_thread_max_limit)]
+
+    limit = min(thread_input.limit or get_settings().get_thread_default_limit, get_settings().get_thread_max_limit)
+    page = await store.get_page(thread_id=thread_input.thread_id,
+                                limit=limit,
+                                after=thread_input.after,
+                                before=thread_input.before,
+                                order=ListSortOrder(thread_input.order))
+
+    return ChatGetThreadOutput(
+        data=[ThreadMessageOutput(**message) for message in page.messages],
+        first_id=page.messages[0]["id"] if page.messages else None,
+        last_id=page.messages[-1]["id"] if page.messages else None,
+        has_more=page.has_more,
+    )
+
+async def stream_thread(thread_input: ChatGetThreadInput, azure_ai_client: AIProjectClient):
+    # Syncs and checks the cursors before the response starts, so errors can still get a status code
+    store = get_create_message_store()
+    await store.read_through(thread_input.thread_id, azure_ai_client, refresh=thread_input.refresh)
+    await store.check_cursors(thread_input.thread_id, thread_input.after, thread_input.before)
+
+    return _stream_messages(thread_input)
+
+async def _stream_messages(thread_input: ChatGetThreadInput):
+    # One message per line, reading the store a page at a time. Unlike
+    # get_thread the limit is optional, so a whole thread can be streamed.
+    store = get_create_message_store()
+    async for message in store.iter_messages(thread_id=thread_input.thread_id,
+                                             limit=thread_input.limit,
+                                             after=thread_input.after,
+                                             before=thread_input.before,
+                                             order=ListSortOrder(thread_input.order),
+                                             page_size=get_settings().get_thread_max_limit):
+        yield json.dumps(message) + "\n"
 
-        messages = []
+async def sync_thread_quietly(thread_id: str, azure_ai_client: AIProjectClient):
+    # Write-through at the end of a run, where a failure shouldn't fail the run
+    try:
+        await get_create_message_store().sync(thread_id, azure_ai_client)
+    except Exception as e:
+        logger.error(f"Error syncing messages of thread {thread_id}: {e}")
 
-        for message in thread_messages:
-            msg = ThreadMessageOptions(
-                content=message['content'],
-                role=message['role']
-            )
-            messages.append(msg)
+async def add_agent_messages(thread_id: str, contents: list[str], azure_ai_client: AIProjectClient):
+    # Records output produced on another thread, e.g. by a shared run, as the agent's messages on this one
+    store = get_create_message_store()
+    await store.mark_stale(thread_id)
+    for content in contents:
+        await azure_ai_client.agents.messages.create(thread_id=thread_id, role=MessageRole.AGENT, content=content)
+    await sync_thread_quietly(thread_id, azure_ai_client)
 
-        thread = AzureAIAgentThread(
-            client=azure_ai_client,
-            thread_id=thread_id,
-            messages=messages
-        )
+async def cancel_active_runs(thread_id: str,
+                             azure_ai_client: AIProjectClient,
+                             created_after: datetime) -> list[int]:
+    # Runs are listed newest first, so stop at the first run older than created_after.
+    # Returns the token usage of the runs that completed in that window.
+    completed_run_tokens = []
+    async for run in azure_ai_client.agents.runs.list(thread_id=thread_id):
+        if run.created_at < created_after:
+            break
 
-        return thread
+        if run.status in (RunStatus.QUEUED, RunStatus.IN_PROGRESS, RunStatus.REQUIRES_ACTION):
+            await azure_ai_client.agents.runs.cancel(thread_id=thread_id, run_id=run.id)
+        elif run.status == RunStatus.COMPLETED and run.usage:
+            completed_run_tokens.append(run.usage.total_tokens)
 
-async def get_thread(thread_id: str, azure_ai_client: AIProjectClient):
-    messages = []
-    async for msg in azure_ai_client.agents.messages.list(thread_id=thread_id):
-        messages.append(msg)
+    return completed_run_tokens
 
-    return_value = []
+async def get_thread_token_usage(thread_id: str,
+                                 azure_ai_client: AIProjectClient,
+                                 created_after: datetime) -> TokenUsage:
+    # Runs are listed newest first, so stop at the first run older than created_after
+    token_usage = TokenUsage()
+    async for run in azure_ai_client.agents.runs.list(thread_id=thread_id):
+        if run.created_at < created_after:
+            break
 
-    for message in messages:
-        return_value.append({"role": message.role, "content": message.content})
+        if run.usage:
+            token_usage.add(TokenUsage(prompt_tokens=run.usage.prompt_tokens,
+                                       completion_tokens=run.usage.completion_tokens,
+                                       total_tokens=run.usage.total_tokens))
 
-    return return_value
+    return token_usage
 
 __all__ = [
+     'add_agent_messages',
+     'cancel_active_runs',
+     'delete_thread_quietly',
      'get_agent_thread',
+     'get_thread_client',
+     'get_thread_token_usage',
      'get_thread',
+     'stream_thread',
+     'sync_thread_quietly',
      'create_thread'
 ]
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import time
+from functools import lru_cache
+from typing import Awaitable, Callable
+
+import psutil
+from opentelemetry import metrics
+from pydantic import BaseModel
+
+from app.config import get_settings
+from app.preload import preload
+from app.services.health import get_create_health_monitor
+from app.services.image_cache import get_create_image_cache
+from app.services.knowledge_base import get_create_knowledge_base_sync
+from app.services.message_store import get_create_message_store
+from app.services.result_cache import get_create_result_cache
+from app.services.step_cache import get_create_step_cache
+
+logger = logging.getLogger("uvicorn.error")
+meter = metrics.get_meter(__name__)
+
+cold_start_histogram = meter.create_histogram(
+    name="cloud_service_onboarding.startup.cold_start_duration",
+    unit="ms",
+    description="Time from the start of the API process until warm-up finished",
+)
+task_duration_histogram = meter.create_histogram(
+    name="cloud_service_onboarding.startup.warm_up_task_duration",
+    unit="ms",
+    description="Duration of each warm-up task, by task and result",
+)
+
+
+class WarmUpStatus(BaseModel):
+    status: str = "pending"  # Or ready
+    attempts: int = 0  # Rounds of tasks run, including retries
+    task_durations_ms: dict[str, float] = {}
+    cold_start_ms: float | None = None
+    error: str | None = None
+
+
+class WarmUp:
+    """Runs the startup work of the API in the background.
+
+    ``stages`` run one after the other and the tasks of a stage run
+    concurrently. A stage whose tasks fail is retried after
+    ``retry_delay_seconds``, rerunning only the tasks that failed, so the
+    API keeps serving probes, reporting itself not ready, until it has
+    warmed up.
+    """
+
+    def __init__(self,
+                 stages: list[dict[str, Callable[[], Awaitable[None]]]],
+                 retry_delay_seconds: float):
+        self._stages = stages
+        self._retry_delay_seconds = retry_delay_seconds
+        self._status = WarmUpStatus()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self._status.status == "ready"
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> WarmUpStatus:
+        return self._status.model_copy()
+
+    async def _run(self):
+        for stage in self._stages:
+            pending = dict(stage)
+            while pending:
+                self._status.attempts += 1
+                results = await asyncio.gather(*(self._run_task(name, task) for name, task in pending.items()))
+                pending = {name: task for (name, task), ok in zip(pending.items(), results) if not ok}
+                if pending:
+                    await asyncio.sleep(self._retry_delay_seconds)
+
+        # Includes starting the interpreter and importing the app, which happen before the event loop exists
+        cold_start_ms = (time.time() - psutil.Process().create_time()) * 1000
+        cold_start_histogram.record(cold_start_ms)
+
+        self._status.status = "ready"
+        self._status.cold_start_ms = round(cold_start_ms, 1)
+        self._status.error = None
+        logger.info(f"Warm-up finished, {cold_start_ms:.0f}ms after the process started")
+
+    async def _run_task(self, name: str, task: Callable[[], Awaitable[None]]) -> bool:
+        started = time.perf_counter()
+        try:
+            await task()
+            error = None
+        except Exception as e:
+            error = f"{name}: {e}"
+            logger.error(f"Warm-up task {name} failed, retrying in {self._retry_delay_seconds}s: {e}")
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        task_duration_histogram.record(duration_ms, {"task": name, "result": "error" if error else "ok"})
+        self._status.task_durations_ms[name] = round(duration_ms, 1)
+        if error is not None:
+            self._status.error = error
+        return error is None
+
+
+async def import_modules():
+    # Imports hold the GIL in bursts only, so the event loop keeps serving probes meanwhile
+    await asyncio.to_thread(preload)
+
+
+async def set_up_agents():
+    from app.services.agents import setup_agents
+
+    await setup_agents()
+
+
+async def open_local_stores():
+    # Creating the SQLite schemas and cache directories is blocking
+    def open_stores():
+        get_create_result_cache()
+        get_create_step_cache()
+        get_create_message_store()
+        get_create_knowledge_base_sync()
+        if get_settings().image_cache_enabled:
+            get_create_image_cache()
+
+    await asyncio.to_thread(open_stores)
+
+
+async def check_dependencies():
+    # Readiness reflects the dependencies as soon as warm-up finishes, rather than after the first interval
+    health_monitor = get_create_health_monitor()
+    await health_monitor.check_all()
+    health_monitor.start(delay_first_check=True)
+
+
+@lru_cache
+def get_create_warm_up() -> WarmUp:
+    return WarmUp(
+        stages=[
+            {
+                "imports": import_modules,
+                "local_stores": open_local_stores,
+            },
+            {
+                "agents": set_up_agents,
+            },
+            {
+                "dependencies": check_dependencies,
+            },
+        ],
+        retry_delay_seconds=get_settings().warm_up_retry_delay_seconds,
+    )
+
+
+__all__ = [
+    "WarmUp",
+    "WarmUpStatus",
+    "get_create_warm_up",
+]
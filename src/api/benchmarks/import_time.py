@@ -0,0 +1,73 @@
+"""Summarizes ``python -X importtime`` for importing a module of the API.
+
+Lists the top-level packages that take the longest to import, the app modules
+that take the longest including what they import, and which app module first
+imports each of the slowest packages, i.e. where to make an import lazy.
+
+Run from ``src/api`` with the usual ``.env``::
+
+    python -m benchmarks.import_time --module app.main --top 15
+"""
+import argparse
+import subprocess
+import sys
+
+
+def profile(module: str) -> list[tuple[int, int, str]]:
+    """Imports ``module`` in a fresh interpreter, returning (self us, cumulative us, indented name) per import."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True, check=True)
+
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|", 2)
+        imports.append((int(self_us), int(cumulative_us), name))
+    return imports
+
+
+def main(args: argparse.Namespace):
+    imports = profile(args.module)
+
+    packages: dict[str, int] = {}
+    app_modules: dict[str, int] = {}
+    app_importers: dict[str, str] = {}
+
+    # Reversed, every import comes after the import that triggered it, the one before it that's less indented
+    stack: list[tuple[int, str]] = []
+    for self_us, cumulative_us, name in reversed(imports):
+        depth = len(name) - len(name.lstrip())
+        name = name.strip()
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+        if package == "app":
+            app_modules[name] = cumulative_us
+        else:
+            # The app module closest to where the package was first imported
+            importer = next((parent for _, parent in reversed(stack) if parent.split(".")[0] == "app"), None)
+            if importer is not None and package not in app_importers:
+                app_importers[package] = importer
+        stack.append((depth, name))
+
+    total_us = sum(self_us for self_us, _, _ in imports)
+    print(f"import {args.module}: {total_us / 1000:.0f}ms, {len(imports)} modules\n")
+
+    print(f"{'package':<40}{'self (ms)':>12}  first imported by")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        if package != "app":
+            print(f"{package:<40}{self_us / 1000:>12.1f}  {app_importers.get(package, '-')}")
+
+    print(f"\n{'app module':<60}{'cumulative (ms)':>16}")
+    for name, cumulative_us in sorted(app_modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<60}{cumulative_us / 1000:>16.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=15)
+    main(parser.parse_args())
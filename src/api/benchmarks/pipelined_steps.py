@@ -0,0 +1,128 @@
+"""Compares sequential and pipelined execution of the onboarding process.
+
+The agent is replaced by fake token streams, so this measures orchestration
+only. BuildAzurePolicyStep streams ``--policies`` fenced JSON policies, and
+Terraform generation streams ``--terraform-tokens`` tokens per policy.
+
+Run from ``src/api`` with the usual ``.env``::
+
+    python -m benchmarks.pipelined_steps --policies 4 --token-delay-ms 5
+"""
+import argparse
+import asyncio
+import time
+
+from semantic_kernel import Kernel
+from semantic_kernel.agents.azure_ai.azure_ai_agent import AzureAIAgentThread
+from semantic_kernel.contents.streaming_text_content import StreamingTextContent
+from semantic_kernel.processes.kernel_process import KernelProcessEvent
+from semantic_kernel.processes.local_runtime.local_kernel_process import start
+
+from app.config import get_settings
+from app.models.chat_output import ChatOutput
+from app.models.streaming_text_output import StreamingTextOutput
+from app.process_framework.models.retrieve_internal_security_recommendations_step_parameters import \
+    RetrieveInternalSecurityRecommendationsStepParameters
+from app.process_framework.processes.cloud_service_onboarding_process import \
+    build_process_cloud_service_onboarding
+from app.process_framework.steps import write_terraform
+from app.process_framework.utilities import utilities
+from app.services.dependencies import get_create_ai_project_client
+
+TERRAFORM_MARKER = "resource"
+
+
+def build_fake_invoke_agent_stream(args: argparse.Namespace):
+    async def stream(tokens: list[str]):
+        for token in tokens:
+            await asyncio.sleep(args.token_delay_ms / 1000)
+            yield StreamingTextContent(choice_index=0, text=token)
+
+    def policy_tokens() -> list[str]:
+        tokens = []
+        for index in range(args.policies):
+            tokens += ["Policy", f" {index}:\n", "```json\n"]
+            tokens += [f'"p{index}_{i}": {i},\n' for i in range(args.policy_tokens)]
+            tokens += ["\n```\n"]
+        return tokens
+
+    def terraform_tokens(policies: int) -> list[str]:
+        return [TERRAFORM_MARKER] + [f" t{i}" for i in range(policies * args.terraform_tokens - 1)]
+
+    async def fake_invoke_agent_stream(agent_name: str, thread, message: str, additional_instructions: str = ""):
+        if additional_instructions == build_azure_policy.BuildAzurePolicyStep.additional_instructions:
+            tokens = policy_tokens()
+        elif additional_instructions == write_terraform.WriteTerraformStep.additional_instructions:
+            # One policy when generating per section, all of them otherwise
+            tokens = terraform_tokens(1 if "```json" in message else args.policies)
+        else:
+            tokens = [f" r{i}" for i in range(args.research_tokens)]
+
+        async for response in stream(tokens):
+            yield response
+
+    return fake_invoke_agent_stream
+
+
+async def run_process(pipelined: bool) -> tuple[float, float | None]:
+    get_settings().pipelined_steps_enabled = pipelined
+
+    started = time.perf_counter()
+    first_terraform_token: float | None = None
+
+    async def post_intermediate_message(chat_output: ChatOutput):
+        nonlocal first_terraform_token
+        if first_terraform_token is None and isinstance(chat_output, StreamingTextOutput) \
+                and chat_output.text.startswith(TERRAFORM_MARKER):
+            first_terraform_token = time.perf_counter() - started
+
+    process = build_process_cloud_service_onboarding(
+        thread=AzureAIAgentThread(client=get_create_ai_project_client(), thread_id="benchmark"),
+        public_documentation_thread=AzureAIAgentThread(client=get_create_ai_project_client(),
+                                                       thread_id="benchmark-public-documentation"),
+        post_intermediate_message=post_intermediate_message,
+    )
+
+    async with await start(
+        process=process,
+        kernel=Kernel(),
+        initial_event=KernelProcessEvent(id="Start", data=RetrieveInternalSecurityRecommendationsStepParameters(
+            cloud_service_name="Benchmark Service",
+        ).model_dump()),
+    ):
+        pass
+
+    return time.perf_counter() - started, first_terraform_token
+
+
+async def main(args: argparse.Namespace):
+    fake_invoke_agent_stream = build_fake_invoke_agent_stream(args)
+    # The steps invoke the agent through run_cached_step, and Terraform sections directly
+    for module in (utilities, write_terraform):
+        module.invoke_agent_stream = fake_invoke_agent_stream  # type: ignore
+
+    get_settings().step_cache_enabled = False
+
+    results = {}
+    for pipelined in (False, True):
+        results[pipelined] = [await run_process(pipelined) for _ in range(args.repeat)]
+
+    print(f"{'mode':<12}{'end-to-end (s)':>18}{'first Terraform token (s)':>28}")
+    for pipelined, runs in results.items():
+        end_to_end = sum(run[0] for run in runs) / len(runs)
+        first_token = sum(run[1] or 0 for run in runs) / len(runs)
+        print(f"{'pipelined' if pipelined else 'sequential':<12}{end_to_end:>18.2f}{first_token:>28.2f}")
+
+    sequential, pipelined = (sum(run[0] for run in results[mode]) / args.repeat for mode in (False, True))
+    print(f"\nEnd-to-end time reduced by {(1 - pipelined / sequential) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--policies", type=int, default=4)
+    parser.add_argument("--policy-tokens", type=int, default=100)
+    parser.add_argument("--terraform-tokens", type=int, default=100)
+    parser.add_argument("--research-tokens", type=int, default=50)
+    parser.add_argument("--token-delay-ms", type=float, default=5)
+    parser.add_argument("--repeat", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
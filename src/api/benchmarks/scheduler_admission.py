@@ -0,0 +1,71 @@
+"""Checks that the run scheduler bounds a burst of admissions.
+
+Admits ``--burst`` runs in the same tick, before any of their tasks gets to
+take a run slot, then runs the admitted ones with a stubbed run of
+``--run-ms``, cancelling the first one before it starts. Fails if more runs
+were admitted than there are run slots and queue places, if more runs
+executed at once than there are run slots, or if the cancelled run keeps
+the others from draining.
+
+Run from ``src/api``::
+
+    python -m benchmarks.scheduler_admission --burst 50 --max-concurrent-runs 2 --max-queued-runs 3
+"""
+import argparse
+import asyncio
+import time
+
+from app.services.scheduler import RunScheduler, SchedulerSaturatedError
+
+
+async def main(args: argparse.Namespace):
+    scheduler = RunScheduler(max_concurrent_runs=args.max_concurrent_runs,
+                             max_queued_runs=args.max_queued_runs,
+                             default_retry_after=60)
+
+    tickets = []
+    rejected = 0
+    for _ in range(args.burst):
+        try:
+            tickets.append(scheduler.admit())
+        except SchedulerSaturatedError:
+            rejected += 1
+
+    running = 0
+    peak_running = 0
+
+    async def stub_run():
+        nonlocal running, peak_running
+        running += 1
+        peak_running = max(peak_running, running)
+        await asyncio.sleep(args.run_ms / 1000)
+        running -= 1
+
+    started = time.perf_counter()
+    tasks = [scheduler.start(ticket=ticket, run_function=stub_run) for ticket in tickets]
+    if tasks:
+        tasks[0].cancel()  # Before its task ever ran, so before its ticket took a run slot
+    drain_timeout = 10 * args.run_ms / 1000 * len(tickets) + 1
+    done, pending = await asyncio.wait(tasks, timeout=drain_timeout)
+    elapsed = time.perf_counter() - started
+
+    capacity = args.max_concurrent_runs + args.max_queued_runs
+    print(f"admitted {len(tickets)}, rejected {rejected}, peak running {peak_running}, "
+          f"drained in {elapsed:.2f}s")
+
+    if pending:
+        raise AssertionError(f"{len(pending)} runs didn't drain within {drain_timeout:.1f}s "
+                             f"after a queued run was cancelled")
+    if len(tickets) > capacity:
+        raise AssertionError(f"Admitted {len(tickets)} runs, more than the {capacity} slots and queue places")
+    if peak_running > args.max_concurrent_runs:
+        raise AssertionError(f"Ran {peak_running} runs at once, more than the {args.max_concurrent_runs} slots")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--max-concurrent-runs", type=int, default=2)
+    parser.add_argument("--max-queued-runs", type=int, default=3)
+    parser.add_argument("--run-ms", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
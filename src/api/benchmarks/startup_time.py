@@ -0,0 +1,103 @@
+"""Measures how long the API takes to import, failing if it regressed.
+
+Imports ``app.main`` in ``--repeat`` fresh interpreters and reports the median
+time. Exits with an error if the median exceeds ``--max-import-ms`` or if
+importing the app loaded any of the SDKs that are meant to load on first use.
+With ``--serve``, also measures the time from starting uvicorn until the
+liveness probe answers.
+
+Run from ``src/api`` with the usual ``.env``::
+
+    python -m benchmarks.startup_time --repeat 5 --max-import-ms 3000
+"""
+import argparse
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+# Only imported by the request handlers and the warm-up, not when the app is loaded
+LAZY_MODULES = [
+    "azure.ai.projects",
+    "azure.identity",
+    "azure.monitor.opentelemetry",
+    "numpy",
+    "openai",
+    "semantic_kernel",
+]
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+started = time.perf_counter()
+import app.main
+print(json.dumps({{
+    "import_ms": (time.perf_counter() - started) * 1000,
+    "loaded": [name for name in {LAZY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure_import() -> tuple[float, list[str]]:
+    completed = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.splitlines()[-1])
+    return result["import_ms"], result["loaded"]
+
+
+def measure_liveness(timeout_seconds: float) -> float:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+                               "--log-level", "warning"])
+    try:
+        while time.perf_counter() - started < timeout_seconds:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/v1/liveness", timeout=1).status_code == 200:
+                    return (time.perf_counter() - started) * 1000
+            except httpx.TransportError:
+                pass
+            time.sleep(0.05)
+        raise TimeoutError(f"The API didn't answer the liveness probe within {timeout_seconds}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(args: argparse.Namespace) -> int:
+    import_times = []
+    loaded: set[str] = set()
+    for _ in range(args.repeat):
+        import_ms, loaded_modules = measure_import()
+        import_times.append(import_ms)
+        loaded.update(loaded_modules)
+
+    median_ms = statistics.median(import_times)
+    print(f"import app.main: median {median_ms:.0f}ms, min {min(import_times):.0f}ms, "
+          f"max {max(import_times):.0f}ms over {args.repeat} run(s)")
+
+    if args.serve:
+        print(f"uvicorn to first liveness response: {measure_liveness(args.serve_timeout_seconds):.0f}ms")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: importing the app loaded {', '.join(sorted(loaded))}, which should load on first use")
+        failed = True
+    if median_ms > args.max_import_ms:
+        print(f"FAIL: median import time {median_ms:.0f}ms exceeds {args.max_import_ms:.0f}ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=3000)
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--serve-timeout-seconds", type=float, default=30)
+    sys.exit(main(parser.parse_args()))
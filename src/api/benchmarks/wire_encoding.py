@@ -0,0 +1,83 @@
+"""Compares the precompiled frame encoders with json.dumps and the dict serializers.
+
+For each content type, times building the frame with and without validation,
+serializing it with ``json.dumps`` and the model's dict serializer and encoding
+the line the way the response does, and encoding it straight to bytes with
+``encode_chat_output``. Both must produce the same bytes, which is checked
+before timing.
+
+Run from ``src/api`` with the usual ``.env``::
+
+    python -m benchmarks.wire_encoding --number 100000
+"""
+import argparse
+import json
+import timeit
+
+from app.models.streaming_annotation_file_output import (
+    StreamingAnnotationFileOutput, serialize_streaming_annotation_file_output)
+from app.models.streaming_annotation_url_output import (
+    StreamingAnnotationUrlOutput, serialize_streaming_annotation_url_output)
+from app.models.streaming_detached_output import (
+    StreamingDetachedOutput, serialize_streaming_detached_output)
+from app.models.streaming_queue_position_output import (
+    StreamingQueuePositionOutput, serialize_streaming_queue_position_output)
+from app.models.streaming_sentinel_output import (
+    StreamingSentinelOutput, serialize_streaming_sentinel_output)
+from app.models.streaming_text_output import (StreamingTextOutput,
+                                              serialize_streaming_text_output)
+from app.services.streaming import encode_chat_output
+
+THREAD_ID = "thread_abc123XYZabc123XYZabc12"
+
+# Per content type, the model, its dict serializer and the fields of a typical frame
+CASES = {
+    "markdown": (StreamingTextOutput, serialize_streaming_text_output,
+                 {"text": " recommendation", "thread_id": THREAD_ID, "branch": "terraform"}),
+    "markdown (escapes)": (StreamingTextOutput, serialize_streaming_text_output,
+                           {"text": '"Zugriff" → \U0001F512\n\t', "thread_id": THREAD_ID}),
+    "annotation_url": (StreamingAnnotationUrlOutput, serialize_streaming_annotation_url_output,
+                       {"start_index": 120, "end_index": 134, "url": "https://learn.microsoft.com/azure/storage",
+                        "title": "Azure Storage security", "thread_id": THREAD_ID}),
+    "annotation_file": (StreamingAnnotationFileOutput, serialize_streaming_annotation_file_output,
+                        {"start_index": 120, "end_index": 134, "file_id": "assistant-abc123",
+                         "quote": "", "thread_id": THREAD_ID}),
+    "sentinel": (StreamingSentinelOutput, serialize_streaming_sentinel_output, {"thread_id": ""}),
+    "queue_position": (StreamingQueuePositionOutput, serialize_streaming_queue_position_output,
+                       {"position": 3, "thread_id": THREAD_ID}),
+    "detached": (StreamingDetachedOutput, serialize_streaming_detached_output, {"thread_id": THREAD_ID}),
+}
+
+
+def time_ns(function, args: argparse.Namespace) -> float:
+    return min(timeit.repeat(function, number=args.number, repeat=args.repeat)) / args.number * 1e9
+
+
+def main(args: argparse.Namespace):
+    print(f"{'content type':<20}{'validate (ns)':>15}{'construct (ns)':>16}{'json.dumps (ns)':>17}"
+          f"{'encoder (ns)':>14}{'speed-up':>10}")
+    for name, (model, serializer, fields) in CASES.items():
+        frame = model(**fields)
+
+        def serialize() -> bytes:
+            return (json.dumps(obj=frame, default=serializer) + "\n").encode("utf-8")
+
+        if serialize() != encode_chat_output(frame):
+            raise AssertionError(f"{name}: {serialize()!r} != {encode_chat_output(frame)!r}")
+
+        validate_ns = time_ns(lambda: model(**fields), args)
+        construct_ns = time_ns(lambda: model.model_construct(**fields), args)
+        serialize_ns = time_ns(serialize, args)
+        encode_ns = time_ns(lambda: encode_chat_output(frame), args)
+
+        # Frames are built with validation either way, as it's cheaper than model_construct
+        speed_up = (validate_ns + serialize_ns) / (validate_ns + encode_ns)
+        print(f"{name:<20}{validate_ns:>15.0f}{construct_ns:>16.0f}{serialize_ns:>17.0f}"
+              f"{encode_ns:>14.0f}{speed_up:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,148 @@
+"""Measures how many chat streams one replica sustains for each worker count.
+
+Runs ``app.server`` with a stand-in app that streams NDJSON text frames through
+the API's serializer, spending ``--token-cpu-us`` of CPU on every token to
+stand in for the SDK parsing the model's stream, so no agent is called. For
+each worker count it opens each of ``--streams`` concurrent streams and
+measures how late frames arrive against the pace they are emitted at. A
+stream count is sustained while the p95 lateness stays under ``--max-lag-ms``.
+
+Run from ``src/api`` with the usual ``.env``::
+
+    python -m benchmarks.worker_scaling --workers 1 2 4 --streams 50 100 200
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from app.models.streaming_text_output import StreamingTextOutput
+from app.services.streaming import serialize_chat_output
+
+app = FastAPI()
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/stream")
+async def stream(tokens: int, interval_ms: float, cpu_us: float):
+    async def frames():
+        for i in range(tokens):
+            await asyncio.sleep(interval_ms / 1000)
+            busy_until = time.perf_counter() + cpu_us / 1_000_000
+            while time.perf_counter() < busy_until:
+                pass
+            yield serialize_chat_output(StreamingTextOutput(thread_id="benchmark", text=f"token {i} "))
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+
+async def read_streams(port: int, count: int, tokens: int, interval_ms: float, cpu_us: float) -> list[float]:
+    """Reads ``count`` concurrent streams, returning how late each frame arrived in ms."""
+    lateness: list[float] = []
+
+    async def read_stream(client: httpx.AsyncClient):
+        started = time.perf_counter()
+        params = {"tokens": tokens, "interval_ms": interval_ms, "cpu_us": cpu_us}
+        async with client.stream("GET", f"http://127.0.0.1:{port}/stream", params=params) as response:
+            i = 0
+            async for _ in response.aiter_lines():
+                i += 1
+                lateness.append(max((time.perf_counter() - started) * 1000 - i * interval_ms, 0))
+
+    limits = httpx.Limits(max_connections=count, max_keepalive_connections=count)
+    async with httpx.AsyncClient(limits=limits, timeout=None) as client:
+        await asyncio.gather(*(read_stream(client) for _ in range(count)))
+    return lateness
+
+
+def read_streams_in_process(port: int, count: int, tokens: int, interval_ms: float, cpu_us: float) -> list[float]:
+    return asyncio.run(read_streams(port, count, tokens, interval_ms, cpu_us))
+
+
+def start_server(workers: int) -> tuple[subprocess.Popen, int]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.worker_scaling", "serve",
+                               "--workers", str(workers), "--port", str(port)])
+    for _ in range(300):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return server, port
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise TimeoutError(f"The server with {workers} worker(s) didn't start")
+
+
+def main(args: argparse.Namespace):
+    print(f"{'workers':>8}{'streams':>9}{'p50 lag (ms)':>14}{'p95 lag (ms)':>14}{'max lag (ms)':>14}  sustained")
+
+    sustained: dict[int, int] = {}
+    with ProcessPoolExecutor(max_workers=args.client_processes) as executor:
+        for workers in args.workers:
+            server, port = start_server(workers)
+            try:
+                for streams in args.streams:
+                    # Spread the streams over several client processes, so the client isn't the bottleneck
+                    counts = [streams // args.client_processes + (i < streams % args.client_processes)
+                              for i in range(args.client_processes)]
+                    futures = [executor.submit(read_streams_in_process, port, count, args.tokens,
+                                               args.token_interval_ms, args.token_cpu_us)
+                               for count in counts if count]
+                    lateness = sorted(value for future in futures for value in future.result())
+
+                    p95 = lateness[int(len(lateness) * 0.95) - 1]
+                    ok = p95 <= args.max_lag_ms
+                    if ok:
+                        sustained[workers] = max(sustained.get(workers, 0), streams)
+                    print(f"{workers:>8}{streams:>9}{statistics.median(lateness):>14.1f}{p95:>14.1f}"
+                          f"{lateness[-1]:>14.1f}  {'yes' if ok else 'no'}")
+            finally:
+                os.kill(server.pid, signal.SIGTERM)
+                server.wait()
+
+    print(f"\nStreams per replica with p95 lag under {args.max_lag_ms:.0f}ms (of those tried):")
+    for workers in args.workers:
+        print(f"{workers:>3} worker(s): {sustained.get(workers, 0)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve_parser = subparsers.add_parser("serve", help="Runs the stand-in app, used by the benchmark itself")
+    serve_parser.add_argument("--workers", type=int, required=True)
+    serve_parser.add_argument("--port", type=int, required=True)
+
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--streams", type=int, nargs="+", default=[50, 100, 200, 400])
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--token-interval-ms", type=float, default=20)
+    parser.add_argument("--token-cpu-us", type=float, default=200)
+    parser.add_argument("--max-lag-ms", type=float, default=100)
+    parser.add_argument("--client-processes", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        from app.server import run
+
+        run("benchmarks.worker_scaling:app", host="127.0.0.1", port=args.port, workers=args.workers,
+            log_level="warning")
+    else:
+        main(args)
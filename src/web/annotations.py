@@ -0,0 +1,47 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Annotation:
+    """A citation replacing ``text[start_index:end_index]`` of the message it was streamed with."""
+    start_index: int
+    end_index: int
+    replacement: str
+
+
+def file_annotation(start_index: int, end_index: int, file_id: str) -> Annotation:
+    return Annotation(start_index=start_index, end_index=end_index, replacement=f"({file_id})")
+
+
+def url_annotation(start_index: int, end_index: int, title: str, url: str) -> Annotation:
+    return Annotation(start_index=start_index, end_index=end_index, replacement=f"([{title}]({url}))")
+
+
+def apply_annotations(text: str, annotations: list[Annotation]) -> str:
+    """Replaces the cited spans of ``text`` in a single pass.
+
+    Offsets are those of the message as streamed, so applying a citation
+    doesn't shift the ones after it. Citations overlapping an earlier one,
+    such as one streamed twice, or outside of ``text`` are skipped.
+    """
+    parts = []
+    position = 0
+    # Citations are streamed in order, and sorting an ordered list takes linear time
+    for annotation in sorted(annotations, key=lambda annotation: annotation.start_index):
+        if annotation.start_index < position or annotation.end_index < annotation.start_index \
+                or annotation.end_index > len(text):
+            continue
+        parts.append(text[position:annotation.start_index])
+        parts.append(annotation.replacement)
+        position = annotation.end_index
+
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+__all__ = [
+    "Annotation",
+    "apply_annotations",
+    "file_annotation",
+    "url_annotation",
+]
@@ -9,15 +9,17 @@ from semantic_kernel.contents import (ChatMessageContent, ImageContent,
 from semantic_kernel.contents.chat_history import ChatHistory
 from semantic_kernel.contents.utils.author_role import AuthorRole
 
+from annotations import Annotation, apply_annotations, file_annotation, url_annotation
 from models.chat_output import deserialize_chat_output
 from models.streaming_annotation_file_output import deserialize_streaming_annotation_file_output
 from models.streaming_annotation_url_output import deserialize_streaming_annotation_url_output
+from models.streaming_queue_position_output import deserialize_streaming_queue_position_output
 from models.streaming_text_output import deserialize_streaming_text_output
 from models.content_type_enum import ContentTypeEnum
-from models.streaming_annotation_file_output import StreamingAnnotationFileOutput
-from models.streaming_annotation_url_output import StreamingAnnotationUrlOutput
-from services.chat import chat, create_thread, get_image
-from utilities import replace_annotation_placeholder
+from config import get_settings
+from rendering import IncrementalRenderer
+from services.chat import ChatBusyError, chat, create_thread, get_image
+from stream_reader import StreamReader
 
 
 def _handle_user_interaction():
@@ -50,29 +52,31 @@ if "thread_id" not in st.session_state:
         st.session_state.thread_id = thread_id
 
 
-def render_response(response):
-    full_stream_content = ""
-    individual_stream_content = ""
+def render_response(response, renderer: IncrementalRenderer):
+    class BranchContent(BaseModel):
+        individual_stream_content: str = ""
+        annotations: List[Annotation] = []  # Citations, applied to the content once it's complete
 
-    class QuoteUrls(BaseModel):
-        quote: str = ""
-        url: str = ""
-
-    quote_urls: List[QuoteUrls] = []  # List to store URL annotations
+    # Parallel process branches are multiplexed onto one stream, so each is
+    # accumulated separately and rendered as its own section
+    branches: dict[str, BranchContent] = {}
 
     images = []
     for chunk in response:
-        delta = deserialize_chat_output(json.loads(chunk))
+        data = json.loads(chunk)
+        delta = deserialize_chat_output(data)
+        # Sections are rendered in the order their branch first posted content
+        if delta.content_type not in (ContentTypeEnum.QUEUE_POSITION, ContentTypeEnum.DETACHED):
+            branch = branches.setdefault(delta.branch, BranchContent())
 
         match delta.content_type:
             case ContentTypeEnum.MARKDOWN:
-                output = deserialize_streaming_text_output(json.loads(chunk))
-                full_stream_content += output.text
-                individual_stream_content += output.text
+                output = deserialize_streaming_text_output(data)
+                branch.individual_stream_content += output.text
 
-                st.markdown(full_stream_content)
+                renderer.append(delta.branch, output.text)
             # case ContentTypeEnum.FILE:
-            #     output = deserialize_streaming_annotation_file_output(json.loads(chunk))
+            #     output = deserialize_streaming_annotation_file_output(data)
             #     streaming_file_content = StreamingFileReferenceContent(file_id=output.file_id)
             #     file_id = streaming_file_content.file_id
             #     image = get_image(file_id=file_id)
@@ -80,48 +84,40 @@ def render_response(response):
             #     images.append(image)
 
             case ContentTypeEnum.ANNOTATION_FILE:
-                output = deserialize_streaming_annotation_file_output(json.loads(chunk))
-
-                streaming_annotation_content = StreamingAnnotationFileOutput(
-                    content_type=ContentTypeEnum.ANNOTATION_FILE,
-                    thread_id=st.session_state.thread_id,
-                    file_id=output.file_id,
-                    quote=output.quote,
-                    start_index=output.start_index,
-                    end_index=output.end_index,
-                )
-
-                individual_stream_content = replace_annotation_placeholder(original=individual_stream_content,
-                                                                           start=streaming_annotation_content.start_index,
-                                                                           end=streaming_annotation_content.end_index,
-                                                                           replacement=streaming_annotation_content.file_id)
+                output = deserialize_streaming_annotation_file_output(data)
+
+                branch.annotations.append(file_annotation(start_index=output.start_index,
+                                                          end_index=output.end_index,
+                                                          file_id=output.file_id))
 
             case ContentTypeEnum.ANNOTATION_URL:
-                output = deserialize_streaming_annotation_url_output(json.loads(chunk))
+                output = deserialize_streaming_annotation_url_output(data)
+
+                branch.annotations.append(url_annotation(start_index=output.start_index,
+                                                         end_index=output.end_index,
+                                                         title=output.title,
+                                                         url=output.url))
 
-                streaming_annotation_content = StreamingAnnotationUrlOutput(
-                    content_type=ContentTypeEnum.ANNOTATION_URL,
-                    thread_id=st.session_state.thread_id,
-                    url=output.url,
-                    title=output.title,
-                    start_index=output.start_index,
-                    end_index=output.end_index,
-                )
+            case ContentTypeEnum.QUEUE_POSITION:
+                output = deserialize_streaming_queue_position_output(data)
 
-                quote = individual_stream_content[streaming_annotation_content.start_index:streaming_annotation_content.end_index]
+                renderer.show_status(f"_Waiting for an available slot (position {output.position} in queue)..._")
 
-                quote_urls.append(QuoteUrls(quote=quote, # TODO: replace this with the quote from StreamingAnnotationUrlOutput if it gets added
-                                            url=f"([{streaming_annotation_content.title}]({streaming_annotation_content.url}))"))
+            case ContentTypeEnum.DETACHED:
+                # Only a stream that joined another request's run is detached, once it falls too far behind.
+                # The run goes on and copies its output to this thread when it completes.
+                renderer.show_status("_The response fell behind and stopped streaming. "
+                                     "It will appear in this thread once it completes._")
 
             case ContentTypeEnum.SENTINEL:
-                st.markdown(full_stream_content)
+                renderer.end_section(delta.branch)
 
-                updated_stream_content = individual_stream_content
-                for quote_url in quote_urls:
-                    updated_stream_content = updated_stream_content.replace(quote_url.quote, quote_url.url)
+                st.session_state.messages.add_assistant_message(
+                    apply_annotations(branch.individual_stream_content, branch.annotations))
+                branch.individual_stream_content = ""
+                branch.annotations = []
 
-                st.session_state.messages.add_assistant_message(updated_stream_content)
-                individual_stream_content = ""
+    renderer.flush()
 
     for image in images:
         content = ChatMessageContent(
@@ -138,11 +134,23 @@ def response(question):
     # Display assistant response in chat message container
     with st.chat_message(AuthorRole.ASSISTANT):
         with st.spinner("Reticulating splines..."):
-            response = chat(thread_id=st.session_state.thread_id,
-                            content=question)
-
-            with st.empty():
-                render_response(response)
+            settings = get_settings()
+            renderer = IncrementalRenderer(container=st.container(),
+                                           interval_ms=settings.render_interval_ms)
+            # The stream is read in the background, so rendering doesn't hold up the API while it has more to send
+            reader = StreamReader(chat(thread_id=st.session_state.thread_id,
+                                       content=question),
+                                  max_buffered=settings.stream_buffer_lines,
+                                  idle_seconds=settings.render_interval_ms / 1000,
+                                  on_idle=renderer.flush)
+
+            try:
+                with reader:
+                    render_response(reader, renderer)
+            except ChatBusyError as e:
+                st.warning(f"The assistant is busy, please try again in {e.retry_after} seconds.")
+            finally:
+                st.session_state["stream_metrics"] = reader.metrics.summary()
 
 
 @st.fragment
@@ -164,6 +172,11 @@ if "thread_id" in st.session_state:
         st.subheader(body="Thread ID", divider=True)
         st.write(st.session_state.thread_id)
 
+        if "stream_metrics" in st.session_state:
+            # Reader lag is how long the stream waited on a full buffer, render lag how long lines waited on the UI
+            st.subheader(body="Last response", divider=True)
+            st.dataframe(st.session_state["stream_metrics"])
+
     display_chat_history()
 
     if question := st.chat_input(
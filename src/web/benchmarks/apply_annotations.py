@@ -0,0 +1,88 @@
+"""Compares applying a message's citations in one pass with applying them one at a time.
+
+Builds a message of ``--citations`` citations, alternating file and URL
+citations, each a placeholder like the agent service streams. The previous
+way rebuilds the message for every file citation and calls ``str.replace``
+on the whole message for every URL citation, at the end of the section.
+Reports the time per message and how many citations each way put in the
+right place.
+
+Run from ``src/web``::
+
+    python -m benchmarks.apply_annotations --citations 500
+"""
+import argparse
+import timeit
+
+from annotations import (Annotation, apply_annotations, file_annotation,
+                         url_annotation)
+from utilities import replace_annotation_placeholder
+
+FILLER = "Restrict public network access and require private endpoints for every data plane operation. "
+
+
+def build_message(citations: int) -> tuple[str, list[Annotation], str]:
+    """Returns the message as streamed, its citations, and the message with the citations applied."""
+    parts = []
+    expected = []
+    annotations = []
+    length = 0
+    for i in range(citations):
+        placeholder = f"【{i}:0†source】"
+        start_index = length + len(FILLER)
+        end_index = start_index + len(placeholder)
+        if i % 2:
+            annotation = url_annotation(start_index=start_index, end_index=end_index,
+                                        title=f"Source {i}", url=f"https://learn.microsoft.com/azure/doc-{i}")
+        else:
+            annotation = file_annotation(start_index=start_index, end_index=end_index,
+                                         file_id=f"assistant-{i:024d}")
+        annotations.append(annotation)
+        parts += [FILLER, placeholder]
+        expected += [FILLER, annotation.replacement]
+        length += len(FILLER) + len(placeholder)
+    return "".join(parts), annotations, "".join(expected)
+
+
+def apply_one_at_a_time(message: str, annotations: list[Annotation]) -> str:
+    """The previous render_response, up to the sentinel."""
+    quote_urls = []
+    for annotation in annotations:
+        if annotation.replacement.startswith("(["):
+            quote_urls.append((message[annotation.start_index:annotation.end_index], annotation.replacement))
+        else:
+            try:
+                message = replace_annotation_placeholder(original=message,
+                                                         start=annotation.start_index,
+                                                         end=annotation.end_index,
+                                                         replacement=annotation.replacement[1:-1])
+            except ValueError:
+                pass
+
+    for quote, url in quote_urls:
+        message = message.replace(quote, url)
+    return message
+
+
+def count_placed(output: str, annotations: list[Annotation]) -> int:
+    return sum(1 for annotation in annotations if annotation.replacement in output)
+
+
+def main(args: argparse.Namespace):
+    message, annotations, expected = build_message(args.citations)
+    assert apply_annotations(message, annotations) == expected
+
+    print(f"{args.citations} citations, {len(message) / 1024:.0f} KiB message\n")
+    print(f"{'way':<20}{'time (ms)':>12}{'placed correctly':>20}")
+    for name, apply in (("one at a time", apply_one_at_a_time), ("single pass", apply_annotations)):
+        seconds = min(timeit.repeat(lambda: apply(message, annotations), number=args.number, repeat=3)) / args.number
+        output = apply(message, annotations)
+        placed = args.citations if output == expected else count_placed(output, annotations)
+        print(f"{name:<20}{seconds * 1000:>12.2f}{placed:>14}/{args.citations}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--citations", type=int, default=500)
+    parser.add_argument("--number", type=int, default=20)
+    main(parser.parse_args())
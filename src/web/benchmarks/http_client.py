@@ -0,0 +1,162 @@
+"""Load tests the web client's calls to the API with and without connection pooling.
+
+Sends ``--requests`` GETs of ``--path`` from ``--concurrency`` threads, or
+tasks for the async client, and reports requests per second, latency, the
+connections opened and the bytes received. The ways compared are a new
+connection per call, the way ``services.chat`` used to call the API, the
+pooled session, and the pooled async client. With ``--stand-in``, a local
+server answering with ``--body-kib`` of JSON is used instead of the API.
+
+Run from ``src/web``, against the API of the usual ``.env`` or a stand-in::
+
+    python -m benchmarks.http_client --path /v1/liveness --requests 2000 --concurrency 8
+    python -m benchmarks.http_client --stand-in --body-kib 64
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import urllib3.connection
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keeps connections alive
+    body = b""
+    gzip_body = b""
+
+    def do_GET(self):
+        compressed = "gzip" in self.headers.get("Accept-Encoding", "")
+        body = self.gzip_body if compressed else self.body
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if compressed:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stand_in(body_kib: int) -> str:
+    StandInHandler.body = json.dumps({"messages": ["Enable encryption at rest. "] * (body_kib * 40)}).encode()
+    StandInHandler.gzip_body = gzip.compress(StandInHandler.body, compresslevel=6)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class ConnectionCounter:
+    """Counts the connections urllib3 opens, which requests sends through."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        connect = urllib3.connection.HTTPConnection.connect
+        counter = self
+
+        def counting_connect(connection):
+            with counter._lock:
+                counter.count += 1
+            return connect(connection)
+
+        urllib3.connection.HTTPConnection.connect = counting_connect  # type: ignore
+
+
+def run_threads(args: argparse.Namespace, get) -> tuple[list[float], int]:
+    """Runs ``get`` from the threads, returning the latencies and the bytes received."""
+    latencies: list[float] = []
+    received = 0
+
+    def worker(count: int):
+        nonlocal received
+        for _ in range(count):
+            started = time.perf_counter()
+            response = get()
+            latencies.append(time.perf_counter() - started)
+            received += int(response.headers.get("Content-Length", len(response.content)))
+
+    counts = [args.requests // args.concurrency + (i < args.requests % args.concurrency)
+              for i in range(args.concurrency)]
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(worker, counts))
+    return latencies, received
+
+
+async def run_tasks(args: argparse.Namespace) -> tuple[list[float], int, int]:
+    """Runs the requests on the pooled async client, returning the latencies, bytes received and connections."""
+    from services.http import get_async_client
+
+    client = get_async_client()
+    latencies: list[float] = []
+    received = 0
+    local_ports: set[int] = set()
+
+    async def worker(count: int):
+        nonlocal received
+        for _ in range(count):
+            started = time.perf_counter()
+            response = await client.get(args.path)
+            latencies.append(time.perf_counter() - started)
+            received += int(response.headers.get("Content-Length", len(response.content)))
+            # Every connection has a local port of its own
+            local_ports.add(response.extensions["network_stream"].get_extra_info("client_addr")[1])
+
+    counts = [args.requests // args.concurrency + (i < args.requests % args.concurrency)
+              for i in range(args.concurrency)]
+    await asyncio.gather(*(worker(count) for count in counts))
+    await client.aclose()
+    return latencies, received, len(local_ports)
+
+
+def main(args: argparse.Namespace):
+    if args.stand_in:
+        os.environ["SERVICES__API__API__0"] = start_stand_in(args.body_kib)
+    os.environ["API_POOL_SIZE"] = str(args.pool_size)
+
+    from config import get_settings
+    from services.http import get_session
+
+    url = get_settings().services__api__api__0 + args.path
+    counter = ConnectionCounter()
+
+    print(f"{args.requests} x GET {url}, {args.concurrency} at a time\n")
+    print(f"{'client':<24}{'req/s':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}{'connections':>13}{'KiB received':>14}")
+
+    def report(name: str, elapsed: float, latencies: list[float], received: int, connections: int):
+        latencies.sort()
+        print(f"{name:<24}{len(latencies) / elapsed:>10.0f}{statistics.median(latencies) * 1000:>10.1f}"
+              f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:>10.1f}{connections:>13}{received / 1024:>14.0f}")
+
+    for name, get in (("connection per call", lambda: requests.get(url, timeout=60)),
+                      ("pooled session", lambda: get_session().get(url, timeout=60))):
+        connections_before = counter.count
+        started = time.perf_counter()
+        latencies, received = run_threads(args, get)
+        report(name, time.perf_counter() - started, latencies, received, counter.count - connections_before)
+
+    started = time.perf_counter()
+    latencies, received, connections = asyncio.run(run_tasks(args))
+    report("pooled async client", time.perf_counter() - started, latencies, received, connections)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default="/v1/liveness")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--stand-in", action="store_true")
+    parser.add_argument("--body-kib", type=int, default=16)
+    main(parser.parse_args())
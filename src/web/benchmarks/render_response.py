@@ -0,0 +1,121 @@
+"""Compares repainting the whole response on every delta with the incremental renderer.
+
+Replays a synthetic onboarding response, ``--sections`` sections of
+``--section-tokens`` tokens each with paragraphs and a code block, with the
+last sections streamed by ``--branches`` parallel branches. Tokens arrive
+every ``--token-interval-ms`` on a simulated clock, so the run takes no
+real time. Reports the render calls and the bytes sent to the browser for
+one response.
+
+Run from ``src/web``::
+
+    python -m benchmarks.render_response --sections 8 --section-tokens 800
+"""
+import argparse
+import itertools
+import time
+
+from rendering import IncrementalRenderer
+
+WORDS = ["Enable", "encryption", "at", "rest", "with", "customer-managed", "keys", "and", "restrict",
+         "public", "network", "access", "to", "the", "service", "endpoints"]
+
+
+class FakeElement:
+    def __init__(self, stats: dict[str, int]):
+        self._stats = stats
+
+    def markdown(self, text: str):
+        self._stats["render_calls"] += 1
+        self._stats["bytes_rendered"] += len(text.encode("utf-8"))
+
+    def empty(self):
+        return FakeElement(self._stats)
+
+    def container(self):
+        return FakeElement(self._stats)
+
+
+def build_section(tokens: int) -> list[str]:
+    words = itertools.cycle(WORDS)
+    deltas = []
+    for i in range(tokens):
+        if i % 60 == 59:
+            deltas.append(".\n\n")
+        elif i == tokens // 2:
+            deltas.append("\n\n```hcl\nresource \"azurerm_storage_account\" \"main\" {\n")
+        elif i == tokens // 2 + 40:
+            deltas.append("}\n```\n\n")
+        else:
+            deltas.append(f" {next(words)}")
+    return deltas
+
+
+def build_frames(args: argparse.Namespace) -> list[tuple[str, str, str]]:
+    """Returns (content type, branch, text) frames, the branches of a parallel section interleaved."""
+    frames = []
+    for section in range(args.sections):
+        parallel = section >= args.sections - args.branches
+        branch = f"branch-{section}" if parallel and args.branches > 1 else ""
+        frames.append(("markdown", branch, f"## Section {section}\n"))
+        frames.extend(("markdown", branch, delta) for delta in build_section(args.section_tokens))
+        frames.append(("sentinel", branch, ""))
+
+    if args.branches > 1:
+        # The parallel sections stream at the same time
+        sequential = [frame for frame in frames if not frame[1]]
+        parallel = [[frame for frame in frames if frame[1] == f"branch-{section}"]
+                    for section in range(args.sections - args.branches, args.sections)]
+        frames = sequential + [frame for group in itertools.zip_longest(*parallel) for frame in group if frame]
+    return frames
+
+
+def replay_whole(frames: list[tuple[str, str, str]]) -> dict[str, int]:
+    """The previous render_response, painting every branch's whole text on every delta and sentinel."""
+    stats = {"render_calls": 0, "bytes_rendered": 0}
+    element = FakeElement(stats)
+    branches: dict[str, str] = {}
+    for content_type, branch, text in frames:
+        branches[branch] = branches.get(branch, "") + text
+        element.markdown("".join(branches.values()))
+    return stats
+
+
+def replay_incremental(frames: list[tuple[str, str, str]], interval_ms: int, token_interval_ms: float) -> dict[str, int]:
+    stats = {"render_calls": 0, "bytes_rendered": 0}
+    now = 0.0
+    renderer = IncrementalRenderer(FakeElement(stats), interval_ms=interval_ms, clock=lambda: now)
+    for content_type, branch, text in frames:
+        now += token_interval_ms / 1000
+        if content_type == "sentinel":
+            renderer.end_section(branch)
+        else:
+            renderer.append(branch, text)
+    renderer.flush()
+    return stats
+
+
+def main(args: argparse.Namespace):
+    frames = build_frames(args)
+    document_bytes = sum(len(text.encode("utf-8")) for _, _, text in frames)
+    print(f"{len(frames)} frames, {document_bytes / 1024:.0f} KiB of markdown\n")
+
+    print(f"{'renderer':<24}{'render calls':>14}{'KiB sent':>12}{'x document':>12}{'CPU (ms)':>10}")
+    for name, replay in (("whole document", lambda: replay_whole(frames)),
+                         (f"incremental ({args.interval_ms}ms)",
+                          lambda: replay_incremental(frames, args.interval_ms, args.token_interval_ms))):
+        started = time.perf_counter()
+        stats = replay()
+        cpu_ms = (time.perf_counter() - started) * 1000
+        print(f"{name:<24}{stats['render_calls']:>14}{stats['bytes_rendered'] / 1024:>12.0f}"
+              f"{stats['bytes_rendered'] / document_bytes:>12.1f}{cpu_ms:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--section-tokens", type=int, default=800)
+    parser.add_argument("--branches", type=int, default=2)
+    parser.add_argument("--token-interval-ms", type=float, default=20)
+    parser.add_argument("--interval-ms", type=int, default=100)
+    main(parser.parse_args())
@@ -0,0 +1,108 @@
+"""Compares reading the chat stream inline with reading it in the background while the UI renders.
+
+A producer thread stands in for the API, sending ``--lines`` NDJSON lines,
+one every ``--line-interval-ms``, through a channel of ``--channel-size``
+lines, like the API's queue for a run. Painting takes ``--paint-ms`` plus
+``--paint-us-per-kib`` per KiB of markdown, so it slows down as the
+paragraph grows, and the incremental renderer repaints at most every
+``--interval-ms``. Reports how long the producer was blocked on a full
+channel, when it was done sending, the end to end time and the render lag.
+
+Run from ``src/web``::
+
+    python -m benchmarks.stream_reader --lines 2000 --paint-ms 20
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+from typing import Iterator
+
+from rendering import IncrementalRenderer
+from stream_reader import StreamReader
+
+_END = object()
+
+
+class SlowElement:
+    def __init__(self, args: argparse.Namespace):
+        self._args = args
+
+    def markdown(self, text: str):
+        time.sleep((self._args.paint_ms + self._args.paint_us_per_kib * len(text) / 1024 / 1000) / 1000)
+
+    def empty(self):
+        return SlowElement(self._args)
+
+    def container(self):
+        return SlowElement(self._args)
+
+
+class Producer:
+    """Sends the lines through a bounded channel, timing how long it waits for room."""
+
+    def __init__(self, args: argparse.Namespace):
+        self._args = args
+        self._channel: queue.Queue = queue.Queue(maxsize=args.channel_size)
+        self.blocked = 0.0
+        self.done_at = 0.0
+        threading.Thread(target=self._send, daemon=True).start()
+
+    def _send(self):
+        for i in range(self._args.lines):
+            line = json.dumps({"content_type": "markdown", "branch": "", "text": f" token{i}"
+                               + ("\n\n" if i % 60 == 59 else "")})
+            started = time.perf_counter()
+            self._channel.put(line)
+            self.blocked += time.perf_counter() - started
+            time.sleep(self._args.line_interval_ms / 1000)
+        self._channel.put(_END)
+        self.done_at = time.perf_counter()
+
+    def __iter__(self) -> Iterator[str]:
+        while (line := self._channel.get()) is not _END:
+            yield line
+
+
+def consume(lines, renderer: IncrementalRenderer):
+    for line in lines:
+        data = json.loads(line)
+        renderer.append(data["branch"], data["text"])
+    renderer.flush()
+
+
+def main(args: argparse.Namespace):
+    print(f"{args.lines} lines every {args.line_interval_ms}ms, painting takes {args.paint_ms}ms "
+          f"+ {args.paint_us_per_kib}us/KiB\n")
+    print(f"{'reading':<12}{'producer blocked (s)':>22}{'sent after (s)':>16}{'total (s)':>11}"
+          f"{'render lag p95 (ms)':>21}{'max buffered':>14}")
+
+    for name in ("inline", "background"):
+        producer = Producer(args)
+        renderer = IncrementalRenderer(container=SlowElement(args), interval_ms=args.interval_ms)
+        started = time.perf_counter()
+        if name == "inline":
+            consume(producer, renderer)
+            lag, buffered = "", ""
+        else:
+            with StreamReader(iter(producer), max_buffered=args.buffer_lines,
+                              idle_seconds=args.interval_ms / 1000, on_idle=renderer.flush) as reader:
+                consume(reader, renderer)
+            summary = reader.metrics.summary()
+            lag, buffered = f"{summary['render_lag_p95_ms']:.0f}", f"{summary['max_buffered']}"
+        elapsed = time.perf_counter() - started
+        print(f"{name:<12}{producer.blocked:>22.2f}{producer.done_at - started:>16.2f}{elapsed:>11.2f}"
+              f"{lag:>21}{buffered:>14}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=1000)
+    parser.add_argument("--line-interval-ms", type=float, default=1)
+    parser.add_argument("--channel-size", type=int, default=16)
+    parser.add_argument("--paint-ms", type=float, default=20)
+    parser.add_argument("--paint-us-per-kib", type=float, default=2000)
+    parser.add_argument("--interval-ms", type=int, default=100)
+    parser.add_argument("--buffer-lines", type=int, default=10000)
+    main(parser.parse_args())
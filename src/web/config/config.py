@@ -5,6 +5,9 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     services__api__api__0: str
+    api_pool_size: int = 10  # Connections to the API kept open per client
+    render_interval_ms: int = 100  # Shortest time between repaints of a streaming response
+    stream_buffer_lines: int = 10000  # Lines of a streaming response read ahead of rendering
 
     model_config = SettingsConfigDict(env_file=".env",
                                       env_file_encoding="utf-8")
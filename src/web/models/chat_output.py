@@ -6,6 +6,7 @@ from models.content_type_enum import ContentTypeEnum
 class ChatOutput(KernelBaseModel):
     content_type: ContentTypeEnum
     thread_id: str
+    branch: str = ""  # Process branch the frame belongs to, empty outside of parallel steps
 
 def deserialize_chat_output(data: dict[str, Any]) -> ChatOutput:
     """
@@ -15,6 +16,7 @@ def deserialize_chat_output(data: dict[str, Any]) -> ChatOutput:
         raise TypeError("Input must be a dictionary.")
     content_type = data.get("content_type")
     thread_id = data.get("thread_id")
-    return ChatOutput(content_type=content_type, thread_id=thread_id) # type: ignore
+    branch = data.get("branch", "")
+    return ChatOutput(content_type=content_type, thread_id=thread_id, branch=branch) # type: ignore
 
 __all__ = ["ChatOutput"]
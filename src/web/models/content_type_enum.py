@@ -11,6 +11,9 @@ class ContentTypeEnum(StrEnum):
     ANNOTATION_FILE = auto()
     FILE = auto()
     SENTINEL = auto()  # Used to indicate the end of a stream
+    QUEUE_POSITION = auto()  # Used to indicate the run is waiting to be scheduled
+    BATCH_SUMMARY = auto()  # Used to summarize the services of a batch onboarding
+    DETACHED = auto()  # Used to indicate the stream fell behind its run and was detached from it
 
 
 __all__ = ["ContentTypeEnum"]
@@ -0,0 +1,24 @@
+from typing import Any
+
+from models.chat_output import ChatOutput
+from models.content_type_enum import ContentTypeEnum
+
+class StreamingQueuePositionOutput(ChatOutput):
+    position: int
+    content_type: ContentTypeEnum = ContentTypeEnum.QUEUE_POSITION
+
+def deserialize_streaming_queue_position_output(data: dict[str, Any]) -> StreamingQueuePositionOutput:
+    """
+    Deserialize a dictionary into a StreamingQueuePositionOutput instance.
+    """
+    if not isinstance(data, dict):
+        raise TypeError("Input must be a dictionary.")
+    position = data.get("position")
+    thread_id = data.get("thread_id")
+    if position is None:
+        raise ValueError("'position' is required for deserialization.")
+    if thread_id is None:
+        raise ValueError("'thread_id' is required for deserialization.")
+    return StreamingQueuePositionOutput(position=position, thread_id=thread_id)
+
+__all__ = ["StreamingQueuePositionOutput", "deserialize_streaming_queue_position_output"]
@@ -0,0 +1,109 @@
+import time
+from typing import Any, Callable
+
+FENCE = "```"
+
+
+class _Branch:
+    def __init__(self, container: Any):
+        self.container = container
+        self.tail = ""  # Text of the paragraph still being streamed
+        self.placeholder: Any = None  # Element the tail is painted into
+        self.dirty = False
+
+
+class IncrementalRenderer:
+    """Renders streamed markdown into a Streamlit container without repainting what's done.
+
+    Every branch of the stream gets a container of its own, in the order the
+    branches first post text. Sections, ended by a sentinel, and paragraphs
+    outside code blocks are written once into an element of their own when
+    they're finished, and only the text after them is repainted, at most
+    every ``interval_ms``. ``render_calls`` and ``bytes_rendered`` count what
+    was sent to the browser.
+    """
+
+    def __init__(self, container: Any, interval_ms: int, clock: Callable[[], float] = time.monotonic):
+        self._container = container
+        self._interval = interval_ms / 1000
+        self._clock = clock
+        self._branches: dict[str, _Branch] = {}
+        self._status: Any = None
+        self._painted_at = float("-inf")
+        self.render_calls = 0
+        self.bytes_rendered = 0
+
+    def show_status(self, text: str):
+        """Shows a transient message, such as the queue position, until text is streamed."""
+        if self._status is None:
+            self._status = self._container.empty()
+        self._render(self._status, text)
+
+    def append(self, branch: str, text: str):
+        if self._status is not None:
+            self._status.empty()
+            self._status = None
+
+        state = self._branches.get(branch)
+        if state is None:
+            state = self._branches[branch] = _Branch(self._container.container())
+
+        state.tail += text
+        state.dirty = True
+
+        if self._clock() - self._painted_at >= self._interval:
+            self.flush()
+
+    def end_section(self, branch: str):
+        state = self._branches.get(branch)
+        if state is not None and state.tail:
+            self._freeze(state, len(state.tail))
+
+    def flush(self):
+        """Paints the text of every branch that changed since it was last painted."""
+        for state in self._branches.values():
+            if not state.dirty:
+                continue
+
+            paragraph_end = find_paragraph_end(state.tail)
+            if paragraph_end:
+                self._freeze(state, paragraph_end)
+            if state.tail:
+                if state.placeholder is None:
+                    state.placeholder = state.container.empty()
+                self._render(state.placeholder, state.tail)
+            state.dirty = False
+
+        self._painted_at = self._clock()
+
+    def _freeze(self, state: _Branch, end: int):
+        """Writes ``state.tail[:end]`` for the last time, later text goes into a new element."""
+        if state.placeholder is None:
+            state.placeholder = state.container.empty()
+        self._render(state.placeholder, state.tail[:end])
+
+        state.tail = state.tail[end:]
+        state.placeholder = None
+        state.dirty = bool(state.tail)
+
+    def _render(self, placeholder: Any, text: str):
+        placeholder.markdown(text)
+        self.render_calls += 1
+        self.bytes_rendered += len(text.encode("utf-8"))
+
+
+def find_paragraph_end(text: str) -> int:
+    """Returns the index after the last blank line of ``text`` outside a code block, or 0 if none."""
+    in_fence = False
+    position = 0
+    end = 0
+    for line in text.splitlines(keepends=True):
+        if line.lstrip().startswith(FENCE):
+            in_fence = not in_fence
+        elif not in_fence and line.endswith("\n") and not line.strip():
+            end = position + len(line)
+        position += len(line)
+    return end
+
+
+__all__ = ["IncrementalRenderer", "find_paragraph_end"]
@@ -1,18 +1,26 @@
+import json
 import os
 
-import requests
+import httpx
 
 from models.chat_get_image import ChatGetImageInput
 from models.chat_get_image_contents import ChatGetImageContents
 from models.chat_get_thread import ChatGetThreadInput
 from models.chat_input import ChatInput
 from config import get_settings
+from services.http import get_async_client, get_session
 
 api_base_url = get_settings().services__api__api__0
 
 
+class ChatBusyError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"API is busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
 def create_thread():
-    result = requests.post(url=f"{api_base_url}/v1/create_thread",
+    result = get_session().post(url=f"{api_base_url}/v1/create_thread",
                            timeout=30)
     if result.ok:
         return result.json()['thread_id']
@@ -26,32 +34,74 @@ def chat(thread_id,
     chat_input = ChatInput(thread_id=thread_id,
                            content=content)
 
-    response = requests.post(url=f"{api_base_url}/v1/chat",
-                             json=chat_input.model_dump(mode="json"),
-                             stream=True,
-                             timeout=1000
-                             )
-    for line in response.iter_lines(decode_unicode=True):
-        if line:  # skip empty lines
-            yield line
+    # Closing the response, also when the generator is, returns the connection to the pool
+    with get_session().post(url=f"{api_base_url}/v1/chat",
+                            json=chat_input.model_dump(mode="json"),
+                            stream=True,
+                            timeout=1000
+                            ) as response:
+        if response.status_code == 429:
+            raise ChatBusyError(retry_after=response.headers.get("Retry-After"))
+
+        for line in response.iter_lines(decode_unicode=True):
+            if line:  # skip empty lines
+                yield line
+
+
+async def chat_async(thread_id,
+                     content):
+    """Streams the lines of a chat response, like ``chat``, on the pooled client of the running event loop."""
+    chat_input = ChatInput(thread_id=thread_id,
+                           content=content)
 
+    async with get_async_client().stream("POST",
+                                         "/v1/chat",
+                                         json=chat_input.model_dump(mode="json"),
+                                         timeout=httpx.Timeout(30, read=1000)) as response:
+        if response.status_code == 429:
+            raise ChatBusyError(retry_after=response.headers.get("Retry-After"))
 
-def get_thread(thread_id):
-    get_thread_input = ChatGetThreadInput(thread_id=thread_id)
+        async for line in response.aiter_lines():
+            if line:  # skip empty lines
+                yield line
 
-    response = requests.get(url=f"{api_base_url}/v1/get_thread",
-                            data=get_thread_input.model_dump(mode="python"),
-                            timeout=60)
+
+def get_thread(thread_id, limit=None, after=None, before=None, order="desc"):
+    get_thread_input = ChatGetThreadInput(thread_id=thread_id,
+                                          limit=limit,
+                                          after=after,
+                                          before=before,
+                                          order=order)
+
+    response = get_session().get(url=f"{api_base_url}/v1/get_thread",
+                                 params=get_thread_input.model_dump(mode="json", exclude_none=True),
+                                 timeout=60)
 
     return response.json()
 
 
+def stream_thread(thread_id, after=None, before=None, order="desc"):
+    get_thread_input = ChatGetThreadInput(thread_id=thread_id,
+                                          after=after,
+                                          before=before,
+                                          order=order,
+                                          stream=True)
+
+    with get_session().get(url=f"{api_base_url}/v1/get_thread",
+                           params=get_thread_input.model_dump(mode="json", exclude_none=True),
+                           stream=True,
+                           timeout=60) as response:
+        for line in response.iter_lines(decode_unicode=True):
+            if line:  # skip empty lines
+                yield json.loads(line)
+
+
 def get_image(file_id):
     get_image_input = ChatGetImageInput(file_id=file_id)
 
-    image = requests.get(
+    image = get_session().get(
         url=f"{api_base_url}/v1/get_image",
-        json=get_image_input.model_dump(mode="json"),
+        params=get_image_input.model_dump(mode="json"),
         timeout=60
     )
 
@@ -61,7 +111,7 @@ def get_image(file_id):
 def get_image_contents(thread_id):
     get_image_input = ChatGetImageContents(thread_id=thread_id)
 
-    image_contents = requests.get(
+    image_contents = get_session().get(
         url=f"{api_base_url}/v1/get_image_contents",
         json=get_image_input.model_dump(mode="json"),
         timeout=60
@@ -70,4 +120,4 @@ def get_image_contents(thread_id):
     return image_contents.json()
 
 
-__all__ = ["chat", "get_image", "get_thread", "get_image_contents", "create_thread",]
+__all__ = ["ChatBusyError", "chat", "chat_async", "get_image", "get_thread", "stream_thread", "get_image_contents", "create_thread",]
@@ -0,0 +1,49 @@
+import asyncio
+import weakref
+from functools import lru_cache
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import get_settings
+
+# The API compresses responses for clients that accept it, streams included
+ACCEPT_ENCODING = "gzip, deflate"
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = \
+    weakref.WeakKeyDictionary()
+
+
+@lru_cache
+def get_session() -> requests.Session:
+    """Returns the session shared by every Streamlit session of the process.
+
+    Connections to the API are kept alive and reused, up to
+    ``api_pool_size`` of them at a time. Requests beyond that open a
+    connection that is closed afterwards rather than waiting for one.
+    """
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=get_settings().api_pool_size)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the pooled client of the running event loop, as a client can't be shared between loops."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(
+            base_url=get_settings().services__api__api__0,
+            headers={"Accept-Encoding": ACCEPT_ENCODING},
+            limits=httpx.Limits(max_connections=get_settings().api_pool_size,
+                                max_keepalive_connections=get_settings().api_pool_size),
+        )
+    return client
+
+
+__all__ = ["get_async_client", "get_session"]
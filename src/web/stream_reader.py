@@ -0,0 +1,122 @@
+import queue
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+
+_END = object()
+
+# How often a reader blocked on a full buffer checks whether it was closed
+_PUT_POLL_SECONDS = 0.5
+
+
+@dataclass
+class StreamMetrics:
+    lines: int = 0
+    max_buffered: int = 0  # Most lines waiting for the UI at once
+    reader_lag_ms: list[float] = field(default_factory=list)  # Per line, time the reader waited for room in the buffer
+    render_lag_ms: list[float] = field(default_factory=list)  # Per line, time it waited in the buffer for the UI
+
+    def summary(self) -> dict[str, float]:
+        def percentile(values: list[float], fraction: float) -> float:
+            return sorted(values)[int((len(values) - 1) * fraction)] if values else 0
+
+        return {
+            "lines": self.lines,
+            "max_buffered": self.max_buffered,
+            "reader_lag_p95_ms": round(percentile(self.reader_lag_ms, 0.95), 1),
+            "reader_lag_max_ms": round(max(self.reader_lag_ms, default=0), 1),
+            "render_lag_p50_ms": round(statistics.median(self.render_lag_ms) if self.render_lag_ms else 0, 1),
+            "render_lag_p95_ms": round(percentile(self.render_lag_ms, 0.95), 1),
+            "render_lag_max_ms": round(max(self.render_lag_ms, default=0), 1),
+        }
+
+
+class StreamReader:
+    """Reads a stream of lines in a background thread, so the UI rendering them doesn't hold up the socket.
+
+    Lines wait in a buffer of at most ``max_buffered`` lines until they're
+    iterated over. Only once it's full does the reader stop reading, pushing
+    back on the API. While no line arrives, ``on_idle`` is called every
+    ``idle_seconds``, so the UI can paint what it holds. An error reading
+    the stream is raised where it was reached in the iteration.
+    """
+
+    def __init__(self,
+                 lines: Iterator[str],
+                 max_buffered: int,
+                 idle_seconds: float,
+                 on_idle: Callable[[], None] | None = None):
+        self._lines = lines
+        self._queue: queue.Queue = queue.Queue(maxsize=max_buffered)
+        self._idle_seconds = idle_seconds
+        self._on_idle = on_idle
+        self._closed = threading.Event()
+        self._error: BaseException | None = None
+        self.metrics = StreamMetrics()
+
+        self._thread = threading.Thread(target=self._read, name="stream-reader", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> "StreamReader":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            try:
+                item = self._queue.get(timeout=self._idle_seconds)
+            except queue.Empty:
+                if self._on_idle is not None:
+                    self._on_idle()
+                continue
+
+            if item is _END:
+                if self._error is not None:
+                    raise self._error
+                return
+
+            read_at, line = item
+            self.metrics.render_lag_ms.append((time.monotonic() - read_at) * 1000)
+            yield line
+
+    def close(self):
+        """Stops reading, closing the stream if the reader hasn't reached its end."""
+        self._closed.set()
+
+    def _read(self):
+        try:
+            for line in self._lines:
+                if not self._put((time.monotonic(), line)):
+                    break
+        except BaseException as e:
+            self._error = e
+        finally:
+            if self._closed.is_set():
+                # Closes the response, returning its connection to the pool
+                close = getattr(self._lines, "close", None)
+                if close is not None:
+                    close()
+            self._put(_END)
+
+    def _put(self, item) -> bool:
+        """Adds ``item`` to the buffer, waiting for room, and returns whether the reader wasn't closed meanwhile."""
+        started = time.monotonic()
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=_PUT_POLL_SECONDS)
+            except queue.Full:
+                continue
+
+            if item is not _END:
+                self.metrics.lines += 1
+                self.metrics.reader_lag_ms.append((time.monotonic() - started) * 1000)
+                self.metrics.max_buffered = max(self.metrics.max_buffered, self._queue.qsize())
+            return True
+        return False
+
+
+__all__ = ["StreamMetrics", "StreamReader"]